@@ -5,3 +5,4 @@ Utilities for running async aiohttp based routes in the context of a Django proj
 __version__ = '0.2.0a'
 
 from .api import get_aio_application  # noqa
+from .db import run_in_db  # noqa
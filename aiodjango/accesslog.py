@@ -0,0 +1,209 @@
+"""
+Access logging which never blocks the event loop.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+
+from aiohttp import web
+
+from .executor import EXECUTOR_WAIT_KEY
+from .routing import DjangoRegexRoute
+
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('text', 'json')
+
+# Default number of records waiting to be written before new ones are dropped
+MAX_QUEUE = 10000
+
+# Maximum number of records written at once
+BATCH_SIZE = 100
+
+# Seconds the writer waits for a batch to fill before writing it anyway
+FLUSH_INTERVAL = 0.5
+
+
+def get_route_type(request):
+    """Whether the request was handled by a coroutine view, Django or the static files."""
+
+    route = getattr(request.match_info, 'route', None)
+    if isinstance(route, DjangoRegexRoute):
+        return 'async'
+    if isinstance(route, web.StaticRoute):
+        return 'static'
+    if getattr(route, 'name', None) == 'wsgi-app':
+        return 'wsgi'
+    return '-'
+
+
+def get_length(response):
+    """Length of the response body if it is known."""
+
+    if response is None:
+        return None
+    if response.content_length is not None:
+        return response.content_length
+    resp_impl = getattr(response, '_resp_impl', None)
+    return getattr(resp_impl, 'body_length', None)
+
+
+class AccessRecord:
+    """Values captured on the event loop for a record which is formatted later."""
+
+    __slots__ = (
+        'time', 'remote', 'method', 'path', 'version', 'status', 'length',
+        'duration', 'route', 'executor_wait', 'referer', 'user_agent',
+    )
+
+    def __init__(self, request, status, length, duration):
+        self.time = time.time()
+        peername = request.transport.get_extra_info('peername')
+        self.remote = peername[0] if isinstance(peername, (list, tuple)) else peername
+        self.method = request.method
+        self.path = request.path_qs
+        self.version = request.version
+        self.status = status
+        self.length = length
+        self.duration = duration
+        self.route = get_route_type(request)
+        self.executor_wait = request.get(EXECUTOR_WAIT_KEY)
+        self.referer = request.headers.get('Referer')
+        self.user_agent = request.headers.get('User-Agent')
+
+    def as_text(self):
+        timestamp = datetime.datetime.utcfromtimestamp(self.time)
+        return '[{}] "{} {} HTTP/{}.{}" {} {} {}'.format(
+            timestamp.strftime('%d/%b/%Y:%H:%M:%S +0000'), self.method, self.path,
+            self.version[0], self.version[1], self.status,
+            '-' if self.length is None else self.length, round(self.duration * 1000000))
+
+    def as_json(self):
+        return json.dumps({
+            'time': datetime.datetime.utcfromtimestamp(self.time).isoformat() + 'Z',
+            'remote': self.remote,
+            'method': self.method,
+            'path': self.path,
+            'version': '{}.{}'.format(*self.version),
+            'status': self.status,
+            'length': self.length,
+            'duration_ms': round(self.duration * 1000, 3),
+            'route': self.route,
+            'executor_wait_ms': (
+                None if self.executor_wait is None else round(self.executor_wait * 1000, 3)),
+            'referer': self.referer,
+            'user_agent': self.user_agent,
+        }, sort_keys=True)
+
+
+class AccessLog:
+    """Access log which hands records to a background thread for writing.
+
+    The middleware only captures a few values for each request and puts them
+    on a bounded queue. Records are formatted and written in batches by the
+    writer thread so a slow stream never blocks the loop. When the queue is
+    full new records are dropped and counted instead.
+    """
+
+    def __init__(self, stream=None, *, log_format='text', max_queue=MAX_QUEUE,
+                 batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        if log_format not in FORMATS:
+            raise ValueError('Unknown access log format "{}". Choices are: {}.'.format(
+                log_format, ', '.join(FORMATS)))
+        self.stream = stream or sys.stdout
+        self.log_format = log_format
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self._reported = 0
+        self._queue = queue.Queue(max_queue)
+        self._thread = threading.Thread(target=self._write, name='aiodjango-access-log')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+        }
+
+    @asyncio.coroutine
+    def middleware(self, app, handler):
+
+        @asyncio.coroutine
+        def log_access(request):
+            started = time.monotonic()
+            try:
+                response = yield from handler(request)
+            except web.HTTPException as e:
+                self.log(request, e.status, get_length(e), time.monotonic() - started)
+                raise
+            except Exception:
+                self.log(request, 500, None, time.monotonic() - started)
+                raise
+            self.log(request, response.status, get_length(response), time.monotonic() - started)
+            return response
+
+        return log_access
+
+    def log(self, request, status, length, duration):
+        try:
+            self._queue.put_nowait(AccessRecord(request, status, length, duration))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=5.0):
+        """Write the remaining records and stop the writer thread."""
+
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def _write(self):
+        finished = False
+        while not finished:
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if None in batch:
+                finished = True
+                batch = batch[:batch.index(None)]
+            if batch:
+                self._write_batch(batch)
+            if self.dropped > self._reported:
+                logger.warning('Dropped %d access log records', self.dropped - self._reported)
+                self._reported = self.dropped
+
+    def _write_batch(self, batch):
+        if self.log_format == 'json':
+            lines = [record.as_json() for record in batch]
+        else:
+            lines = [record.as_text() for record in batch]
+        try:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+        except Exception:
+            logger.exception('Error writing access log')
+        self.written += len(lines)
+
+
+def install_access_log(app, stream=None, **kwargs):
+    """Log the requests to the application and stop the writer when it finishes."""
+
+    access_log = AccessLog(stream, **kwargs)
+    # First so that it sees the responses of the other middleware
+    app.middlewares.insert(0, access_log.middleware)
+    app.register_on_finish(lambda app: access_log.close())
+    return access_log
@@ -1,20 +1,152 @@
+import weakref
+
+import django
+
 from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 from aiohttp import web
-from aiohttp_wsgi import WSGIHandler
 
-from .routing import get_aio_routes
+from .auth import SESSION_CACHE_TTL, SessionResolver
+from .broadcast import BroadcastHub
+from .cache import MAX_BODY_SIZE, MicroCache
+from .db import DatabaseExecutor
+from .executor import BoundedExecutor, shed_load
+from .handlers import DjangoHandler, StreamingWSGIHandler
+from .metrics import Metrics, metrics_view
+from .profiling import RequestProfiler
+from .resources import Resources, get_resources
+from .routing import DjangoUrlDispatcher, get_aio_routes, load_route_manifest
+from .static import IndexedStaticRoute
+from .watchdog import StallDetector
+from .websockets import MAX_QUEUE, OVERFLOW_CLOSE, ConnectionManager
+
 
+def get_aio_application(wsgi=None, include_static=False, route_cache_size=None,
+                        route_manifest=None, workers=None, max_queue=None, queue_timeout=None,
+                        native_handler=False, db_workers=None, micro_cache_ttl=None,
+                        session_cache_ttl=SESSION_CACHE_TTL, broadcast_backend=None,
+                        websocket_queue_size=MAX_QUEUE, websocket_overflow=OVERFLOW_CLOSE,
+                        resources=None, metrics=True, metrics_path=None, stall_threshold=None,
+                        profile_dir=None, profile_rate=0.0):
+    """Builds a aiohttp application wrapping around a Django WSGI server.
 
-def get_aio_application(wsgi=None, include_static=False):
-    """Builds a aiohttp application wrapping around a Django WSGI server."""
+    route_cache_size enables a LRU cache of that size for resolved routes.
+    route_manifest is the path to a manifest written by the aioroutes command
+    which is used instead of walking the URL patterns unless it is out of date.
+    workers, max_queue and queue_timeout configure the thread pool which runs
+    the Django views. Requests beyond the queue limits get a 503 response.
+    native_handler runs the Django views without going through WSGI in which
+    case the wsgi application is not used.
+    db_workers is the number of threads used by run_in_db for ORM calls from
+    coroutine views which should match the size of the database pool.
+    micro_cache_ttl enables sharing of cacheable GET and HEAD responses for up
+    to that many seconds and collapses concurrent requests for the same URL.
+    session_cache_ttl is how long sessions resolved for coroutine views are reused.
+    broadcast_backend is the backend of the broadcast hub and defaults to the
+    one configured by the AIODJANGO_BROADCAST setting.
+    websocket_queue_size is the number of outbound messages queued for each
+    websocket client and websocket_overflow is either "close" to evict clients
+    whose queue is full or "drop" to drop their oldest messages.
+    resources maps names to the connection pools available to coroutine views
+    as app['resources'] and defaults to those configured by the
+    AIODJANGO_RESOURCES setting. The pools start filling straight away.
+    metrics records latency histograms and gauges as app['metrics'] which are
+    served in the Prometheus text format at metrics_path when it is given.
+    stall_threshold enables logging and counting of the times the event loop
+    is blocked for longer than that many seconds by the view responsible.
+    profile_dir enables profiling of requests with a signed profiling header
+    and of the fraction profile_rate of all requests into pstats files there.
+    """
 
-    handler = WSGIHandler(wsgi or get_wsgi_application())
-    app = web.Application()
-    for route in get_aio_routes():
+    executor = BoundedExecutor(workers, max_queue=max_queue, queue_timeout=queue_timeout)
+    if native_handler:
+        django.setup()
+        handler = DjangoHandler(executor=executor)
+    else:
+        buffer_size = MAX_BODY_SIZE if micro_cache_ttl else 0
+        handler = StreamingWSGIHandler(
+            wsgi or get_wsgi_application(), executor=executor, buffer_size=buffer_size)
+    app = web.Application(router=DjangoUrlDispatcher(cache_size=route_cache_size))
+    app['django_executor'] = executor
+    app['db_executor'] = DatabaseExecutor(db_workers)
+    app['session_resolver'] = SessionResolver(app, ttl=session_cache_ttl)
+    app['websockets'] = weakref.WeakSet()
+    app['connections'] = ConnectionManager(
+        max_queue=websocket_queue_size, overflow=websocket_overflow, loop=app.loop)
+    app['broadcast'] = BroadcastHub(broadcast_backend, loop=app.loop)
+    if resources is None:
+        app['resources'] = get_resources(loop=app.loop)
+    else:
+        app['resources'] = Resources(resources)
+    app['resources'].start()
+    app.register_on_finish(shutdown_executors)
+    app.register_on_finish(close_session_resolver)
+    app.register_on_finish(close_broadcast)
+    app.register_on_finish(close_resources)
+    if metrics:
+        app['metrics'] = Metrics()
+        app.middlewares.append(app['metrics'].middleware)
+    if profile_dir is not None:
+        app['profiler'] = RequestProfiler(profile_dir, sample_rate=profile_rate)
+        # Innermost so that only the handler is profiled
+        app.middlewares.append(app['profiler'].middleware)
+        app.register_on_finish(close_profiler)
+    routes = None
+    if route_manifest is not None:
+        routes = load_route_manifest(route_manifest)
+    if routes is None:
+        routes = get_aio_routes()
+    for route in routes:
         app.router.register_route(route)
+    if stall_threshold:
+        app['stall_detector'] = StallDetector(app.loop, threshold=stall_threshold, routes=routes)
+        app['stall_detector'].start()
+        app.register_on_finish(stop_stall_detector)
     if include_static:
-        app.router.add_static(settings.STATIC_URL, settings.STATIC_ROOT, name='static')
-    app.router.add_route("*", "/{path_info:.*}", handler.handle_request, name='wsgi-app')
+        app.router.register_route(
+            IndexedStaticRoute('static', settings.STATIC_URL, settings.STATIC_ROOT))
+    if metrics and metrics_path is not None:
+        app.router.add_route('GET', metrics_path, metrics_view, name='aiodjango-metrics')
+    handle_request = shed_load(handler.handle_request)
+    if micro_cache_ttl:
+        handle_request = app['micro_cache'] = MicroCache(handle_request, ttl=micro_cache_ttl)
+    app.router.add_route("*", "/{path_info:.*}", handle_request, name='wsgi-app')
     return app
+
+
+def shutdown_executors(app):
+    """Stop the Django and database thread pools when the application is finished."""
+
+    app['django_executor'].shutdown(wait=False)
+    app['db_executor'].shutdown(wait=False)
+
+
+def close_session_resolver(app):
+    """Disconnect the session resolver from the logout signal."""
+
+    app['session_resolver'].close()
+
+
+def close_broadcast(app):
+    """Close the upstream connection of the broadcast hub."""
+
+    return app['broadcast'].close()
+
+
+def close_resources(app):
+    """Close the connections of the resource pools."""
+
+    return app['resources'].close()
+
+
+def stop_stall_detector(app):
+    """Stop the heartbeat and monitor thread of the stall detector."""
+
+    app['stall_detector'].stop()
+
+
+def close_profiler(app):
+    """Wait for the profiles being written."""
+
+    app['profiler'].close()
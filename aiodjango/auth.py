@@ -0,0 +1,161 @@
+"""
+Resolving Django sessions and users for coroutine views.
+"""
+import asyncio
+
+from collections import OrderedDict
+from importlib import import_module
+from types import MappingProxyType, SimpleNamespace
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.signals import user_logged_out
+
+from .db import run_in_db
+
+
+# Default number of seconds a resolved session is reused
+SESSION_CACHE_TTL = 5.0
+
+# Key used to store the resolved session on the aiohttp request
+REQUEST_KEY = 'aiodjango_auth'
+
+
+class AuthState:
+    """Snapshot of the session data and user for a session key."""
+
+    __slots__ = ('session', 'user', 'expires')
+
+    def __init__(self, session, user, expires=0):
+        self.session = session
+        self.user = user
+        self.expires = expires
+
+
+def load_auth(session_key):
+    """Load the session and user in the same way as the session and auth middleware."""
+
+    engine = import_module(settings.SESSION_ENGINE)
+    session = engine.SessionStore(session_key)
+    # auth.get_user only looks at the session of the request
+    user = auth.get_user(SimpleNamespace(session=session))
+    return MappingProxyType(dict(session.items())), user
+
+
+def get_anonymous():
+    from django.contrib.auth.models import AnonymousUser
+    return AuthState(MappingProxyType({}), AnonymousUser())
+
+
+class SessionResolver:
+    """Cache of resolved sessions shared by the coroutine views of an application.
+
+    Sessions are loaded in the database threads the first time they are needed
+    and reused for up to ttl seconds. Concurrent requests with the same session
+    wait for a single lookup. Sessions are dropped from the cache when the
+    user logs out in this process until the resolver is closed.
+    """
+
+    def __init__(self, app, *, ttl=SESSION_CACHE_TTL, max_entries=10000):
+        self.app = app
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+        user_logged_out.connect(self._logged_out)
+
+    def stats(self):
+        return {
+            'entries': len(self._cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'collapsed': self.collapsed,
+        }
+
+    @asyncio.coroutine
+    def resolve(self, session_key):
+        """Session data and user for the session key."""
+
+        if not session_key:
+            return get_anonymous()
+        loop = self.app.loop
+        state = self._cache.get(session_key)
+        if state is not None:
+            if state.expires > loop.time():
+                self._cache.move_to_end(session_key)
+                self.hits += 1
+                return state
+            del self._cache[session_key]
+        pending = self._pending.get(session_key)
+        while pending is not None:
+            self.collapsed += 1
+            state = yield from asyncio.shield(pending, loop=loop)
+            if state is not None:
+                return state
+            # The lookup failed so wait for whichever waiter tries again first
+            pending = self._pending.get(session_key)
+        self.misses += 1
+        pending = self._pending[session_key] = asyncio.Future(loop=loop)
+        state = None
+        try:
+            session, user = yield from run_in_db(self.app, load_auth, session_key)
+            state = AuthState(session, user, loop.time() + self.ttl)
+            if self.ttl:
+                self._cache[session_key] = state
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+            return state
+        finally:
+            if self._pending.get(session_key) is pending:
+                del self._pending[session_key]
+            pending.set_result(state)
+
+    def close(self):
+        """Stop listening for logouts."""
+
+        user_logged_out.disconnect(self._logged_out)
+
+    def invalidate(self, session_key):
+        """Drop the cached session so that it is loaded again on the next request."""
+
+        self._cache.pop(session_key, None)
+
+    def _logged_out(self, sender, request, **kwargs):
+        if self.app.loop.is_closed():
+            # Nothing is left to serve from the cache
+            return
+        session = getattr(request, 'session', None)
+        if session is not None and session.session_key:
+            # Logout runs in a Django thread rather than the event loop
+            self.app.loop.call_soon_threadsafe(self.invalidate, session.session_key)
+
+
+@asyncio.coroutine
+def get_auth_state(request):
+    """Resolve the session for the request the first time it is needed."""
+
+    state = request.get(REQUEST_KEY)
+    if state is None:
+        session_key = request.cookies.get(settings.SESSION_COOKIE_NAME)
+        state = yield from request.app['session_resolver'].resolve(session_key)
+        request[REQUEST_KEY] = state
+    return state
+
+
+@asyncio.coroutine
+def get_session(request):
+    """Read-only session data for a coroutine view's request."""
+
+    state = yield from get_auth_state(request)
+    return state.session
+
+
+@asyncio.coroutine
+def get_user(request):
+    """User for a coroutine view's request or AnonymousUser if not logged in."""
+
+    state = yield from get_auth_state(request)
+    return state.user
@@ -0,0 +1,413 @@
+"""
+Process wide pub/sub hub which fans messages out to local subscribers.
+"""
+import asyncio
+import logging
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = 'aiodjango.broadcast.MemoryBackend'
+
+# Seconds between attempts to reconnect a lost upstream connection, doubling up to the max
+RECONNECT_DELAY = 0.5
+MAX_RECONNECT_DELAY = 30.0
+
+
+class Backend:
+    """Upstream connection shared by all of the subscribers in the process.
+
+    Subclasses only see the first subscribe and last unsubscribe for each
+    topic and call deliver once for each upstream message. They call lost
+    when the upstream connection drops so that the hub can reconnect.
+    """
+
+    def __init__(self, *, loop=None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.deliver = None
+        self.connection_lost = None
+
+    def lost(self, exc=None):
+        """Report that the upstream connection dropped."""
+
+        if self.connection_lost is not None:
+            self.connection_lost(exc)
+
+    @asyncio.coroutine
+    def connect(self):
+        """Open the upstream connection."""
+
+    @asyncio.coroutine
+    def subscribe(self, topic):
+        raise NotImplementedError()
+
+    @asyncio.coroutine
+    def unsubscribe(self, topic):
+        raise NotImplementedError()
+
+    @asyncio.coroutine
+    def publish(self, topic, message):
+        raise NotImplementedError()
+
+    @asyncio.coroutine
+    def close(self):
+        """Close the upstream connection."""
+
+
+class MemoryBroker:
+    """Stands in for an external broker between memory backends."""
+
+    def __init__(self):
+        self.subscriptions = defaultdict(set)
+
+    def publish(self, topic, message):
+        for backend in list(self.subscriptions[topic]):
+            backend.loop.call_soon(backend.deliver, topic, message)
+
+
+class MemoryBackend(Backend):
+    """Backend which only delivers within the process, mostly for tests.
+
+    Backends given the same broker see each other's messages as if they were
+    separate processes connected to the same external broker.
+    """
+
+    def __init__(self, broker=None, **kwargs):
+        super().__init__(**kwargs)
+        self.broker = broker or MemoryBroker()
+
+    @asyncio.coroutine
+    def subscribe(self, topic):
+        self.broker.subscriptions[topic].add(self)
+
+    @asyncio.coroutine
+    def unsubscribe(self, topic):
+        self.broker.subscriptions[topic].discard(self)
+
+    @asyncio.coroutine
+    def publish(self, topic, message):
+        self.broker.publish(topic, message)
+
+    @asyncio.coroutine
+    def close(self):
+        for backends in self.broker.subscriptions.values():
+            backends.discard(self)
+
+
+class AMQPBackend(Backend):
+    """Fanout exchange per topic bound to a single exclusive queue per process.
+
+    Messages are consumed without acknowledgements since they are only
+    relevant to the clients connected at the time.
+    """
+
+    def __init__(self, *, exchange_prefix='aiodjango.', **kwargs):
+        self.exchange_prefix = exchange_prefix
+        self.connection_kwargs = {
+            key: kwargs.pop(key) for key in list(kwargs) if key != 'loop'}
+        super().__init__(**kwargs)
+        self._transport = None
+        self._protocol = None
+        self._channel = None
+        self._queue = None
+        self._exchanges = set()
+        self._closing = False
+
+    @asyncio.coroutine
+    def connect(self):
+        import aioamqp
+        backend = self
+
+        class Protocol(aioamqp.AmqpProtocol):
+
+            def connection_lost(self, exc):
+                super().connection_lost(exc)
+                backend._connection_lost(self, exc)
+
+        self._closing = False
+        self._exchanges.clear()
+        self._transport, self._protocol = yield from aioamqp.connect(
+            loop=self.loop, protocol_factory=Protocol, **self.connection_kwargs)
+        self._channel = yield from self._protocol.channel()
+        result = yield from self._channel.queue_declare('', exclusive=True)
+        self._queue = result['queue']
+        yield from self._channel.basic_consume(
+            self._on_message, queue_name=self._queue, no_ack=True)
+
+    def _connection_lost(self, protocol, exc):
+        if protocol is self._protocol and not self._closing:
+            self.lost(exc)
+
+    @asyncio.coroutine
+    def _on_message(self, channel, body, envelope, properties):
+        topic = envelope.exchange_name[len(self.exchange_prefix):]
+        self.deliver(topic, body.decode('utf-8'))
+
+    @asyncio.coroutine
+    def _declare(self, topic):
+        exchange = self.exchange_prefix + topic
+        if exchange not in self._exchanges:
+            yield from self._channel.exchange_declare(
+                exchange_name=exchange, type_name='fanout')
+            self._exchanges.add(exchange)
+        return exchange
+
+    @asyncio.coroutine
+    def subscribe(self, topic):
+        exchange = yield from self._declare(topic)
+        yield from self._channel.queue_bind(self._queue, exchange, routing_key='')
+
+    @asyncio.coroutine
+    def unsubscribe(self, topic):
+        yield from self._channel.queue_unbind(
+            self._queue, self.exchange_prefix + topic, routing_key='')
+
+    @asyncio.coroutine
+    def publish(self, topic, message):
+        exchange = yield from self._declare(topic)
+        yield from self._channel.publish(message, exchange_name=exchange, routing_key='')
+
+    @asyncio.coroutine
+    def close(self):
+        self._closing = True
+        protocol, transport = self._protocol, self._transport
+        self._protocol = self._transport = self._channel = None
+        if protocol is not None:
+            try:
+                yield from protocol.close(timeout=1.0)
+            except Exception:
+                # The connection may already be gone
+                logger.debug('Error closing the AMQP connection', exc_info=True)
+            finally:
+                transport.close()
+
+
+class RedisBackend(Backend):
+    """Redis channel per topic read from one subscriber connection per process."""
+
+    def __init__(self, *, address=('localhost', 6379), channel_prefix='aiodjango.', **kwargs):
+        super().__init__(**kwargs)
+        self.address = address
+        self.channel_prefix = channel_prefix
+        self._sub = None
+        self._pub = None
+        self._readers = {}
+        self._closing = False
+
+    @asyncio.coroutine
+    def connect(self):
+        import aioredis
+        self._closing = False
+        self._sub = yield from aioredis.create_redis(self.address, loop=self.loop)
+        self._pub = yield from aioredis.create_redis(self.address, loop=self.loop)
+
+    @asyncio.coroutine
+    def _read(self, topic, channel):
+        sub = self._sub
+        try:
+            while (yield from channel.wait_message()):
+                message = yield from channel.get(encoding='utf-8')
+                self.deliver(topic, message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = e
+        else:
+            # The channel also ends when it is unsubscribed
+            error = None
+            if not sub.closed:
+                return
+        if sub is self._sub and not self._closing:
+            self.lost(error)
+
+    @asyncio.coroutine
+    def subscribe(self, topic):
+        channel, = yield from self._sub.subscribe(self.channel_prefix + topic)
+        self._readers[topic] = self.loop.create_task(self._read(topic, channel))
+
+    @asyncio.coroutine
+    def unsubscribe(self, topic):
+        yield from self._sub.unsubscribe(self.channel_prefix + topic)
+        reader = self._readers.pop(topic, None)
+        if reader is not None:
+            reader.cancel()
+
+    @asyncio.coroutine
+    def publish(self, topic, message):
+        yield from self._pub.publish(self.channel_prefix + topic, message)
+
+    @asyncio.coroutine
+    def close(self):
+        self._closing = True
+        for reader in self._readers.values():
+            reader.cancel()
+        self._readers.clear()
+        for connection in (self._sub, self._pub):
+            if connection is not None:
+                connection.close()
+        self._sub = self._pub = None
+
+
+def get_backend(loop=None):
+    """Backend configured by the AIODJANGO_BROADCAST setting.
+
+    The setting is a dictionary with the dotted path of the BACKEND class
+    and the OPTIONS passed to it, like Django's CACHES.
+    """
+
+    config = getattr(settings, 'AIODJANGO_BROADCAST', {})
+    backend = import_string(config.get('BACKEND', DEFAULT_BACKEND))
+    return backend(loop=loop, **config.get('OPTIONS', {}))
+
+
+class BroadcastHub:
+    """Fans out the messages for each topic to the local subscribers.
+
+    Subscribers are callables such as WebSocketResponse.send_str which take
+    the message. The backend is only subscribed to a topic while the topic
+    has local subscribers, so the load on the broker grows with the number of
+    processes rather than the number of clients. When the upstream connection
+    drops the hub reconnects, backing off between attempts, and subscribes to
+    the topics of the local subscribers again. Messages published upstream
+    while it is disconnected are missed.
+    """
+
+    def __init__(self, backend=None, *, loop=None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.backend = backend or get_backend(loop=self.loop)
+        self.backend.deliver = self.deliver
+        self.backend.connection_lost = self.connection_lost
+        self._subscribers = defaultdict(set)
+        self._upstream = set()
+        self._connected = None
+        self._pending = {}
+        self._reconnecting = None
+        self._closed = False
+        self.delivered = 0
+        self.failed = 0
+        self.reconnects = 0
+
+    def stats(self):
+        return {
+            'topics': len(self._subscribers),
+            'subscribers': sum(len(s) for s in self._subscribers.values()),
+            'delivered': self.delivered,
+            'failed': self.failed,
+            'reconnects': self.reconnects,
+        }
+
+    @asyncio.coroutine
+    def connect(self):
+        if self._connected is None:
+            self._connected = self.loop.create_task(self.backend.connect())
+        try:
+            yield from asyncio.shield(self._connected, loop=self.loop)
+        except Exception:
+            # Allow the next call to try again
+            self._connected = None
+            raise
+
+    @asyncio.coroutine
+    def _sync(self, topic):
+        """Bring the upstream subscription in line with the local subscribers."""
+
+        while topic in self._pending:
+            yield from asyncio.shield(self._pending[topic], loop=self.loop)
+        self._pending[topic] = done = asyncio.Future(loop=self.loop)
+        try:
+            yield from self.connect()
+            if self._subscribers.get(topic):
+                if topic not in self._upstream:
+                    yield from self.backend.subscribe(topic)
+                    self._upstream.add(topic)
+            elif topic in self._upstream:
+                yield from self.backend.unsubscribe(topic)
+                self._upstream.discard(topic)
+        finally:
+            del self._pending[topic]
+            done.set_result(None)
+
+    @asyncio.coroutine
+    def subscribe(self, topic, subscriber):
+        self._subscribers[topic].add(subscriber)
+        yield from self._sync(topic)
+
+    @asyncio.coroutine
+    def unsubscribe(self, topic, subscriber):
+        subscribers = self._subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[topic]
+        yield from self._sync(topic)
+
+    @asyncio.coroutine
+    def publish(self, topic, message):
+        """Send a message to the subscribers of the topic in every process."""
+
+        yield from self.connect()
+        yield from self.backend.publish(topic, message)
+
+    def deliver(self, topic, message):
+        """Pass an upstream message to each local subscriber of the topic."""
+
+        subscribers = self._subscribers.get(topic, set())
+        for subscriber in list(subscribers):
+            try:
+                subscriber(message)
+            except Exception:
+                # Typically a websocket which has closed
+                logger.debug('Dropping subscriber %r to %s', subscriber, topic, exc_info=True)
+                self.failed += 1
+                subscribers.discard(subscriber)
+            else:
+                self.delivered += 1
+        if not subscribers and topic in self._upstream:
+            self._subscribers.pop(topic, None)
+            self.loop.create_task(self._sync(topic))
+
+    def connection_lost(self, exc=None):
+        """Forget the upstream subscriptions and reconnect in the background."""
+
+        if self._closed:
+            return
+        logger.error('Lost the upstream broadcast connection: %s', exc or 'closed')
+        self._connected = None
+        self._upstream.clear()
+        if self._reconnecting is None or self._reconnecting.done():
+            self._reconnecting = self.loop.create_task(self._reconnect())
+
+    @asyncio.coroutine
+    def _reconnect(self):
+        delay = RECONNECT_DELAY
+        while not self._closed:
+            try:
+                # Clean up what is left of the lost connection
+                yield from self.backend.close()
+                yield from self.connect()
+                for topic in list(self._subscribers):
+                    yield from self._sync(topic)
+            except Exception:
+                logger.warning('Unable to reconnect the broadcast hub, retrying in %.1fs',
+                               delay, exc_info=True)
+            else:
+                if self._connected is not None:
+                    self.reconnects += 1
+                    logger.info('Reconnected the broadcast hub.')
+                    return
+            yield from asyncio.sleep(delay, loop=self.loop)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    @asyncio.coroutine
+    def close(self):
+        self._closed = True
+        self._subscribers.clear()
+        if self._reconnecting is not None:
+            self._reconnecting.cancel()
+        if self._connected is not None:
+            yield from self.backend.close()
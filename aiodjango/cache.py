@@ -0,0 +1,172 @@
+"""
+Short lived cache of Django responses with coalescing of concurrent requests.
+"""
+import asyncio
+
+from collections import OrderedDict
+
+from django.conf import settings
+
+from aiohttp import hdrs, web
+
+
+# Largest WSGI response body which is buffered so that it can be cached
+MAX_BODY_SIZE = 1024 * 1024
+
+CACHEABLE_METHODS = frozenset((hdrs.METH_GET, hdrs.METH_HEAD))
+CACHEABLE_STATUS = frozenset((200, 203, 301, 404, 410))
+UNCACHEABLE_DIRECTIVES = frozenset(('private', 'no-store', 'no-cache'))
+
+
+def get_proxy_ssl_header():
+    """Name of the request header Django trusts for the scheme or None."""
+
+    setting = getattr(settings, 'SECURE_PROXY_SSL_HEADER', None)
+    if not setting:
+        return None
+    name = setting[0]
+    if name.startswith('HTTP_'):
+        name = name[5:]
+    return name.replace('_', '-')
+
+
+def parse_cache_control(value):
+    """Cache-Control directives as a dictionary."""
+
+    directives = {}
+    for part in value.split(','):
+        name, _, arg = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = arg.strip('"') or None
+    return directives
+
+
+def get_max_age(response, default):
+    """Number of seconds the response can be shared or 0 if it can't be cached."""
+
+    if response.status not in CACHEABLE_STATUS or hdrs.SET_COOKIE in response.headers:
+        return 0
+    if response.headers.get(hdrs.VARY, '').strip() == '*':
+        return 0
+    directives = parse_cache_control(response.headers.get(hdrs.CACHE_CONTROL, ''))
+    if UNCACHEABLE_DIRECTIVES.intersection(directives):
+        return 0
+    for name in ('s-maxage', 'max-age'):
+        if name in directives:
+            try:
+                return min(default, max(0, int(directives[name])))
+            except (TypeError, ValueError):
+                return 0
+    return default
+
+
+class CachedResponse:
+    """Copy of a complete response which can be rebuilt for each request."""
+
+    __slots__ = ('status', 'reason', 'headers', 'body', 'vary', 'expires')
+
+    def __init__(self, response, request, expires):
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = list(response.headers.items())
+        self.body = response.body
+        names = response.headers.get(hdrs.VARY, '')
+        self.vary = tuple(
+            (name, request.headers.get(name))
+            for name in (name.strip() for name in names.split(',')) if name)
+        self.expires = expires
+
+    def matches(self, request):
+        """Whether the request has the same values for the headers the response varies on."""
+
+        return all(request.headers.get(name) == value for name, value in self.vary)
+
+    def build(self):
+        return web.Response(
+            status=self.status, reason=self.reason, headers=self.headers, body=self.body)
+
+
+class MicroCache:
+    """Handler wrapper which shares responses between identical requests.
+
+    Concurrent GET and HEAD requests for the same scheme, host and URL are
+    collapsed into a single call to the wrapped handler. Complete responses
+    are then kept for up to ttl seconds unless Cache-Control, Vary or
+    Set-Cookie say they can't be shared. Requests with an Authorization
+    header are never cached. Streamed responses are passed through since
+    their body has already been sent.
+    """
+
+    def __init__(self, handler, *, ttl=1.0, max_entries=1000, loop=None):
+        self.handler = handler
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._loop = loop or asyncio.get_event_loop()
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._proxy_ssl_header = get_proxy_ssl_header()
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+
+    def stats(self):
+        return {
+            'entries': len(self._cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'collapsed': self.collapsed,
+        }
+
+    def get_key(self, request):
+        if request.method not in CACHEABLE_METHODS or hdrs.AUTHORIZATION in request.headers:
+            return None
+        forwarded = None
+        if self._proxy_ssl_header is not None:
+            forwarded = request.headers.get(self._proxy_ssl_header)
+        return request.method, request.scheme, request.host, forwarded, request.path_qs
+
+    @asyncio.coroutine
+    def __call__(self, request):
+        key = self.get_key(request)
+        if key is None:
+            return (yield from self.handler(request))
+        cached = self._cache.get(key)
+        if cached is not None:
+            if cached.expires > self._loop.time() and cached.matches(request):
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached.build()
+            del self._cache[key]
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.collapsed += 1
+            cached = yield from asyncio.shield(pending, loop=self._loop)
+            if cached is not None and cached.matches(request):
+                return cached.build()
+            return (yield from self.handler(request))
+        self.misses += 1
+        pending = self._pending[key] = asyncio.Future(loop=self._loop)
+        cached = None
+        try:
+            response = yield from self.handler(request)
+            cached = self.store(key, request, response)
+            return response
+        finally:
+            del self._pending[key]
+            pending.set_result(cached)
+
+    def store(self, key, request, response):
+        """Cache the response if it can be shared."""
+
+        if not isinstance(response, web.Response) or response.prepared:
+            return None
+        if response.body is None:
+            return None
+        max_age = get_max_age(response, self.ttl)
+        if not max_age:
+            return None
+        cached = CachedResponse(response, request, self._loop.time() + max_age)
+        self._cache[key] = cached
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return cached
@@ -0,0 +1,51 @@
+"""
+Running ORM calls from coroutine views in a dedicated thread pool.
+"""
+import asyncio
+
+from functools import partial
+
+from django.db import close_old_connections
+
+from .executor import BoundedExecutor
+
+
+# Default number of database threads (and so connections) per process
+DEFAULT_DB_WORKERS = 10
+
+
+def run_with_connection(func, *args, **kwargs):
+    """Call func with the same connection handling Django uses for a request.
+
+    Django connections are per thread so each worker keeps its own persistent
+    connection. Closing the old connections before and after the call drops
+    any which are broken or have outlived CONN_MAX_AGE.
+    """
+
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+class DatabaseExecutor(BoundedExecutor):
+    """Thread pool which runs each call with Django's connection handling.
+
+    The number of workers caps the number of connections opened by the
+    process so it should match the size of the database connection pool.
+    """
+
+    def __init__(self, max_workers=None, **kwargs):
+        super().__init__(max_workers or DEFAULT_DB_WORKERS, **kwargs)
+
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(run_with_connection, fn, *args, **kwargs)
+
+
+@asyncio.coroutine
+def run_in_db(app, func, *args, **kwargs):
+    """Run a callable which uses the ORM in the application's database threads."""
+
+    executor = app['db_executor']
+    return (yield from app.loop.run_in_executor(executor, partial(func, *args, **kwargs)))
@@ -0,0 +1,213 @@
+"""
+Thread pool for running the Django WSGI application with a bounded queue.
+"""
+import asyncio
+import os
+import threading
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial, wraps
+
+from aiohttp import web
+
+
+# Request key for the seconds the request waited for a worker thread
+EXECUTOR_WAIT_KEY = 'aiodjango_executor_wait'
+
+# Request key for the seconds the call took once it was running
+EXECUTOR_RUN_KEY = 'aiodjango_executor_run'
+
+# Request key for a profiler to enable in the worker thread during the call
+EXECUTOR_PROFILER_KEY = 'aiodjango_executor_profiler'
+
+
+class QueueFull(Exception):
+    """Raised when the executor already has the maximum number of queued calls."""
+
+
+class QueueTimeout(Exception):
+    """Raised when a call waited longer than the queue timeout to start."""
+
+
+class BoundedExecutor(ThreadPoolExecutor):
+    """Thread pool which limits the number of calls waiting for a worker.
+
+    Calls submitted while max_queue calls are already waiting raise QueueFull
+    immediately. Calls which wait longer than queue_timeout for a worker
+    raise QueueTimeout rather than running since the client has likely given
+    up by then. When the call is submitted from a running event loop, as
+    run_in_executor does, the loop cancels the waiting call and fails its
+    future as soon as the timeout passes. Otherwise the timeout is checked
+    when a worker picks up the call. Cancelling the returned future also
+    cancels a call which hasn't started. The time spent waiting is tracked
+    and reported by stats.
+    """
+
+    def __init__(self, max_workers=None, *, max_queue=None, queue_timeout=None):
+        if max_workers is None:
+            max_workers = (os.cpu_count() or 1) * 5
+        super().__init__(max_workers)
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self.max_queue is not None and self.queued >= self.max_queue:
+                self.rejected += 1
+                raise QueueFull('{} calls are already waiting.'.format(self.queued))
+            self.queued += 1
+        try:
+            call = super().submit(self._run, time.monotonic(), fn, args, kwargs)
+        except Exception:
+            with self._lock:
+                self.queued -= 1
+            raise
+        call.add_done_callback(self._cancelled)
+        # The future given to the caller is only failed by the timeout
+        # when the call is cancelled before a worker picks it up
+        future = Future()
+        call.add_done_callback(partial(copy_result, future))
+        future.add_done_callback(partial(cancel_call, call))
+        loop = get_running_loop()
+        if self.queue_timeout is not None and loop is not None:
+            timer = loop.call_later(self.queue_timeout, self._expire, call, future)
+            future.add_done_callback(partial(cancel_timer, loop, timer))
+        return future
+
+    def _cancelled(self, call):
+        if call.cancelled():
+            # Cancelled calls are never run so they stop waiting here
+            with self._lock:
+                self.queued -= 1
+
+    def _expire(self, call, future):
+        if not future.done() and call.cancel():
+            with self._lock:
+                self.timed_out += 1
+            future.set_exception(QueueTimeout(
+                'Waited {:.3f}s for a worker.'.format(self.queue_timeout)))
+
+    def _run(self, queued_at, fn, args, kwargs):
+        wait = time.monotonic() - queued_at
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        try:
+            if self.queue_timeout is not None and wait > self.queue_timeout:
+                with self._lock:
+                    self.timed_out += 1
+                raise QueueTimeout('Waited {:.3f}s for a worker.'.format(wait))
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+
+    def stats(self):
+        """Current queue depth, worker usage and wait times."""
+
+        with self._lock:
+            started = self.completed + self.active
+            return {
+                'workers': self.max_workers,
+                'queued': self.queued,
+                'active': self.active,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'total_wait': self.total_wait,
+                'max_wait': self.max_wait,
+                'mean_wait': self.total_wait / started if started else 0.0,
+            }
+
+
+def get_running_loop():
+    """Event loop running in this thread or None."""
+
+    try:
+        loop = asyncio.get_event_loop()
+    except RuntimeError:
+        return None
+    return loop if loop.is_running() else None
+
+
+def copy_result(future, call):
+    """Pass the outcome of a call which ran on to the future of the caller."""
+
+    if call.cancelled() or future.done():
+        return
+    exception = call.exception()
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(call.result())
+
+
+def cancel_call(call, future):
+    """Cancel the call if it hasn't started when the caller cancels its future."""
+
+    if future.cancelled():
+        call.cancel()
+
+
+def cancel_timer(loop, timer, future):
+    """Drop the queue timeout of a call which has finished from the loop."""
+
+    if get_running_loop() is loop:
+        timer.cancel()
+    else:
+        # Finished in a worker thread and timers aren't thread safe
+        try:
+            loop.call_soon_threadsafe(timer.cancel)
+        except RuntimeError:
+            # The loop has been closed
+            pass
+
+
+def record_wait(request, fn):
+    """Wrap fn to store how long it waited for a worker thread and ran on the request.
+
+    The call is profiled when the request has a profiler.
+    """
+
+    queued_at = time.monotonic()
+    profiler = request.get(EXECUTOR_PROFILER_KEY)
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.monotonic()
+        request[EXECUTOR_WAIT_KEY] = started - queued_at
+        if profiler is not None:
+            profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            request[EXECUTOR_RUN_KEY] = time.monotonic() - started
+    return wrapper
+
+
+def shed_load(handler, retry_after=1):
+    """Respond with a 503 when the executor can't take on the request."""
+
+    @asyncio.coroutine
+    @wraps(handler)
+    def wrapper(request):
+        try:
+            return (yield from handler(request))
+        except (QueueFull, QueueTimeout):
+            raise web.HTTPServiceUnavailable(headers={'Retry-After': str(retry_after)})
+    return wrapper
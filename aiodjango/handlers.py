@@ -0,0 +1,287 @@
+"""
+Bridge which runs Django views for aiohttp requests without a WSGI layer.
+"""
+import asyncio
+import cgi
+import codecs
+import threading
+
+from urllib.parse import quote
+from wsgiref.util import is_hop_by_hop
+
+from django import http
+from django.conf import settings
+from django.core import signals
+from django.core.handlers import base
+from django.core.handlers.wsgi import LimitedStream
+from django.core.urlresolvers import set_script_prefix
+from django.utils.functional import cached_property
+
+from aiohttp import web
+from aiohttp_wsgi import WSGIHandler
+from aiohttp_wsgi.concurrent import run_in_executor
+from aiohttp_wsgi.utils import parse_sockname
+from aiohttp_wsgi.wsgi import WSGIResponse
+
+from .executor import record_wait
+from .streams import call_in_loop, get_input, write_chunk
+
+
+def get_meta(request, content_length, script_name, path_info):
+    """Build the CGI style META dictionary Django expects from an aiohttp request."""
+
+    server_name, server_port = parse_sockname(request.transport.get_extra_info('sockname'))
+    remote_addr, remote_port = parse_sockname(request.transport.get_extra_info('peername'))
+    meta = {
+        'REQUEST_METHOD': request.method,
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': request.query_string,
+        'CONTENT_TYPE': request.headers.get('Content-Type', ''),
+        'CONTENT_LENGTH': str(content_length),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': server_port,
+        'REMOTE_ADDR': remote_addr,
+        'REMOTE_HOST': remote_addr,
+        'REMOTE_PORT': remote_port,
+        'SERVER_PROTOCOL': 'HTTP/{}.{}'.format(*request.version),
+    }
+    for name, value in request.headers.items():
+        name = name.upper()
+        # Same as aiohttp-wsgi, hop-by-hop headers are for the server only
+        if name in ('CONTENT-LENGTH', 'CONTENT-TYPE') or is_hop_by_hop(name):
+            continue
+        key = 'HTTP_' + name.replace('-', '_')
+        if key in meta:
+            value = meta[key] + ',' + value
+        meta[key] = value
+    return meta
+
+
+class AioDjangoRequest(http.HttpRequest):
+    """Django request built directly from an aiohttp request and its body stream."""
+
+    def __init__(self, request, stream, content_length):
+        script_name = settings.FORCE_SCRIPT_NAME or ''
+        path_info = request.path or '/'
+        self.path_info = path_info
+        self.path = '%s/%s' % (script_name.rstrip('/'), path_info.replace('/', '', 1))
+        self.META = get_meta(request, content_length, script_name, path_info)
+        self.method = request.method.upper()
+        self._query_string = request.query_string
+        self._scheme = request.scheme
+        _, content_params = cgi.parse_header(self.META['CONTENT_TYPE'])
+        if 'charset' in content_params:
+            try:
+                codecs.lookup(content_params['charset'])
+            except LookupError:
+                pass
+            else:
+                self.encoding = content_params['charset']
+        self._post_parse_error = False
+        self._stream = LimitedStream(stream, content_length)
+        self._read_started = False
+        self.resolver_match = None
+
+    def _get_scheme(self):
+        return self._scheme
+
+    @cached_property
+    def GET(self):
+        return http.QueryDict(self._query_string, encoding=self._encoding)
+
+    def _get_post(self):
+        if not hasattr(self, '_post'):
+            self._load_post_and_files()
+        return self._post
+
+    def _set_post(self, post):
+        self._post = post
+
+    @cached_property
+    def COOKIES(self):
+        return http.parse_cookie(self.META.get('HTTP_COOKIE', ''))
+
+    def _get_files(self):
+        if not hasattr(self, '_files'):
+            self._load_post_and_files()
+        return self._files
+
+    POST = property(_get_post, _set_post)
+    FILES = property(_get_files)
+
+
+class DjangoHandler(base.BaseHandler):
+    """Run Django views for aiohttp requests in a thread pool.
+
+    The Django request is built directly from the aiohttp request and the
+    Django response is copied onto an aiohttp response so there is no WSGI
+    environ, start_response or per chunk hand off back to the loop for
+    regular responses. Request bodies are read from the socket as the view
+    consumes them and streaming responses are written chunk by chunk.
+    """
+
+    initLock = threading.Lock()
+    request_class = AioDjangoRequest
+
+    def __init__(self, *, executor=None, loop=None):
+        super().__init__()
+        self._executor = executor
+        self._loop = loop or asyncio.get_event_loop()
+
+    @asyncio.coroutine
+    def handle_request(self, request):
+        stream, content_length = yield from get_input(request, self._loop)
+        return (yield from run_in_executor(
+            record_wait(request, self._run), request, stream, content_length,
+            loop=self._loop, executor=self._executor))
+
+    @asyncio.coroutine
+    def __call__(self, request):
+        return (yield from self.handle_request(request))
+
+    def get_django_response(self, request, stream, content_length):
+        """Run the Django request/response cycle for an aiohttp request."""
+
+        if self._request_middleware is None:
+            with self.initLock:
+                try:
+                    # Check that middleware is still uninitialized.
+                    if self._request_middleware is None:
+                        self.load_middleware()
+                except:  # noqa
+                    self._request_middleware = None
+                    raise
+        set_script_prefix(settings.FORCE_SCRIPT_NAME or '/')
+        signals.request_started.send(sender=self.__class__, environ=None)
+        try:
+            django_request = self.request_class(request, stream, content_length)
+        except UnicodeDecodeError:
+            response = http.HttpResponseBadRequest()
+        else:
+            response = self.get_response(django_request)
+        response._handler_class = self.__class__
+        return response
+
+    def _run(self, request, stream, content_length):
+        django_response = self.get_django_response(request, stream, content_length)
+        try:
+            headers = list(django_response.items())
+            for cookie in django_response.cookies.values():
+                headers.append(('Set-Cookie', cookie.output(header='').strip()))
+            kwargs = {
+                'status': django_response.status_code,
+                'reason': django_response.reason_phrase,
+                'headers': headers,
+            }
+            if not django_response.streaming:
+                return web.Response(body=django_response.content, **kwargs)
+            response = web.StreamResponse(**kwargs)
+            call_in_loop(self._loop, response.prepare, request)
+            for chunk in django_response:
+                call_in_loop(self._loop, write_chunk, response, chunk)
+            return response
+        finally:
+            django_response.close()
+
+
+class StreamingWSGIResponse(WSGIResponse):
+    """WSGI response which waits for each chunk to be flushed before the next.
+
+    Up to buffer_size bytes of the body are held back. If the whole body fits
+    then it is returned as a regular aiohttp Response which can be inspected
+    or cached before it is sent. Otherwise the response is streamed.
+    """
+
+    __slots__ = ('_buffer', '_buffered', '_buffer_size')
+
+    def __init__(self, handler, request, buffer_size=0):
+        super().__init__(handler, request)
+        self._buffer = []
+        self._buffered = 0
+        self._buffer_size = buffer_size
+
+    def start_response(self, status, headers, exc_info=None):
+        if exc_info and self._buffer is not None:
+            # Drop the partial body of the failed response
+            self._buffer = []
+            self._buffered = 0
+        return super().start_response(status, headers, exc_info)
+
+    def write(self, data):
+        assert isinstance(data, (bytes, bytearray, memoryview)), "Data should be bytes"
+        if not data:
+            return
+        if self._buffer is not None:
+            self._buffer.append(bytes(data))
+            self._buffered += len(data)
+            if self._buffered <= self._buffer_size:
+                return
+            data, self._buffer = b''.join(self._buffer), None
+        self._write_head()
+        call_in_loop(self._handler._loop, write_chunk, self._response, data)
+
+    def _write_head(self):
+        assert self._response, "Application did not call start_response()"
+        if not self._response.prepared:
+            call_in_loop(self._handler._loop, self._response.prepare, self._request)
+
+    def write_eof(self):
+        if self._buffer is None:
+            super().write_eof()
+        else:
+            assert self._response, "Application did not call start_response()"
+
+    def get_response(self):
+        """The streamed response or a complete response for buffered bodies."""
+
+        if self._buffer is None or self._response.prepared:
+            return self._response
+        return web.Response(
+            status=self._response.status, reason=self._response.reason,
+            headers=self._response.headers, body=b''.join(self._buffer))
+
+
+class StreamingWSGIHandler(WSGIHandler):
+    """aiohttp-wsgi handler which streams both the request and response bodies.
+
+    The request body is given to the WSGI application as a file which reads
+    from the socket as it is consumed rather than being buffered up front.
+    Each chunk of the response is drained before the application is asked
+    for the next so slow clients don't buffer the whole response in memory.
+    Responses up to buffer_size bytes are returned complete instead.
+    """
+
+    def __init__(self, application, *, buffer_size=0, **kwargs):
+        super().__init__(application, **kwargs)
+        self._buffer_size = buffer_size
+
+    @asyncio.coroutine
+    def _get_environ(self, request):
+        path_info = request.match_info['path_info']
+        script_name = request.path[:len(request.path) - len(path_info)]
+        # Same as aiohttp-wsgi, move the trailing slash from the script name.
+        if script_name.endswith('/'):
+            script_name = script_name[:-1]
+            path_info = '/' + path_info
+        stream, content_length = yield from get_input(request, self._loop)
+        environ = get_meta(request, content_length, quote(script_name), quote(path_info))
+        environ.update({
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': self._url_scheme or request.scheme,
+            'wsgi.input': stream,
+            'wsgi.errors': self._stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        })
+        return environ
+
+    @asyncio.coroutine
+    def handle_request(self, request):
+        environ = yield from self._get_environ(request)
+        response = StreamingWSGIResponse(self, request, self._buffer_size)
+        yield from run_in_executor(
+            record_wait(request, self._run_application), environ, response,
+            loop=self._loop, executor=self._executor)
+        return response.get_response()
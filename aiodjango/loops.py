@@ -0,0 +1,72 @@
+"""
+Choosing and tuning the event loop used by the server commands.
+"""
+import asyncio
+import logging
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+LOOP_CHOICES = ('asyncio', 'uvloop', 'auto')
+
+
+def get_loop_name(name=None):
+    """Loop implementation given on the command line or AIODJANGO_LOOP setting."""
+
+    name = name or getattr(settings, 'AIODJANGO_LOOP', 'asyncio')
+    if name not in LOOP_CHOICES:
+        raise ValueError('Unknown event loop "{}". Choices are: {}.'.format(
+            name, ', '.join(LOOP_CHOICES)))
+    return name
+
+
+def add_loop_arguments(parser):
+    """Command line options for choosing and tuning the event loop."""
+
+    parser.add_argument(
+        '--loop', choices=LOOP_CHOICES, default=None,
+        help='Event loop implementation. Defaults to the AIODJANGO_LOOP setting or asyncio. '
+             '"auto" uses uvloop if it is installed.')
+    parser.add_argument(
+        '--loop-debug', action='store_true', default=False,
+        help='Run the event loop in debug mode.')
+    parser.add_argument(
+        '--slow-callback', type=float, default=None,
+        help='Log callbacks which block the event loop for longer than this many seconds. '
+             'Implies --loop-debug.')
+
+
+def new_event_loop(name='asyncio', *, debug=False, slow_callback_duration=None):
+    """Create a new event loop of the named implementation.
+
+    uvloop is used for "uvloop" or "auto" if it is installed. Otherwise the
+    standard library loop is used, with a warning if uvloop was asked for.
+    """
+
+    loop = None
+    if name in ('uvloop', 'auto'):
+        try:
+            import uvloop
+        except ImportError:
+            if name == 'uvloop':
+                logger.warning('uvloop is not installed, using the asyncio event loop.')
+        else:
+            loop = uvloop.new_event_loop()
+    if loop is None:
+        loop = asyncio.new_event_loop()
+    configure_loop(loop, debug=debug, slow_callback_duration=slow_callback_duration)
+    return loop
+
+
+def configure_loop(loop, *, debug=False, slow_callback_duration=None):
+    """Enable debug mode and set the threshold for logging slow callbacks.
+
+    asyncio only times callbacks in debug mode so setting a threshold enables it.
+    """
+
+    if debug or slow_callback_duration is not None:
+        loop.set_debug(True)
+    if slow_callback_duration is not None:
+        loop.slow_callback_duration = slow_callback_duration
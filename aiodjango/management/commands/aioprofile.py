@@ -0,0 +1,55 @@
+import glob
+import io
+import os
+import pstats
+
+from django.core.management.base import BaseCommand, CommandError
+
+from aiodjango.profiling import (
+    PROFILE_HEADER, PROFILE_SUFFIX, clean_route, get_profile_route, make_token)
+
+
+class Command(BaseCommand):
+    help = "Combine the request profiles written by the application and print the statistics."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'directory', nargs='?', help='Directory the profiles were written to.')
+        parser.add_argument(
+            '--route', help='Only include the profiles of the route with this name.')
+        parser.add_argument(
+            '--sort', default='cumulative', help='pstats key to sort the functions by.')
+        parser.add_argument(
+            '--limit', type=int, default=30, help='Number of functions to print.')
+        parser.add_argument(
+            '--output', help='Also write the combined profile to this path.')
+        parser.add_argument(
+            '--token', action='store_true',
+            help='Print a header which enables profiling of a request instead.')
+
+    def handle(self, *args, **options):
+        if options['token']:
+            self.stdout.write('{}: {}'.format(PROFILE_HEADER, make_token()))
+            return
+        if options['directory'] is None:
+            raise CommandError('The directory of the profiles is required.')
+        paths = sorted(glob.glob(os.path.join(options['directory'], '*' + PROFILE_SUFFIX)))
+        if options['route'] is not None:
+            route = clean_route(options['route'])
+            paths = [path for path in paths if get_profile_route(path) == route]
+        if not paths:
+            raise CommandError('No profiles found in {}'.format(options['directory']))
+        output = io.StringIO()
+        try:
+            stats = pstats.Stats(*paths, stream=output)
+        except (OSError, EOFError, TypeError, ValueError) as e:
+            raise CommandError('Unable to read the profiles: {}'.format(e))
+        self.stdout.write('Combined {} profiles'.format(len(paths)))
+        if options['output'] is not None:
+            stats.dump_stats(options['output'])
+        try:
+            stats.sort_stats(options['sort'])
+        except KeyError:
+            raise CommandError('Unknown sort key {}'.format(options['sort']))
+        stats.print_stats(options['limit'])
+        self.stdout.write(output.getvalue())
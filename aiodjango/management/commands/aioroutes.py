@@ -0,0 +1,22 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from aiodjango.routing import build_route_manifest
+
+
+class Command(BaseCommand):
+    help = "Write the coroutine views found in the URL patterns to a route manifest."
+
+    def add_arguments(self, parser):
+        parser.add_argument('manifest', help='Path of the manifest file to write.')
+
+    def handle(self, *args, **options):
+        try:
+            manifest = build_route_manifest()
+        except ValueError as e:
+            raise CommandError(e)
+        with open(options['manifest'], 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        self.stdout.write('Wrote {} routes to {}'.format(
+            len(manifest['routes']), options['manifest']))
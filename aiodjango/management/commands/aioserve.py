@@ -0,0 +1,73 @@
+import logging
+import re
+
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from aiodjango.accesslog import FORMATS
+from aiodjango.loops import add_loop_arguments, get_loop_name, new_event_loop
+from aiodjango.server import SHUTDOWN_TIMEOUT, Supervisor
+
+
+ADDRPORT = re.compile(r'^(?:(?:\[(?P<ipv6>[^\]]+)\]|(?P<host>[^:\[\]]+)):)?(?P<port>\d+)$')
+
+
+class Command(BaseCommand):
+    help = "Run the aiohttp application in several pre-forked worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'addrport', nargs='?', default='127.0.0.1:8000',
+            help='Address and port to listen on (default 127.0.0.1:8000).')
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Number of worker processes. Defaults to the number of CPUs.')
+        parser.add_argument(
+            '--max-requests', type=int, default=0,
+            help='Restart each worker after it has handled this many requests.')
+        parser.add_argument(
+            '--no-reuse-port', action='store_false', dest='reuse_port', default=None,
+            help='Share a single listening socket rather than using SO_REUSEPORT.')
+        parser.add_argument(
+            '--app', default='aiodjango.get_aio_application',
+            help='Dotted path of a callable which returns the application.')
+        parser.add_argument(
+            '--shutdown-timeout', type=float, default=SHUTDOWN_TIMEOUT,
+            help='Seconds open connections have to finish when a worker stops.')
+        parser.add_argument(
+            '--access-log', choices=FORMATS, default=None,
+            help='Write an access log in this format to stdout.')
+        add_loop_arguments(parser)
+
+    def handle(self, *args, **options):
+        match = ADDRPORT.match(options['addrport'])
+        if match is None:
+            raise CommandError('"{}" is not a valid address and port.'.format(
+                options['addrport']))
+        host = match.group('ipv6') or match.group('host') or '127.0.0.1'
+        port = int(match.group('port'))
+        try:
+            app_factory = import_string(options['app'])
+        except ImportError as e:
+            raise CommandError(e)
+        try:
+            loop_name = get_loop_name(options['loop'])
+        except ValueError as e:
+            raise CommandError(e)
+        loop_factory = partial(
+            new_event_loop, loop_name, debug=options['loop_debug'],
+            slow_callback_duration=options['slow_callback'])
+        supervisor = Supervisor(
+            app_factory, host, port, workers=options['workers'],
+            max_requests=options['max_requests'], reuse_port=options['reuse_port'],
+            shutdown_timeout=options['shutdown_timeout'], loop_factory=loop_factory,
+            access_log=options['access_log'])
+        logger = logging.getLogger('aiodjango.server')
+        if not logger.handlers:
+            logger.addHandler(logging.StreamHandler(stream=self.stderr))
+            logger.setLevel(logging.INFO)
+        self.stdout.write('Starting {} workers at http://{}:{}/'.format(
+            supervisor.workers, '[%s]' % host if match.group('ipv6') else host, port))
+        supervisor.run()
@@ -1,21 +1,47 @@
 import asyncio
 import errno
 import datetime
-import logging
 import os
 import socket
 import sys
 
 from django.conf import settings
 from django.contrib.staticfiles.management.commands.runserver import Command as BaseCommand
+from django.core.management.base import CommandError
 from django.utils import autoreload
 from django.utils.encoding import force_text
 
-from aiodjango import get_aio_application
+from aiodjango import get_aio_application, reloader
+from aiodjango.accesslog import FORMATS, install_access_log
+from aiodjango.loops import add_loop_arguments, configure_loop, get_loop_name, new_event_loop
+from aiodjango.server import drain
 
 
 class Command(BaseCommand):
 
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        add_loop_arguments(parser)
+        parser.add_argument(
+            '--shutdown-timeout', type=float, default=1.0,
+            help='Seconds open connections have to finish when the server stops.')
+        parser.add_argument(
+            '--access-log-format', choices=FORMATS, default='text',
+            help='Format of the access log written to stdout.')
+
+    def handle(self, *args, **options):
+        try:
+            get_loop_name(options.get('loop'))
+        except ValueError as e:
+            raise CommandError(e)
+        super().handle(*args, **options)
+
+    def run(self, **options):
+        if options.get('use_reloader'):
+            reloader.main(self.inner_run, None, options)
+        else:
+            self.inner_run(None, **options)
+
     def get_handler(self, *args, **options):
         wsgi = super().get_handler(*args, **options)
         return get_aio_application(wsgi=wsgi)
@@ -45,18 +71,20 @@ class Command(BaseCommand):
             "quit_command": quit_command,
         })
 
-        if options.get('use_reloader'):
-            loop = asyncio.new_event_loop()
+        loop_options = {
+            'debug': options.get('loop_debug', False),
+            'slow_callback_duration': options.get('slow_callback'),
+        }
+        loop_name = get_loop_name(options.get('loop'))
+        if options.get('use_reloader') or loop_name != 'asyncio':
+            loop = new_event_loop(loop_name, **loop_options)
             asyncio.set_event_loop(loop)
         else:
             loop = asyncio.get_event_loop()
+            configure_loop(loop, **loop_options)
         app = self.get_handler(*args, **options)
-        log = logging.getLogger('aiodjango.runserver')
-        log.propagate = False
-        log.setLevel(logging.INFO)
-        stdout = logging.StreamHandler(stream=self.stdout)
-        log.addHandler(stdout)
-        handler = app.make_handler(access_log=log, access_log_format='%t "%r" %s %b %D')
+        install_access_log(app, self.stdout, log_format=options.get('access_log_format', 'text'))
+        handler = app.make_handler()
         server = None
         try:
             server = loop.run_until_complete(
@@ -81,9 +109,6 @@ class Command(BaseCommand):
                 self.stdout.write(shutdown_message)
             sys.exit(0)
         finally:
-            loop.run_until_complete(handler.finish_connections(1.0))
-            if server is not None:
-                server.close()
-                loop.run_until_complete(server.wait_closed())
-            loop.run_until_complete(app.finish())
+            loop.run_until_complete(
+                drain(app, handler, server, timeout=options.get('shutdown_timeout', 1.0)))
         loop.close()
@@ -0,0 +1,219 @@
+"""
+Request latency histograms and gauges exposed in the Prometheus text format.
+"""
+import asyncio
+import bisect
+import time
+
+from collections import Counter, defaultdict
+
+from aiohttp import web
+
+from .accesslog import get_route_type
+from .executor import EXECUTOR_RUN_KEY, EXECUTOR_WAIT_KEY
+from .routing import DjangoRegexRoute
+
+
+# Upper bounds in seconds of the histogram buckets, the Prometheus client defaults
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def get_route_label(route):
+    """Name of the route or its pattern for unnamed coroutine routes."""
+
+    if route is None:
+        return '-'
+    if route.name:
+        return route.name
+    if isinstance(route, DjangoRegexRoute):
+        return route.pattern.pattern
+    return '-'
+
+
+def get_route_name(request):
+    """Label of the route matched by the request."""
+
+    return get_route_label(getattr(request.match_info, 'route', None))
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+            '\n', r'\n'))
+        for name, value in labels) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Counts of observations in cumulative buckets."""
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        # One more for the observations above the last bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def samples(self, name, labels=()):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'), ), self.counts):
+            cumulative += count
+            yield name + '_bucket', labels + (('le', format_value(bound)), ), cumulative
+        yield name + '_sum', labels, self.sum
+        yield name + '_count', labels, self.count
+
+
+class Metrics:
+    """Instrumentation of the requests to an application.
+
+    The middleware records the latency of each request by route name and
+    route type (async, wsgi or static), the responses by status code and the
+    requests in flight. Django requests also record the time spent waiting for
+    a worker thread separately from the time running in it. Gauges for the
+    executors and websockets are read when the metrics are rendered.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.latency = defaultdict(lambda: Histogram(self.buckets))
+        self.responses = Counter()
+        self.in_flight = Counter()
+        self.executor_wait = Histogram(buckets)
+        self.executor_run = Histogram(buckets)
+
+    @asyncio.coroutine
+    def middleware(self, app, handler):
+
+        @asyncio.coroutine
+        def instrument(request):
+            route_type = get_route_type(request)
+            self.in_flight[route_type] += 1
+            started = time.monotonic()
+            status = 500
+            try:
+                response = yield from handler(request)
+                status = response.status
+                return response
+            except web.HTTPException as e:
+                status = e.status
+                raise
+            finally:
+                self.in_flight[route_type] -= 1
+                self.observe(request, route_type, status, time.monotonic() - started)
+
+        return instrument
+
+    def observe(self, request, route_type, status, duration):
+        key = (get_route_name(request), route_type)
+        self.latency[key].observe(duration)
+        self.responses[key + (status, )] += 1
+        wait = request.get(EXECUTOR_WAIT_KEY)
+        if wait is not None:
+            self.executor_wait.observe(wait)
+            run = request.get(EXECUTOR_RUN_KEY)
+            if run is not None:
+                self.executor_run.observe(run)
+
+    def collect(self, app=None):
+        """Name, type, help and samples of each metric."""
+
+        yield (
+            'aiodjango_request_duration_seconds', 'histogram',
+            'Time to handle the request by route.',
+            [sample for (route, route_type), histogram in sorted(self.latency.items())
+             for sample in histogram.samples(
+                 'aiodjango_request_duration_seconds',
+                 (('route', route), ('type', route_type)))])
+        yield (
+            'aiodjango_responses_total', 'counter', 'Responses by route and status code.',
+            [('aiodjango_responses_total',
+              (('route', route), ('type', route_type), ('code', status)), count)
+             for (route, route_type, status), count in sorted(self.responses.items())])
+        yield (
+            'aiodjango_requests_in_flight', 'gauge', 'Requests being handled by route type.',
+            [('aiodjango_requests_in_flight', (('type', route_type), ), count)
+             for route_type, count in sorted(self.in_flight.items())])
+        yield (
+            'aiodjango_executor_wait_seconds', 'histogram',
+            'Time Django requests waited for a worker thread.',
+            list(self.executor_wait.samples('aiodjango_executor_wait_seconds')))
+        yield (
+            'aiodjango_executor_run_seconds', 'histogram',
+            'Time Django requests ran in a worker thread.',
+            list(self.executor_run.samples('aiodjango_executor_run_seconds')))
+        if app is None:
+            return
+        detector = app.get('stall_detector')
+        if detector is not None:
+            yield (
+                'aiodjango_loop_stalls_total', 'counter',
+                'Times the event loop was blocked by the view responsible.',
+                [('aiodjango_loop_stalls_total', (('view', view), ), count)
+                 for view, count in sorted(detector.stalls.items())])
+            yield (
+                'aiodjango_loop_stall_seconds', 'histogram', 'How long the event loop was blocked.',
+                list(detector.durations.samples('aiodjango_loop_stall_seconds')))
+        executor = app.get('django_executor')
+        if executor is not None:
+            stats = executor.stats()
+            for key, kind, description in (
+                    ('queued', 'gauge', 'Django calls waiting for a worker thread.'),
+                    ('active', 'gauge', 'Django calls running in a worker thread.'),
+                    ('rejected', 'counter', 'Django calls rejected by a full queue.'),
+                    ('timed_out', 'counter', 'Django calls which waited too long to start.')):
+                name = 'aiodjango_executor_{}'.format(key)
+                if kind == 'counter':
+                    name += '_total'
+                yield name, kind, description, [(name, (), stats[key])]
+        connections = app.get('connections')
+        if connections is not None:
+            stats = connections.stats()
+            yield (
+                'aiodjango_websocket_connections', 'gauge', 'Open websockets by route.',
+                [('aiodjango_websocket_connections', (('route', route or '-'), ), count)
+                 for route, count in sorted(stats['routes'].items(), key=lambda i: str(i[0]))])
+            yield (
+                'aiodjango_websocket_queued_messages', 'gauge',
+                'Messages waiting to be sent to websockets.',
+                [('aiodjango_websocket_queued_messages', (), stats['queued'])])
+            yield (
+                'aiodjango_websocket_dropped_messages_total', 'counter',
+                'Messages dropped for slow websockets.',
+                [('aiodjango_websocket_dropped_messages_total', (), stats['dropped'])])
+            yield (
+                'aiodjango_websocket_evicted_total', 'counter',
+                'Websockets closed for falling behind.',
+                [('aiodjango_websocket_evicted_total', (), stats['evicted'])])
+
+    def render(self, app=None):
+        lines = []
+        for name, kind, description, samples in self.collect(app):
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for sample, labels, value in samples:
+                lines.append('{}{} {}'.format(sample, format_labels(labels), format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+@asyncio.coroutine
+def metrics_view(request):
+    """Serve the application's metrics for Prometheus."""
+
+    text = request.app['metrics'].render(request.app)
+    return web.Response(body=text.encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
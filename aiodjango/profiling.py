@@ -0,0 +1,163 @@
+"""
+Profiles of individual requests written in the pstats format.
+"""
+import asyncio
+import cProfile
+import itertools
+import logging
+import os
+import pstats
+import random
+import re
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core import signing
+
+from .executor import EXECUTOR_PROFILER_KEY
+from .metrics import get_route_name
+
+
+logger = logging.getLogger(__name__)
+
+# Request header carrying a token from make_token to profile the request
+PROFILE_HEADER = 'X-Aiodjango-Profile'
+
+# Seconds a profiling token is accepted for
+TOKEN_MAX_AGE = 60 * 60
+
+SALT = 'aiodjango.profiling'
+
+PROFILE_SUFFIX = '.prof'
+
+
+def make_token():
+    """Signed value for the profiling header."""
+
+    return signing.TimestampSigner(salt=SALT).sign('profile')
+
+
+def check_token(token, max_age=TOKEN_MAX_AGE):
+    try:
+        signing.TimestampSigner(salt=SALT).unsign(token, max_age=max_age)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def clean_route(label):
+    """Route label with only the characters safe in a file name."""
+
+    return re.sub(r'[^A-Za-z0-9_-]+', '_', label).strip('_-') or 'unknown'
+
+
+def get_profile_route(path):
+    """Route a profile was written for from its file name."""
+
+    return os.path.basename(path).split('.', 1)[0]
+
+
+@asyncio.coroutine
+def profile_coroutine(profiler, coro):
+    """Run coro enabling the profiler only while it is executing.
+
+    This drives the coroutine the way ``yield from`` would. Other tasks
+    which run on the loop while it waits aren't included in the profile.
+    """
+
+    value, error = None, None
+    while True:
+        profiler.enable()
+        try:
+            if error is not None:
+                future = coro.throw(error)
+            else:
+                future = coro.send(value)
+        except StopIteration as e:
+            return e.value
+        finally:
+            profiler.disable()
+        try:
+            value, error = (yield future), None
+        except BaseException as e:
+            value, error = None, e
+
+
+def write_profile(path, profilers):
+    """Combine the profilers which recorded anything into a pstats file."""
+
+    stats = None
+    for profiler in profilers:
+        profiler.create_stats()
+        if not profiler.stats:
+            continue
+        if stats is None:
+            stats = pstats.Stats(profiler)
+        else:
+            stats.add(profiler)
+    if stats is None:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    stats.dump_stats(path)
+
+
+class RequestProfiler:
+    """Profiles requests with a valid profiling header or a sample of all requests.
+
+    The coroutine handler is profiled on the loop only while it is executing.
+    The Django call is profiled separately in the worker thread. Both go in
+    one pstats file in the directory, named for the route. The file is written
+    by a background thread.
+    """
+
+    def __init__(self, directory, *, sample_rate=0.0, header=PROFILE_HEADER,
+                 max_age=TOKEN_MAX_AGE):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.header = header
+        self.max_age = max_age
+        self.profiled = 0
+        self._counter = itertools.count()
+        self._writer = ThreadPoolExecutor(1)
+
+    def should_profile(self, request):
+        token = request.headers.get(self.header)
+        if token is not None and check_token(token, self.max_age):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @asyncio.coroutine
+    def middleware(self, app, handler):
+
+        @asyncio.coroutine
+        def profile_request(request):
+            if not self.should_profile(request):
+                return (yield from handler(request))
+            loop_profiler = cProfile.Profile()
+            thread_profiler = cProfile.Profile()
+            request[EXECUTOR_PROFILER_KEY] = thread_profiler
+            try:
+                return (yield from profile_coroutine(loop_profiler, handler(request)))
+            finally:
+                self.save(request, loop_profiler, thread_profiler)
+
+        return profile_request
+
+    def save(self, request, *profilers):
+        self.profiled += 1
+        name = '{}.{}.{}.{}{}'.format(
+            clean_route(get_route_name(request)), int(time.time() * 1000), os.getpid(),
+            next(self._counter), PROFILE_SUFFIX)
+        path = os.path.join(self.directory, name)
+        future = self._writer.submit(write_profile, path, profilers)
+        future.add_done_callback(self._written)
+        return path
+
+    def _written(self, future):
+        error = future.exception()
+        if error is not None:
+            logger.error('Error writing profile', exc_info=error)
+
+    def close(self):
+        self._writer.shutdown(wait=True)
@@ -0,0 +1,249 @@
+"""
+Event driven code reloader for runserver using inotify on Linux.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+
+from django.utils import autoreload
+from django.utils.six.moves import _thread as thread
+
+
+# inotify_add_watch event masks from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+EVENT = struct.Struct('iIII')
+
+# Seconds without further events before a batch of changes is acted on
+DEBOUNCE = 0.1
+
+# Seconds between checks for newly imported modules
+REFRESH_INTERVAL = 1.0
+
+# Files written by editors and tools which never need a reload
+IGNORED_SUFFIXES = ('~', '.swp', '.swx', '.tmp', '.pyc', '.pyo')
+
+
+def get_libc():
+    """libc with the inotify functions or None if they aren't available."""
+
+    if not sys.platform.startswith('linux'):
+        return None
+    name = ctypes.util.find_library('c')
+    if name is None:
+        return None
+    try:
+        libc = ctypes.CDLL(name, use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, 'inotify_init1'):
+        return None
+    return libc
+
+
+def get_stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+def is_ignored(path):
+    name = os.path.basename(path)
+    return name.startswith('.') or name.endswith(IGNORED_SUFFIXES)
+
+
+class InotifyWatcher:
+    """Waits on inotify for changes to the loaded modules and templates.
+
+    The directories holding the files are watched rather than the files
+    themselves so that editors which save by renaming are noticed. Events
+    are only acted on for files which are being watched and whose size or
+    modification time actually changed, or for files in the template
+    directories. The thread blocks in select between events so it uses no
+    CPU while idle.
+    """
+
+    def __init__(self, libc, *, debounce=DEBOUNCE):
+        self._libc = libc
+        self.debounce = debounce
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        self._dirs = {}
+        self._watched = set()
+        self.files = {}
+        self.trees = []
+
+    def close(self):
+        os.close(self.fd)
+
+    def add_dir(self, path):
+        if path in self._watched:
+            return
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd >= 0:
+            self._dirs[wd] = path
+            self._watched.add(path)
+
+    def watch_file(self, path):
+        path = os.path.abspath(path)
+        if path not in self.files:
+            self.add_dir(os.path.dirname(path))
+            self.files[path] = get_stat(path)
+
+    def watch_tree(self, root):
+        """Watch all of the files in a directory such as a template directory."""
+
+        root = os.path.abspath(root)
+        if root not in self.trees:
+            self.trees.append(root)
+        for dirpath, dirnames, filenames in os.walk(root):
+            self.add_dir(dirpath)
+
+    def watch_modules(self, only_new=False):
+        for filename in autoreload.gen_filenames(only_new=only_new):
+            self.watch_file(filename)
+
+    def watch_templates(self):
+        from django.template import engines
+        for engine in engines.all():
+            for path in getattr(engine, 'template_dirs', ()):
+                if os.path.isdir(path):
+                    self.watch_tree(path)
+
+    def in_tree(self, path):
+        return any(path.startswith(root + os.sep) for root in self.trees)
+
+    def read_events(self):
+        """Paths and masks of the pending events."""
+
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise
+        events = []
+        offset = 0
+        while offset + EVENT.size <= len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            directory = self._dirs.get(wd)
+            if directory is not None:
+                path = os.path.join(directory, os.fsdecode(name)) if name else directory
+                events.append((path, mask))
+            elif mask & IN_Q_OVERFLOW:
+                events.append((None, mask))
+        return events
+
+    def classify(self, path, mask):
+        """Type of change for an event or None if it can be ignored."""
+
+        if mask & IN_Q_OVERFLOW:
+            # Events were lost so assume the worst
+            return autoreload.FILE_MODIFIED
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO) and self.in_tree(path):
+                self.watch_tree(path)
+            return None
+        if path in self.files:
+            stat = get_stat(path)
+            if stat == self.files[path]:
+                return None
+            self.files[path] = stat
+            if path.endswith('.mo'):
+                return autoreload.I18N_MODIFIED
+            return autoreload.FILE_MODIFIED
+        if self.in_tree(path) and not is_ignored(path):
+            return autoreload.FILE_MODIFIED
+        return None
+
+    def collect(self):
+        changes = set()
+        for path, mask in self.read_events():
+            change = self.classify(path, mask)
+            if change is not None:
+                changes.add(change)
+        return changes
+
+    def wait(self, timeout=REFRESH_INTERVAL):
+        """Block until files change or the timeout passes.
+
+        Returns FILE_MODIFIED, I18N_MODIFIED or None like Django's code_changed.
+        Events which arrive within the debounce period of each other are
+        treated as a single change.
+        """
+
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return None
+        changes = self.collect()
+        if not changes:
+            return None
+        while select.select([self.fd], [], [], self.debounce)[0]:
+            changes.update(self.collect())
+        if autoreload.FILE_MODIFIED in changes:
+            return autoreload.FILE_MODIFIED
+        return autoreload.I18N_MODIFIED
+
+
+def get_watcher():
+    """Watcher for this platform or None to use Django's reloader."""
+
+    libc = get_libc()
+    if libc is None:
+        return None
+    try:
+        return InotifyWatcher(libc)
+    except OSError:
+        return None
+
+
+def reloader_thread(watcher):
+    autoreload.ensure_echo_on()
+    watcher.watch_modules()
+    watcher.watch_templates()
+    while autoreload.RUN_RELOADER:
+        change = watcher.wait()
+        if change == autoreload.FILE_MODIFIED:
+            sys.exit(3)  # force reload
+        elif change == autoreload.I18N_MODIFIED:
+            autoreload.reset_translations()
+        # Pick up modules imported since the last check
+        watcher.watch_modules(only_new=True)
+
+
+def main(main_func, args=None, kwargs=None):
+    """Run main_func in a child process which is restarted when the code changes.
+
+    Falls back to Django's reloader where inotify isn't available.
+    """
+
+    watcher = None
+    if os.environ.get('RUN_MAIN') == 'true':
+        watcher = get_watcher()
+    if watcher is None:
+        return autoreload.main(main_func, args, kwargs)
+    thread.start_new_thread(main_func, args or (), kwargs or {})
+    try:
+        reloader_thread(watcher)
+    except KeyboardInterrupt:
+        pass
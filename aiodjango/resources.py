@@ -0,0 +1,393 @@
+"""
+Shared connections which are created at startup and closed on shutdown.
+"""
+import asyncio
+import logging
+
+from collections import deque
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds between health checks of the idle connections
+CHECK_INTERVAL = 30.0
+
+# Seconds a single health check may take before the connection is discarded
+CHECK_TIMEOUT = 5.0
+
+
+class PoolClosed(Exception):
+    """Raised when acquiring a connection from a pool which has been closed."""
+
+
+class Resource:
+    """Creates, checks and closes the connections of a pool.
+
+    Subclasses implement create. The class attributes are the defaults for
+    the pool. Shared resources, such as HTTP sessions which are already safe
+    to use concurrently, are handed out to any number of callers at once
+    rather than being leased to one at a time.
+    """
+
+    size = 1
+    shared = False
+
+    # Errors which mean the connection shouldn't be reused
+    errors = (OSError, asyncio.TimeoutError)
+
+    def __init__(self, **options):
+        self.options = options
+
+    @asyncio.coroutine
+    def create(self, loop):
+        raise NotImplementedError()
+
+    @asyncio.coroutine
+    def check(self, connection):
+        """Whether the connection is still usable."""
+
+        return True
+
+    @asyncio.coroutine
+    def close(self, connection):
+        result = connection.close()
+        if asyncio.iscoroutine(result) or isinstance(result, asyncio.Future):
+            yield from result
+
+
+class CallableResource(Resource):
+    """Resource created by calling the FACTORY function or coroutine with the options."""
+
+    def __init__(self, factory, **options):
+        super().__init__(**options)
+        self.factory = import_string(factory) if isinstance(factory, str) else factory
+
+    @asyncio.coroutine
+    def create(self, loop):
+        result = self.factory(**self.options)
+        if asyncio.iscoroutine(result) or isinstance(result, asyncio.Future):
+            result = yield from result
+        return result
+
+
+class ClientSessionResource(Resource):
+    """aiohttp ClientSession for outbound HTTP requests with its own connection pool."""
+
+    shared = True
+
+    @asyncio.coroutine
+    def create(self, loop):
+        from aiohttp import ClientSession
+        return ClientSession(loop=loop, **self.options)
+
+    @asyncio.coroutine
+    def check(self, connection):
+        return not connection.closed
+
+
+class AMQPResource(Resource):
+    """aioamqp connection which is shared to open channels from."""
+
+    shared = True
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._transports = {}
+
+    @asyncio.coroutine
+    def create(self, loop):
+        import aioamqp
+        transport, protocol = yield from aioamqp.connect(loop=loop, **self.options)
+        self._transports[protocol] = transport
+        return protocol
+
+    @asyncio.coroutine
+    def check(self, connection):
+        return connection.is_open
+
+    @asyncio.coroutine
+    def close(self, connection):
+        transport = self._transports.pop(connection, None)
+        try:
+            if connection.is_open:
+                yield from connection.close(timeout=1.0)
+        finally:
+            if transport is not None:
+                transport.close()
+
+
+class RedisResource(Resource):
+    """aioredis connection for commands. Use a separate resource for pub/sub."""
+
+    size = 10
+
+    @asyncio.coroutine
+    def create(self, loop):
+        import aioredis
+        options = dict(self.options)
+        address = options.pop('address', ('localhost', 6379))
+        return (yield from aioredis.create_redis(address, loop=loop, **options))
+
+    @asyncio.coroutine
+    def check(self, connection):
+        if connection.closed:
+            return False
+        yield from connection.ping()
+        return True
+
+
+class Lease:
+    """Context manager which returns the connection to the pool."""
+
+    def __init__(self, pool, connection):
+        self.pool = pool
+        self.connection = connection
+
+    def __enter__(self):
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        broken = exc_value is not None and isinstance(exc_value, self.pool.resource.errors)
+        self.pool.release(self.connection, discard=broken)
+
+
+class ResourcePool:
+    """Connections of a resource limited to size.
+
+    start creates min_size connections up front. Exclusive connections are
+    leased to one caller at a time and callers wait when all size of them
+    are in use. Shared connections are handed out in turn. Idle connections
+    are health checked every check_interval seconds by a background task so
+    acquiring one never waits on a check. Use the pool as
+    ``with (yield from pool) as connection:``.
+    """
+
+    def __init__(self, name, resource, *, size=None, min_size=None, shared=None,
+                 check_interval=CHECK_INTERVAL, check_timeout=CHECK_TIMEOUT, loop=None):
+        self.name = name
+        self.resource = resource
+        self.size = resource.size if size is None else size
+        self.min_size = self.size if min_size is None else min_size
+        self.shared = resource.shared if shared is None else shared
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.loop = loop or asyncio.get_event_loop()
+        self.closed = False
+        self.created = 0
+        self.discarded = 0
+        self._connections = []
+        self._idle = deque()
+        self._creating = 0
+        self._next = 0
+        self._waiters = deque()
+        self._started = None
+        self._monitor = None
+
+    def start(self):
+        """Start creating the connections and return the task doing it."""
+
+        if self._started is None:
+            self._started = self.loop.create_task(self._fill())
+            if self.check_interval:
+                self._monitor = self.loop.create_task(self._check_loop())
+        return self._started
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'connections': len(self._connections),
+            'idle': len(self._connections) if self.shared else len(self._idle),
+            'waiting': len(self._waiters),
+            'created': self.created,
+            'discarded': self.discarded,
+        }
+
+    def __iter__(self):
+        connection = yield from self.acquire()
+        return Lease(self, connection)
+
+    @asyncio.coroutine
+    def acquire(self):
+        if self._started is None:
+            self.start()
+        if not self._started.done():
+            yield from asyncio.shield(self._started, loop=self.loop)
+        while True:
+            if self.closed:
+                raise PoolClosed('The {} pool is closed.'.format(self.name))
+            if self.shared and self._connections:
+                self._next = (self._next + 1) % len(self._connections)
+                return self._connections[self._next]
+            if not self.shared and self._idle:
+                return self._idle.popleft()
+            if len(self._connections) + self._creating < self.size:
+                connection = yield from self._create()
+                return connection
+            waiter = asyncio.Future(loop=self.loop)
+            self._waiters.append(waiter)
+            try:
+                yield from waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+    def release(self, connection, *, discard=False):
+        """Return a leased connection to the pool or discard it if it is broken."""
+
+        if discard or self.closed or connection not in self._connections:
+            self._discard(connection)
+        elif not self.shared:
+            # Most recently used first so the others can be checked and replaced
+            self._idle.appendleft(connection)
+            self._wake()
+
+    def _wake(self):
+        """Wake the next waiter or all of them once there is a shared connection."""
+
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                if not (self.shared and self._connections):
+                    break
+
+    @asyncio.coroutine
+    def _create(self):
+        self._creating += 1
+        try:
+            connection = yield from self.resource.create(self.loop)
+        finally:
+            self._creating -= 1
+            # Let a waiter retry if creating failed or take the shared connection
+            self._wake()
+        if self.closed:
+            yield from self._close(connection)
+            raise PoolClosed('The {} pool is closed.'.format(self.name))
+        self._connections.append(connection)
+        self.created += 1
+        if self.shared:
+            # Every waiter can use the new connection
+            self._wake()
+        return connection
+
+    def _discard(self, connection):
+        if connection in self._connections:
+            self._connections.remove(connection)
+            self.discarded += 1
+        if connection in self._idle:
+            self._idle.remove(connection)
+        self.loop.create_task(self._close(connection))
+        self._wake()
+
+    @asyncio.coroutine
+    def _close(self, connection):
+        try:
+            yield from self.resource.close(connection)
+        except Exception:
+            logger.warning('Error closing %s connection', self.name, exc_info=True)
+
+    @asyncio.coroutine
+    def _fill(self):
+        """Create connections until there are min_size of them."""
+
+        while not self.closed and len(self._connections) + self._creating < self.min_size:
+            try:
+                connection = yield from self._create()
+            except PoolClosed:
+                break
+            except Exception:
+                # Callers will try again when they acquire a connection
+                logger.exception('Error creating %s connection', self.name)
+                break
+            if not self.shared:
+                self._idle.append(connection)
+                self._wake()
+
+    @asyncio.coroutine
+    def _check(self, connection):
+        try:
+            return (yield from asyncio.wait_for(
+                self.resource.check(connection), self.check_timeout, loop=self.loop))
+        except Exception:
+            logger.debug('Health check of %s connection failed', self.name, exc_info=True)
+            return False
+
+    @asyncio.coroutine
+    def check(self):
+        """Discard the idle connections which fail their health check and top up the pool."""
+
+        if self.shared:
+            for connection in list(self._connections):
+                if not (yield from self._check(connection)):
+                    self._discard(connection)
+        else:
+            for connection in list(self._idle):
+                if connection not in self._idle:
+                    continue
+                # Not available while it is checked
+                self._idle.remove(connection)
+                healthy = yield from self._check(connection)
+                self.release(connection, discard=not healthy)
+        yield from self._fill()
+
+    @asyncio.coroutine
+    def _check_loop(self):
+        while not self.closed:
+            yield from asyncio.sleep(self.check_interval, loop=self.loop)
+            yield from self.check()
+
+    @asyncio.coroutine
+    def close(self):
+        self.closed = True
+        if self._monitor is not None:
+            self._monitor.cancel()
+        connections, self._connections = self._connections, []
+        self._idle.clear()
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        for connection in connections:
+            yield from self._close(connection)
+
+
+class Resources(dict):
+    """Pools of the application by name."""
+
+    def start(self):
+        return [pool.start() for pool in self.values()]
+
+    def stats(self):
+        return {name: pool.stats() for name, pool in self.items()}
+
+    @asyncio.coroutine
+    def close(self):
+        for pool in self.values():
+            yield from pool.close()
+
+
+def get_resources(config=None, loop=None):
+    """Pools configured by the AIODJANGO_RESOURCES setting.
+
+    The setting maps names to dictionaries with the dotted path of the
+    BACKEND resource class and the OPTIONS passed to it, like Django's CACHES.
+    A FACTORY function or coroutine can be given instead of a BACKEND.
+    SIZE, MIN_SIZE, SHARED and CHECK_INTERVAL configure the pool.
+    """
+
+    if config is None:
+        config = getattr(settings, 'AIODJANGO_RESOURCES', {})
+    resources = Resources()
+    for name, options in config.items():
+        if 'FACTORY' in options:
+            resource = CallableResource(options['FACTORY'], **options.get('OPTIONS', {}))
+        else:
+            backend = import_string(options['BACKEND'])
+            resource = backend(**options.get('OPTIONS', {}))
+        resources[name] = ResourcePool(
+            name, resource, size=options.get('SIZE'), min_size=options.get('MIN_SIZE'),
+            shared=options.get('SHARED'),
+            check_interval=options.get('CHECK_INTERVAL', CHECK_INTERVAL), loop=loop)
+    return resources
@@ -1,38 +1,293 @@
 import asyncio
 import inspect
+import json
+import logging
+import os
 import re
+import sys
 
+from functools import lru_cache
 from importlib import import_module
+from types import ModuleType
+from urllib.parse import unquote
 
 from django.conf import settings
-from django.contrib.admindocs.views import extract_views_from_urlpatterns
-from django.core.urlresolvers import reverse
+from django.core.urlresolvers import get_script_prefix, reverse
+from django.utils.encoding import force_text
+from django.utils.http import RFC3986_SUBDELIMS, urlquote
+from django.utils.module_loading import import_string
+from django.utils.regex_helper import normalize
 
-from aiohttp.web import DynamicRoute
+from aiohttp import hdrs
+from aiohttp.web import DynamicRoute, UrlDispatcher
+from aiohttp.web_urldispatcher import (
+    UrlMappingMatchInfo, _MethodNotAllowedMatchInfo, _NotFoundMatchInfo)
+
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the layout of the route manifest changes
+MANIFEST_VERSION = 1
+
+# Named groups and back references which need to be renamed when merging patterns
+NAMED_GROUP_RE = re.compile(r'\(\?P([<=])([a-zA-Z_][a-zA-Z0-9_]*)')
+# Numbered back references which merging patterns would renumber
+NUMBERED_REFERENCE_RE = re.compile(r'(?<!\\)(?:\\\\)*\\[1-9]')
+# Characters which end the literal prefix of a pattern
+REGEX_SPECIAL = frozenset('.^$*+?{}[]\\|()')
+REGEX_QUANTIFIERS = frozenset('*+?{')
 
 
 class DjangoRegexRoute(DynamicRoute):
-    """Compatibility shim between routing frameworks."""
+    """Compatibility shim between routing frameworks.
 
-    def __init__(self, method, handler, name, regex, *, expect_handler=None):
+    The pattern is reversed into URL templates when the route is created so
+    building a URL is a string substitution rather than a call to reverse.
+    Built URLs are cached by the script prefix and keyword arguments.
+    """
+
+    def __init__(self, method, handler, name, regex, *, expect_handler=None,
+                 url_cache_size=128):
         if not regex.lstrip('^').startswith('/'):
             regex = '^/' + regex.lstrip('^')
         pattern = re.compile(regex)
         super().__init__(method, handler, name, pattern, None, expect_handler=expect_handler)
+        # Literal % in the pattern need to be escaped for the substitution
+        self._templates = [
+            (template.replace('%', '%%').replace('%%(', '%('), frozenset(params))
+            for template, params in normalize(regex)]
+        self._build_url = lru_cache(maxsize=url_cache_size)(self.build_url)
+
+    @property
+    def pattern(self):
+        return self._pattern
 
     def url(self, query=None, **kwargs):
-        url = reverse(self.name, kwargs=kwargs)
+        prefix = get_script_prefix()
+        # Converted first so that values such as 1 and True which compare
+        # equal but are substituted differently aren't cached together
+        key = tuple(sorted((name, force_text(value)) for name, value in kwargs.items()))
+        url = self._build_url(prefix, key)
         return self._append_query(url, query)
 
+    def build_url(self, prefix, kwargs):
+        """Substitute the text arguments into the first template which matches the pattern."""
+
+        kwargs = dict(kwargs)
+        names = frozenset(kwargs)
+        for template, params in self._templates:
+            if params != names:
+                continue
+            candidate = template % kwargs
+            if self._pattern.match(candidate):
+                # Same quoting and safe characters as Django's reverse
+                url = urlquote(prefix[:-1] + candidate, safe=RFC3986_SUBDELIMS + '/~:@')
+                if url.startswith('//'):
+                    url = '/%2F' + url[2:]
+                return url
+        # Patterns which can't be reversed here are left to Django
+        return reverse(self.name, kwargs=kwargs)
+
     def __repr__(self):
         name = "'" + self.name + "' " if self.name is not None else ""
         return ("<DjangoRegexRoute {name}[{method}] -> {handler!r}"
                 .format(name=name, method=self.method, handler=self.handler))
 
 
+def literal_prefix(pattern):
+    """Leading portion of a compiled pattern which must be matched literally."""
+
+    regex = pattern.pattern
+    if pattern.flags & re.IGNORECASE or '|' in regex:
+        return ''
+    regex = regex.lstrip('^')
+    prefix = []
+    for char in regex:
+        if char in REGEX_SPECIAL:
+            if char in REGEX_QUANTIFIERS and prefix:
+                # The previous character is optional/repeated
+                prefix.pop()
+            break
+        prefix.append(char)
+    return ''.join(prefix)
+
+
+class RouteMatcher:
+    """Match a path against a sequence of routes in a single pass.
+
+    All of the route patterns are merged into one alternation with the
+    named groups of each pattern renamed so they can't collide. Python's
+    regex alternation is ordered so the first matching route wins just as
+    it does when scanning the routes one at a time. A tuple of the literal
+    prefixes of each pattern is used to reject paths which can't match
+    any of the routes without running the regex at all.
+
+    Patterns with numbered back references such as \\1 can't be merged since
+    their groups would be renumbered. Each of them is matched on its own in
+    between the merged patterns of the routes around it.
+    """
+
+    def __init__(self, routes):
+        self.routes = list(routes)
+        self.prefixes = tuple(literal_prefix(route.pattern) for route in self.routes)
+        self.groups = {}
+        # Merged patterns or routes which are matched on their own, in order
+        self.segments = []
+        parts = []
+        for index, route in enumerate(self.routes):
+            if NUMBERED_REFERENCE_RE.search(route.pattern.pattern):
+                self._add_pattern(parts)
+                parts = []
+                self.segments.append((None, route))
+                continue
+            key = '_r{}'.format(index)
+            names = []
+
+            def rename(match):
+                names.append(match.group(2))
+                return '(?P{}{}_{}'.format(match.group(1), key, match.group(2))
+
+            regex = NAMED_GROUP_RE.sub(rename, route.pattern.pattern)
+            if '|' in regex:
+                # Keep the alternatives of the pattern from splitting the merged one
+                regex = '(?:{})'.format(regex)
+            # An empty marker group at the end of each pattern identifies the
+            # route. Groups around the whole patterns would be saved for every
+            # route which is tried and stop the regex engine from skipping
+            # the routes by their first character, so only the group of the
+            # route which matches is entered.
+            parts.append('{}(?P<{}>)'.format(regex, key))
+            group_names = sorted(set(names))
+            self.groups[key] = (
+                route, [('{}_{}'.format(key, name), name) for name in group_names])
+        self._add_pattern(parts)
+
+    def _add_pattern(self, parts):
+        if parts:
+            self.segments.append((re.compile('|'.join(parts)), None))
+
+    def match(self, path):
+        """Return the matching route and its match dictionary or None."""
+
+        if not self.segments or not path.startswith(self.prefixes):
+            return None
+        for pattern, route in self.segments:
+            if pattern is None:
+                match_dict = route.match(path)
+                if match_dict is not None:
+                    return route, match_dict
+                continue
+            match = pattern.match(path)
+            if match is not None:
+                # The marker group of the route always closes last
+                route, names = self.groups[match.lastgroup]
+                return route, {name: match.group(group) for group, name in names}
+        return None
+
+
+class DjangoUrlDispatcher(UrlDispatcher):
+    """URL dispatcher which resolves coroutine views in a single pass.
+
+    Each registered DjangoRegexRoute is compiled into a combined matcher
+    rather than being tried one by one. Any other routes, such as the
+    static files or the WSGI application, are only tried when none of the
+    coroutine views match. This assumes the coroutine views are registered
+    before the rest of the routes as they are in get_aio_application.
+
+    When cache_size is given the matched route for each method and path is
+    kept in a bounded LRU cache so repeated paths skip the regex matching.
+    """
+
+    def __init__(self, *, cache_size=None):
+        super().__init__()
+        self._django_routes = []
+        self._other_routes = []
+        self._matcher = None
+        self._lookup = self.lookup
+        if cache_size:
+            self._lookup = lru_cache(maxsize=cache_size)(self.lookup)
+
+    def register_route(self, route):
+        super().register_route(route)
+        if isinstance(route, DjangoRegexRoute):
+            self._django_routes.append(route)
+        else:
+            self._other_routes.append(route)
+        self.invalidate()
+
+    def invalidate(self):
+        """Discard the compiled matcher and any cached resolutions."""
+
+        self._matcher = None
+        if hasattr(self._lookup, 'cache_clear'):
+            self._lookup.cache_clear()
+
+    def cache_info(self):
+        """Hits, misses and size of the resolution cache or None if disabled."""
+
+        if hasattr(self._lookup, 'cache_info'):
+            return self._lookup.cache_info()
+        return None
+
+    def get_matcher(self):
+        """Compile the registered coroutine routes if needed."""
+
+        if self._matcher is None:
+            try:
+                self._matcher = RouteMatcher(self._django_routes)
+            except re.error:
+                # Patterns which can't be merged use the route by route scan
+                self._matcher = False
+        return self._matcher
+
+    @asyncio.coroutine
+    def resolve(self, request):
+        method = request.method
+        route, match_dict, allowed_methods = self._lookup(method, request.raw_path)
+        if route is not None:
+            return UrlMappingMatchInfo(match_dict, route)
+        if allowed_methods:
+            return _MethodNotAllowedMatchInfo(method, set(allowed_methods))
+        return _NotFoundMatchInfo()
+
+    def lookup(self, method, path):
+        """Find the route, match dictionary and allowed methods for a request."""
+
+        matcher = self.get_matcher()
+        if not matcher:
+            return self._scan(self._urls, method, path)
+        found = matcher.match(path)
+        if found is None:
+            return self._scan(self._other_routes, method, path)
+        route, match_dict = found
+        if route.method == method or route.method == hdrs.METH_ANY:
+            return route, self._unquote(match_dict), None
+        # Let the full scan sort out which methods are allowed
+        return self._scan(self._urls, method, path)
+
+    def _scan(self, routes, method, path):
+        allowed_methods = set()
+        for route in routes:
+            match_dict = route.match(path)
+            if match_dict is None:
+                continue
+            if route.method == method or route.method == hdrs.METH_ANY:
+                return route, self._unquote(match_dict), None
+            allowed_methods.add(route.method)
+        return None, None, frozenset(allowed_methods)
+
+    def _unquote(self, match_dict):
+        return {
+            key: unquote(value) if value is not None else value
+            for key, value in match_dict.items()}
+
+
 def get_aio_routes(patterns=None):
     """Walk the URL patterns to find any coroutine views."""
 
+    # Only needed when walking the patterns rather than using a manifest
+    from django.contrib.admindocs.views import extract_views_from_urlpatterns
+
     if patterns is None:
         urlconf = import_module(settings.ROOT_URLCONF)
         patterns = urlconf.urlpatterns
@@ -42,3 +297,84 @@ def get_aio_routes(patterns=None):
         if asyncio.iscoroutinefunction(func) or inspect.isgeneratorfunction(func):
             routes.append(DjangoRegexRoute('*', func, name, regex))
     return routes
+
+
+def get_urlconf_modules(patterns):
+    """Find the modules of any included URL patterns."""
+
+    for pattern in patterns:
+        if hasattr(pattern, 'url_patterns'):
+            if isinstance(pattern.urlconf_module, ModuleType):
+                yield pattern.urlconf_module
+            yield from get_urlconf_modules(pattern.url_patterns)
+
+
+def build_route_manifest():
+    """Describe the coroutine views in the ROOT_URLCONF for writing to a manifest.
+
+    Along with the import path, regex and name of each view the manifest records
+    the modification times of the URL conf and view modules so that it can be
+    detected when the manifest is out of date.
+    """
+
+    urlconf = import_module(settings.ROOT_URLCONF)
+    modules = {urlconf}
+    modules.update(get_urlconf_modules(urlconf.urlpatterns))
+    routes = []
+    for route in get_aio_routes(urlconf.urlpatterns):
+        handler = route.handler
+        if '<locals>' in handler.__qualname__:
+            raise ValueError('{!r} can not be imported by path.'.format(handler))
+        modules.add(sys.modules[handler.__module__])
+        routes.append({
+            'view': '{}.{}'.format(handler.__module__, handler.__qualname__),
+            'regex': route.pattern.pattern,
+            'name': route.name,
+        })
+    sources = {}
+    for module in modules:
+        filename = getattr(module, '__file__', None)
+        if filename:
+            sources[os.path.abspath(filename)] = os.path.getmtime(filename)
+    return {
+        'version': MANIFEST_VERSION,
+        'urlconf': settings.ROOT_URLCONF,
+        'sources': sources,
+        'routes': routes,
+    }
+
+
+def load_route_manifest(path):
+    """Build the routes listed in a manifest or None if it is missing or stale."""
+
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning('Unable to read route manifest %s: %s', path, e)
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        logger.warning('Route manifest %s is from another version.', path)
+        return None
+    if manifest.get('urlconf') != settings.ROOT_URLCONF:
+        logger.warning('Route manifest %s is for another ROOT_URLCONF.', path)
+        return None
+    for filename, mtime in manifest['sources'].items():
+        try:
+            stale = os.path.getmtime(filename) > mtime
+        except OSError:
+            stale = True
+        if stale:
+            logger.warning('Route manifest %s is out of date with %s.', path, filename)
+            return None
+    routes = []
+    for route in manifest['routes']:
+        try:
+            view = import_string(route['view'])
+        except (ImportError, AttributeError) as e:
+            # Removed or renamed views and views which are attributes of classes
+            logger.warning('Unable to import %s from route manifest %s: %s',
+                           route['view'], path, e)
+            return None
+        routes.append(DjangoRegexRoute('*', view, route['name'], route['regex']))
+    return routes
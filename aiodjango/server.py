@@ -0,0 +1,265 @@
+"""
+Pre-forking server which runs an aiohttp application in several processes.
+"""
+import asyncio
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from django.db import connections
+
+from .accesslog import install_access_log
+from .websockets import RECONNECT_DELAY, drain_websockets
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds given to open connections to finish when a worker stops
+SHUTDOWN_TIMEOUT = 10.0
+
+# Workers which exit sooner than this after starting are restarted with a delay
+MIN_WORKER_LIFETIME = 1.0
+
+# Seconds the new generation has to start before the old one is drained on reload
+RELOAD_GRACE = 1.0
+
+# Environment used to hand the listening socket to the next generation on reload
+LISTEN_FD_ENV = 'AIODJANGO_LISTEN_FD'
+PARENT_PID_ENV = 'AIODJANGO_PARENT_PID'
+
+
+def bind_socket(host, port, *, reuse_port=False, backlog=1024):
+    """Listening socket for the address.
+
+    With reuse_port each worker binds its own socket to the same port and the
+    kernel balances new connections between them. Otherwise the socket is
+    bound once and shared by all of the workers.
+    """
+
+    info = socket.getaddrinfo(
+        host, port, type=socket.SOCK_STREAM, flags=socket.AI_PASSIVE)
+    family, type_, proto, _, address = info[0]
+    sock = socket.socket(family, type_, proto)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(address)
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+def inherit_socket(fd, host, port):
+    """Listening socket passed by the previous generation of the server."""
+
+    family = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0][0]
+    sock = socket.fromfd(fd, family, socket.SOCK_STREAM)
+    os.close(fd)
+    sock.setblocking(False)
+    return sock
+
+
+def supports_reuse_port():
+    return hasattr(socket, 'SO_REUSEPORT')
+
+
+@asyncio.coroutine
+def drain(app, handler, server=None, *, timeout=SHUTDOWN_TIMEOUT,
+          reconnect_delay=RECONNECT_DELAY):
+    """Stop accepting connections and let the open ones finish before finishing the app.
+
+    Websockets are sent a close frame which tells the client to wait a random
+    number of seconds from reconnect_delay before reconnecting so that they
+    don't all reconnect at once. In-flight requests have up to timeout
+    seconds to complete before their connections are closed.
+    """
+
+    if server is not None:
+        server.close()
+        yield from server.wait_closed()
+    closed = drain_websockets(app, reconnect_delay=reconnect_delay)
+    if closed:
+        logger.info("Closing %d websockets", closed)
+    yield from handler.finish_connections(timeout)
+    yield from app.finish()
+
+
+class Worker:
+    """Event loop serving the application in a forked process.
+
+    Once max_requests have been handled the worker stops accepting
+    connections, finishes the open ones and exits so that it is replaced
+    by the supervisor. access_log is the format of the access log written
+    to stdout, if any.
+    """
+
+    def __init__(self, app_factory, sock, *, max_requests=0, shutdown_timeout=SHUTDOWN_TIMEOUT,
+                 loop_factory=asyncio.new_event_loop, access_log=None):
+        self.app_factory = app_factory
+        self.sock = sock
+        self.loop_factory = loop_factory
+        self.access_log = access_log
+        self.max_requests = max_requests
+        self.shutdown_timeout = shutdown_timeout
+        self.requests = 0
+        self.loop = None
+        self._stopping = None
+
+    def run(self):
+        self.loop = self.loop_factory()
+        asyncio.set_event_loop(self.loop)
+        self._stopping = asyncio.Future(loop=self.loop)
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            self.loop.add_signal_handler(signum, self.stop)
+        try:
+            self.loop.run_until_complete(self.serve())
+        finally:
+            self.loop.close()
+
+    @asyncio.coroutine
+    def serve(self):
+        app = self.app_factory()
+        if self.max_requests:
+            # Ahead of the application's own middleware so a profiler stays innermost
+            app.middlewares.insert(0, self.count_requests)
+        if self.access_log is not None:
+            install_access_log(app, log_format=self.access_log)
+        handler = app.make_handler()
+        server = yield from self.loop.create_server(handler, sock=self.sock)
+        try:
+            yield from self._stopping
+        finally:
+            yield from drain(app, handler, server, timeout=self.shutdown_timeout)
+
+    def stop(self):
+        if not self._stopping.done():
+            self._stopping.set_result(None)
+
+    @asyncio.coroutine
+    def count_requests(self, app, handler):
+
+        @asyncio.coroutine
+        def middleware(request):
+            self.requests += 1
+            if self.requests == self.max_requests:
+                logger.info("Worker %d handled %d requests, restarting", os.getpid(), self.requests)
+                self.loop.call_soon(self.stop)
+            return (yield from handler(request))
+
+        return middleware
+
+
+class Supervisor:
+    """Forks the workers and replaces any which exit until told to stop.
+
+    SIGTERM or SIGINT stops the workers gracefully. A second signal kills them.
+    SIGHUP starts a new generation of the server with the same command line,
+    which loads the code again and takes over the listening socket, before
+    the current workers are drained.
+    """
+
+    def __init__(self, app_factory, host, port, *, workers=None, max_requests=0,
+                 reuse_port=None, shutdown_timeout=SHUTDOWN_TIMEOUT,
+                 loop_factory=asyncio.new_event_loop, access_log=None):
+        self.app_factory = app_factory
+        self.loop_factory = loop_factory
+        self.access_log = access_log
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.max_requests = max_requests
+        if reuse_port is None:
+            reuse_port = supports_reuse_port()
+        self.reuse_port = reuse_port
+        self.shutdown_timeout = shutdown_timeout
+        self.sock = None
+        self.children = {}
+        self.stopping = False
+
+    def run(self):
+        inherited = os.environ.pop(LISTEN_FD_ENV, None)
+        parent = os.environ.pop(PARENT_PID_ENV, None)
+        if inherited is not None:
+            self.sock = inherit_socket(int(inherited), self.host, self.port)
+        elif self.reuse_port:
+            # Fail early if the address can't be used rather than in every worker
+            bind_socket(self.host, self.port, reuse_port=True).close()
+        else:
+            self.sock = bind_socket(self.host, self.port)
+        # Workers must open their own database connections
+        connections.close_all()
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+        for _ in range(self.workers):
+            self.spawn()
+        if parent is not None:
+            time.sleep(RELOAD_GRACE)
+            logger.info("Draining previous generation %s", parent)
+            os.kill(int(parent), signal.SIGTERM)
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self.children.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            if os.WIFSIGNALED(status) or os.WEXITSTATUS(status):
+                logger.error("Worker %d exited unexpectedly (status %d)", pid, status)
+            if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                # Avoid spinning when the application can't start
+                time.sleep(MIN_WORKER_LIFETIME)
+            self.spawn()
+        if self.sock is not None:
+            self.sock.close()
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            return pid
+        status = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            # Reloads are handled by the supervisor
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            sock = self.sock or bind_socket(self.host, self.port, reuse_port=True)
+            worker = Worker(
+                self.app_factory, sock,
+                max_requests=self.max_requests, shutdown_timeout=self.shutdown_timeout,
+                loop_factory=self.loop_factory, access_log=self.access_log)
+            worker.run()
+        except Exception:
+            logger.exception("Worker %d failed", os.getpid())
+            status = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    def handle_stop(self, signum, frame):
+        sig = signal.SIGKILL if self.stopping else signal.SIGTERM
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                self.children.pop(pid, None)
+
+    def handle_reload(self, signum, frame):
+        if self.stopping:
+            return
+        env = dict(os.environ)
+        env[PARENT_PID_ENV] = str(os.getpid())
+        pass_fds = ()
+        if self.sock is not None:
+            env[LISTEN_FD_ENV] = str(self.sock.fileno())
+            pass_fds = (self.sock.fileno(), )
+        logger.info("Starting new generation")
+        subprocess.Popen([sys.executable] + sys.argv, env=env, pass_fds=pass_fds)
@@ -0,0 +1,210 @@
+"""
+Server-Sent Events for one-way live updates from coroutine views.
+"""
+import asyncio
+import itertools
+
+from collections import deque
+
+from aiohttp import web
+
+
+# Seconds without events before a comment is sent to keep the connection open
+HEARTBEAT = 15.0
+
+# Default number of events kept for clients resuming with Last-Event-ID
+MAX_HISTORY = 1000
+
+
+class Event:
+    """Single event encoded in the text/event-stream format."""
+
+    __slots__ = ('id', 'data', 'event')
+
+    def __init__(self, data, *, event=None, id=None):
+        self.id = id
+        self.data = data
+        self.event = event
+
+    def encode(self):
+        lines = []
+        if self.event is not None:
+            lines.append('event: {}'.format(self.event))
+        if self.id is not None:
+            lines.append('id: {}'.format(self.id))
+        lines.extend('data: {}'.format(line) for line in str(self.data).splitlines() or [''])
+        return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+def parse_event_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class EventChannel:
+    """Stream of numbered events kept in a bounded replay buffer.
+
+    Clients read from the shared buffer with their own position rather than
+    having a queue each. Those which have fallen further behind than the
+    buffer skip the events they missed.
+    """
+
+    def __init__(self, *, max_history=MAX_HISTORY, loop=None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.last_id = 0
+        self.closed = False
+        self.skipped = 0
+        self._history = deque(maxlen=max_history)
+        self._published = asyncio.Future(loop=self.loop)
+
+    def publish(self, data, *, event=None, id=None):
+        """Add an event and wake the clients waiting for it.
+
+        Ids are numbered from 1 unless given, in which case they must increase.
+        """
+
+        if self.closed:
+            raise RuntimeError('Channel is closed.')
+        if id is None:
+            id = self.last_id + 1
+        elif id <= self.last_id:
+            raise ValueError('Event id {} is not after {}.'.format(id, self.last_id))
+        message = Event(data, event=event, id=id)
+        self._history.append(message)
+        self.last_id = id
+        self._wake()
+        return message
+
+    def close(self):
+        """End the streams of the clients."""
+
+        self.closed = True
+        self._wake()
+
+    def _wake(self):
+        published, self._published = self._published, asyncio.Future(loop=self.loop)
+        published.set_result(None)
+
+    def since(self, last_id):
+        """Buffered events after last_id."""
+
+        if not self._history or last_id >= self.last_id:
+            return []
+        first = self._history[0].id
+        if last_id < first - 1:
+            self.skipped += 1
+            return list(self._history)
+        # Ids are usually contiguous so start looking where the event should be
+        start = max(0, min(len(self._history) - 1, last_id - first + 1))
+        while start > 0 and self._history[start - 1].id > last_id:
+            start -= 1
+        while start < len(self._history) and self._history[start].id <= last_id:
+            start += 1
+        return list(itertools.islice(self._history, start, None))
+
+    def resume_from(self, last_id):
+        """Position to read from for a client which last saw last_id.
+
+        Ids ahead of the channel were handed out by another process or before
+        a restart, so such clients continue from the latest event.
+        """
+
+        return min(last_id, self.last_id)
+
+    @asyncio.coroutine
+    def wait(self, last_id, timeout=None):
+        """Events after last_id waiting up to timeout seconds for the next one."""
+
+        last_id = self.resume_from(last_id)
+        events = self.since(last_id)
+        if events or self.closed:
+            return events
+        try:
+            yield from asyncio.wait_for(
+                asyncio.shield(self._published, loop=self.loop), timeout, loop=self.loop)
+        except asyncio.TimeoutError:
+            return []
+        return self.since(last_id)
+
+
+class EventSourceResponse(web.StreamResponse):
+    """Long lived text/event-stream response.
+
+    Each write waits for the socket to drain so a slow client holds up only
+    its own handler. Comments are sent after heartbeat seconds without events
+    so that proxies don't close an idle connection.
+    """
+
+    def __init__(self, *, heartbeat=HEARTBEAT, retry=None, **kwargs):
+        super().__init__(**kwargs)
+        self.heartbeat = heartbeat
+        self.retry = retry
+        self.last_event_id = None
+        self.content_type = 'text/event-stream'
+        self.charset = 'utf-8'
+        self.headers['Cache-Control'] = 'no-cache'
+        # Stops nginx from buffering the stream
+        self.headers['X-Accel-Buffering'] = 'no'
+
+    @asyncio.coroutine
+    def prepare(self, request):
+        self.last_event_id = parse_event_id(request.headers.get('Last-Event-ID'))
+        resp_impl = yield from super().prepare(request)
+        if self.retry is not None:
+            yield from self._send('retry: {}\n\n'.format(int(self.retry * 1000)).encode('utf-8'))
+        return resp_impl
+
+    @asyncio.coroutine
+    def _send(self, data):
+        self.write(data)
+        yield from self.drain()
+
+    @asyncio.coroutine
+    def send(self, data, *, event=None, id=None):
+        yield from self._send(Event(data, event=event, id=id).encode())
+
+    @asyncio.coroutine
+    def comment(self, text=''):
+        yield from self._send(': {}\n\n'.format(text).encode('utf-8'))
+
+    @asyncio.coroutine
+    def stream(self, channel):
+        """Send the events of the channel until it is closed or the client goes away.
+
+        Clients reconnecting with a Last-Event-ID are sent the events they
+        missed first. Others, and those with an id the channel hasn't reached,
+        only get new events.
+        """
+
+        if self.last_event_id is None:
+            position = channel.last_id
+        else:
+            position = channel.resume_from(self.last_event_id)
+        try:
+            while True:
+                events = yield from channel.wait(position, timeout=self.heartbeat)
+                if events:
+                    yield from self._send(b''.join(event.encode() for event in events))
+                    position = events[-1].id
+                elif channel.closed:
+                    break
+                else:
+                    yield from self.comment()
+        except ConnectionError:
+            # The client disconnected
+            return
+        yield from self.write_eof()
+
+
+@asyncio.coroutine
+def prepare_event_source(request, **kwargs):
+    """Start an event stream response for a coroutine view.
+
+    The keyword arguments are passed to the EventSourceResponse.
+    """
+
+    response = EventSourceResponse(**kwargs)
+    yield from response.prepare(request)
+    return response
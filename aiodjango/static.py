@@ -0,0 +1,181 @@
+"""
+Serving the collected static files from an index built at startup.
+"""
+import asyncio
+import json
+import mimetypes
+import os
+
+from collections import OrderedDict
+from email.utils import formatdate
+
+from aiohttp import hdrs, web
+from aiohttp.multidict import CIMultiDict
+from aiohttp.web_urldispatcher import StaticRoute
+
+
+# Name of the manifest written by ManifestStaticFilesStorage
+MANIFEST_NAME = 'staticfiles.json'
+# Precompressed siblings in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class StaticFile:
+    """Stat details for a single file on disk."""
+
+    __slots__ = ('path', 'size', 'mtime', 'etag')
+
+    def __init__(self, path, suffix=''):
+        stat = os.stat(path)
+        self.path = path
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.etag = '"{:x}-{:x}{}"'.format(int(stat.st_mtime * 1000000), stat.st_size, suffix)
+
+
+class StaticAsset:
+    """A static file along with any precompressed variants."""
+
+    __slots__ = ('content_type', 'encoding', 'immutable', 'files', 'last_modified')
+
+    def __init__(self, path, immutable=False):
+        content_type, encoding = mimetypes.guess_type(path)
+        self.content_type = content_type or 'application/octet-stream'
+        self.encoding = encoding
+        self.immutable = immutable
+        self.files = OrderedDict()
+        for coding, suffix in ENCODINGS:
+            if os.path.isfile(path + suffix):
+                self.files[coding] = StaticFile(path + suffix, '-' + coding)
+        self.files[None] = StaticFile(path)
+        self.last_modified = formatdate(self.files[None].mtime, usegmt=True)
+
+    def negotiate(self, accept_encoding):
+        """Pick the best file for the Accept-Encoding header."""
+
+        if len(self.files) > 1:
+            accepted = accepted_encodings(accept_encoding)
+            for coding, static_file in self.files.items():
+                if coding is None or coding in accepted:
+                    return coding, static_file
+        return None, self.files[None]
+
+
+def accepted_encodings(header):
+    """Content codings listed in an Accept-Encoding header which aren't refused."""
+
+    accepted = set()
+    for part in header.lower().split(','):
+        coding, _, params = part.partition(';')
+        params = params.replace(' ', '')
+        if params.startswith('q=') and not params[2:].strip('0.'):
+            continue
+        accepted.add(coding.strip())
+    return accepted
+
+
+def load_hashed_names(directory):
+    """Names of the files hashed by ManifestStaticFilesStorage."""
+
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    return set(manifest.get('paths', {}).values())
+
+
+def build_index(directory):
+    """Find all of the static files in the directory keyed by their relative URL path."""
+
+    hashed = load_hashed_names(directory)
+    names = set()
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            path = os.path.relpath(os.path.join(root, name), directory)
+            names.add(path.replace(os.sep, '/'))
+    index = {}
+    for name in names:
+        if any(name.endswith(suffix) and name[:-len(suffix)] in names for _, suffix in ENCODINGS):
+            # Precompressed variants are served through the original name
+            continue
+        index[name] = StaticAsset(os.path.join(directory, name), immutable=name in hashed)
+    return index
+
+
+class IndexedStaticRoute(StaticRoute):
+    """Static route which serves files from an index built at startup.
+
+    Requests are answered from the index without touching the filesystem
+    other than to send the file. Precompressed .br and .gz siblings are
+    served when the client accepts them. Files hashed by
+    ManifestStaticFilesStorage are marked as immutable and small files are
+    kept in a bounded in-memory cache. Files added after startup are not
+    served until the application is restarted.
+    """
+
+    def __init__(self, name, prefix, directory, *, cache_max_bytes=16 * 1024 * 1024,
+                 cache_max_file_size=64 * 1024, **kwargs):
+        super().__init__(name, prefix, directory, **kwargs)
+        self.index = build_index(self._directory)
+        self.cache_max_bytes = cache_max_bytes
+        self.cache_max_file_size = cache_max_file_size
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+
+    def get_cached(self, static_file):
+        """Contents of a small file from the memory cache or None for larger files."""
+
+        if static_file.size > self.cache_max_file_size:
+            return None
+        body = self._cache.get(static_file.path)
+        if body is not None:
+            self._cache.move_to_end(static_file.path)
+            return body
+        with open(static_file.path, 'rb') as f:
+            body = f.read()
+        self._cache[static_file.path] = body
+        self._cache_bytes += len(body)
+        while self._cache_bytes > self.cache_max_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= len(evicted)
+        return body
+
+    @asyncio.coroutine
+    def handle(self, request):
+        asset = self.index.get(request.match_info['filename'])
+        if asset is None:
+            raise web.HTTPNotFound()
+        coding, static_file = asset.negotiate(request.headers.get(hdrs.ACCEPT_ENCODING, ''))
+        headers = CIMultiDict()
+        headers[hdrs.ETAG] = static_file.etag
+        headers[hdrs.LAST_MODIFIED] = asset.last_modified
+        if len(asset.files) > 1:
+            headers[hdrs.VARY] = 'Accept-Encoding'
+        if asset.immutable:
+            headers[hdrs.CACHE_CONTROL] = IMMUTABLE_CACHE_CONTROL
+
+        if_none_match = request.headers.get(hdrs.IF_NONE_MATCH)
+        if if_none_match is not None:
+            if if_none_match.strip() == '*' or static_file.etag in if_none_match:
+                raise web.HTTPNotModified(headers=headers)
+        else:
+            modsince = request.if_modified_since
+            if modsince is not None and int(static_file.mtime) <= modsince.timestamp():
+                raise web.HTTPNotModified(headers=headers)
+
+        resp = self._response_factory(headers=headers)
+        resp.content_type = asset.content_type
+        encoding = coding or asset.encoding
+        if encoding:
+            resp.headers[hdrs.CONTENT_ENCODING] = encoding
+        resp.content_length = static_file.size
+        body = self.get_cached(static_file)
+        yield from resp.prepare(request)
+        if body is not None:
+            resp.write(body)
+        else:
+            with open(static_file.path, 'rb') as f:
+                yield from self._sendfile(request, resp, f, static_file.size)
+        return resp
@@ -0,0 +1,145 @@
+"""
+Streaming request and response bodies between the event loop and worker threads.
+"""
+import asyncio
+import io
+
+from concurrent.futures import Future, TimeoutError
+
+
+# Seconds a worker thread waits for a call on the loop before giving up
+LOOP_CALL_TIMEOUT = 60.0
+
+
+def call_in_loop(loop, func, *args, timeout=LOOP_CALL_TIMEOUT):
+    """Run a coroutine function on the loop from a worker thread and wait for the result.
+
+    The call is cancelled and TimeoutError raised after timeout seconds so
+    a worker isn't blocked forever when the loop stops or the client goes
+    away. RuntimeError is raised if the loop is already closed.
+    """
+
+    result = Future()
+    tasks = []
+
+    def done(task):
+        if result.done():
+            return
+        if task.cancelled():
+            result.cancel()
+        elif task.exception() is not None:
+            result.set_exception(task.exception())
+        else:
+            result.set_result(task.result())
+
+    def start():
+        if result.done():
+            return
+        task = loop.create_task(func(*args))
+        task.add_done_callback(done)
+        tasks.append(task)
+
+    def cancel():
+        result.cancel()
+        for task in tasks:
+            task.cancel()
+
+    loop.call_soon_threadsafe(start)
+    try:
+        return result.result(timeout)
+    except TimeoutError:
+        try:
+            loop.call_soon_threadsafe(cancel)
+        except RuntimeError:
+            # The loop has been closed
+            pass
+        raise
+
+
+class StreamingInput:
+    """File-like request body which is read from the socket as it is consumed.
+
+    This is read from a worker thread (as wsgi.input or the Django request
+    stream) and each read is handed off to the event loop. Nothing is read
+    from the socket until the view asks for it and aiohttp pauses the
+    transport when its buffer is full so memory use stays flat no matter how
+    large the body is.
+    """
+
+    def __init__(self, loop, content, chunk_size=64 * 1024):
+        self._loop = loop
+        self._content = content
+        self._chunk_size = chunk_size
+        self._buffer = b''
+
+    def read(self, size=-1):
+        if size is None:
+            size = -1
+        data, self._buffer = self._buffer, b''
+        if size >= 0 and len(data) >= size:
+            data, self._buffer = data[:size], data[size:]
+            return data
+        remaining = size - len(data) if size >= 0 else -1
+        return data + call_in_loop(self._loop, self._read, remaining)
+
+    def readline(self, size=-1):
+        if size is None:
+            size = -1
+        while b'\n' not in self._buffer and (size < 0 or len(self._buffer) < size):
+            if size < 0:
+                data = call_in_loop(self._loop, self._content.readline)
+            else:
+                # Whatever has arrived up to the size the caller asked for
+                data = call_in_loop(self._loop, self._content.read, size - len(self._buffer))
+            if not data:
+                break
+            self._buffer += data
+        end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+        if size >= 0:
+            end = min(end, size)
+        line, self._buffer = self._buffer[:end], self._buffer[end:]
+        return line
+
+    def readlines(self, hint=-1):
+        return list(self)
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                break
+            yield line
+
+    @asyncio.coroutine
+    def _read(self, size):
+        chunks = []
+        while size != 0:
+            chunk = yield from self._content.read(self._chunk_size if size < 0 else size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b''.join(chunks)
+
+
+@asyncio.coroutine
+def get_input(request, loop):
+    """File-like body for the request along with its length.
+
+    Bodies with a Content-Length are streamed. Chunked bodies are buffered
+    since WSGI and Django need to know the length up front.
+    """
+
+    if request.content_length is not None:
+        return StreamingInput(loop, request.content), request.content_length
+    body = yield from request.read()
+    return io.BytesIO(body), len(body)
+
+
+@asyncio.coroutine
+def write_chunk(response, chunk):
+    """Write part of a streamed response and wait for the transport to catch up."""
+
+    response.write(chunk)
+    yield from response.drain()
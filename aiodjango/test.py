@@ -1,5 +1,14 @@
 import asyncio
-from functools import wraps
+from functools import partial, wraps
+
+from django.test import SimpleTestCase
+
+import aiohttp
+
+from aiohttp import hdrs
+from aiohttp.web_urldispatcher import StaticRoute
+
+from .api import get_aio_application
 
 
 def async_test(f):
@@ -12,3 +21,176 @@ def async_test(f):
         loop = asyncio.get_event_loop()
         loop.run_until_complete(future)
     return wrapper
+
+
+class MemoryTransport(asyncio.Transport):
+    """One end of a connection which passes the data to the protocol at the other end.
+
+    Everything is delivered with call_soon so the protocols see the data,
+    end of file and close in the order they happened.
+    """
+
+    def __init__(self, loop, protocol, extra=None):
+        super().__init__(extra)
+        self.loop = loop
+        self.protocol = protocol
+        self.peer = None
+        self._closing = False
+        self._lost = False
+
+    def write(self, data):
+        if data and not self._closing:
+            self.loop.call_soon(self.peer._receive, bytes(data))
+
+    def can_write_eof(self):
+        return True
+
+    def write_eof(self):
+        if not self._closing:
+            self.loop.call_soon(self.peer._receive_eof)
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        pass
+
+    def pause_reading(self):
+        pass
+
+    def resume_reading(self):
+        pass
+
+    def is_closing(self):
+        return self._closing
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        self.loop.call_soon(self._connection_lost)
+        self.loop.call_soon(self.peer._receive_eof)
+        self.loop.call_soon(self.peer.close)
+
+    abort = close
+
+    def _receive(self, data):
+        if not self._lost:
+            self.protocol.data_received(data)
+
+    def _receive_eof(self):
+        if not self._lost:
+            self.protocol.eof_received()
+
+    def _connection_lost(self):
+        if not self._lost:
+            self._lost = True
+            self.protocol.connection_lost(None)
+
+
+def connect_memory(loop, client_protocol, server_protocol):
+    """Connect the protocols with a pair of memory transports."""
+
+    client = MemoryTransport(loop, client_protocol, {
+        'peername': ('127.0.0.1', 80), 'sockname': ('127.0.0.1', 50000)})
+    server = MemoryTransport(loop, server_protocol, {
+        'peername': ('127.0.0.1', 50000), 'sockname': ('127.0.0.1', 80)})
+    client.peer, server.peer = server, client
+    server_protocol.connection_made(server)
+    client_protocol.connection_made(client)
+    return client, client_protocol
+
+
+class MemoryConnector(aiohttp.BaseConnector):
+    """Connector which opens each connection to a request handler in memory."""
+
+    def __init__(self, handler, **kwargs):
+        super().__init__(**kwargs)
+        self.handler = handler
+
+    @asyncio.coroutine
+    def _create_connection(self, req):
+        return connect_memory(self._loop, self._factory(), self.handler())
+
+
+class TestClient:
+    """Client for making requests to an application without any sockets.
+
+    Requests go through the same HTTP parsing, routing, middlewares and
+    handlers as they would from a real client. The responses are read before
+    they are returned. Static files are sent without sendfile because there
+    is no socket to send them to.
+    """
+
+    host = 'testserver'
+
+    def __init__(self, app, **kwargs):
+        self.app = app
+        self.loop = app.loop
+        for route in app.router.routes():
+            if isinstance(route, StaticRoute):
+                route._sendfile = route._sendfile_fallback
+        # Keep alive is off because it sets socket options
+        self.handler = app.make_handler(keep_alive_on=False, **kwargs)
+        self.session = aiohttp.ClientSession(
+            connector=MemoryConnector(self.handler, loop=self.loop), loop=self.loop)
+        self.get = partial(self.request, hdrs.METH_GET)
+        self.head = partial(self.request, hdrs.METH_HEAD)
+        self.post = partial(self.request, hdrs.METH_POST)
+        self.put = partial(self.request, hdrs.METH_PUT)
+        self.patch = partial(self.request, hdrs.METH_PATCH)
+        self.delete = partial(self.request, hdrs.METH_DELETE)
+        self.options = partial(self.request, hdrs.METH_OPTIONS)
+
+    def url(self, path):
+        return 'http://{}{}'.format(self.host, path)
+
+    @asyncio.coroutine
+    def request(self, method, path, **kwargs):
+        response = yield from self.session.request(method, self.url(path), **kwargs)
+        yield from response.read()
+        return response
+
+    @asyncio.coroutine
+    def ws_connect(self, path, **kwargs):
+        return (yield from self.session.ws_connect(self.url(path), **kwargs))
+
+    @asyncio.coroutine
+    def close(self):
+        """Close the connections and finish the application."""
+
+        self.session.close()
+        yield from self.handler.finish_connections(1.0)
+        yield from self.app.finish()
+
+
+class AioTestCase(SimpleTestCase):
+    """Tests which make requests to a new application on a new event loop.
+
+    The loop is the default loop during the test so async_test runs on it.
+    Each test has its own application, executors and connections and
+    nothing listens on a port, so the tests can run in parallel.
+    """
+
+    # Keyword arguments for get_aio_application
+    app_kwargs = {}
+
+    def setUp(self):
+        super().setUp()
+        self._default_loop = asyncio.get_event_loop()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(self._close_loop)
+        self.app = self.get_application()
+        self.aio_client = TestClient(self.app)
+        self.addCleanup(self._close_client)
+
+    def get_application(self):
+        return get_aio_application(**self.app_kwargs)
+
+    def _close_client(self):
+        self.loop.run_until_complete(self.aio_client.close())
+
+    def _close_loop(self):
+        self.loop.close()
+        asyncio.set_event_loop(self._default_loop)
@@ -0,0 +1,137 @@
+import asyncio
+import io
+import json
+import threading
+import time
+
+from unittest.mock import Mock
+
+from django.test import SimpleTestCase
+
+from aiohttp import web
+from aiohttp.multidict import CIMultiDict
+
+from .. import accesslog
+from ..executor import EXECUTOR_WAIT_KEY
+from ..routing import DjangoRegexRoute
+from ..test import async_test
+
+
+class FakeRequest(dict):
+    """aiohttp request with the attributes used by the access log."""
+
+    def __init__(self, path='/foo/?a=1', route=None):
+        super().__init__()
+        self.method = 'GET'
+        self.path_qs = path
+        self.version = (1, 1)
+        self.headers = CIMultiDict({'User-Agent': 'test'})
+        self.transport = Mock()
+        self.transport.get_extra_info.return_value = ('10.0.0.1', 54321)
+        self.match_info = Mock(route=route)
+
+
+def wait_for(condition, timeout=5):
+    """Wait for the writer thread."""
+
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+class AccessRecordTestCase(SimpleTestCase):
+    """Formatting the captured values."""
+
+    def test_text(self):
+        """Text records follow the runserver format."""
+        record = accesslog.AccessRecord(FakeRequest(), 200, 12, 0.0015)
+        line = record.as_text()
+        self.assertTrue(line.startswith('['))
+        self.assertTrue(line.endswith('"GET /foo/?a=1 HTTP/1.1" 200 12 1500'))
+
+    def test_json(self):
+        """JSON records include the route type and executor wait."""
+        route = Mock(spec=['name'])
+        route.name = 'wsgi-app'
+        request = FakeRequest(route=route)
+        request[EXECUTOR_WAIT_KEY] = 0.002
+        record = json.loads(accesslog.AccessRecord(request, 404, None, 0.01).as_json())
+        self.assertEqual(record['route'], 'wsgi')
+        self.assertEqual(record['executor_wait_ms'], 2.0)
+        self.assertEqual(record['status'], 404)
+        self.assertEqual(record['remote'], '10.0.0.1')
+        self.assertEqual(record['user_agent'], 'test')
+        self.assertIsNone(record['length'])
+
+    def test_route_type(self):
+        """Coroutine views, static files and unmatched requests are told apart."""
+        route = DjangoRegexRoute('GET', Mock(), 'test', r'^foo/$')
+        self.assertEqual(accesslog.get_route_type(FakeRequest(route=route)), 'async')
+        static = web.StaticRoute('static', '/static/', '/tmp/')
+        self.assertEqual(accesslog.get_route_type(FakeRequest(route=static)), 'static')
+        self.assertEqual(accesslog.get_route_type(FakeRequest()), '-')
+
+
+class AccessLogTestCase(SimpleTestCase):
+    """Writing records from the background thread."""
+
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.access_log = accesslog.AccessLog(self.stream, flush_interval=0.01)
+        self.addCleanup(self.access_log.close)
+
+    @async_test
+    def test_middleware(self):
+        """Responses are logged and returned."""
+        response = web.Response(body=b'ok')
+
+        @asyncio.coroutine
+        def handler(request):
+            return response
+
+        middleware = yield from self.access_log.middleware(Mock(), handler)
+        result = yield from middleware(FakeRequest())
+        self.assertIs(result, response)
+        self.access_log.close()
+        self.assertIn('"GET /foo/?a=1 HTTP/1.1" 200 2', self.stream.getvalue())
+
+    @async_test
+    def test_http_exception(self):
+        """HTTP exceptions are logged with their status."""
+
+        @asyncio.coroutine
+        def handler(request):
+            raise web.HTTPNotFound()
+
+        middleware = yield from self.access_log.middleware(Mock(), handler)
+        with self.assertRaises(web.HTTPNotFound):
+            yield from middleware(FakeRequest())
+        self.access_log.close()
+        self.assertIn('" 404 ', self.stream.getvalue())
+
+    def test_batches(self):
+        """Queued records are written and flushed together."""
+        for _ in range(3):
+            self.access_log.log(FakeRequest(), 200, 0, 0.001)
+        self.access_log.close()
+        self.assertEqual(len(self.stream.getvalue().splitlines()), 3)
+        self.assertEqual(self.access_log.stats()['written'], 3)
+
+    def test_dropped(self):
+        """Records are dropped rather than blocking when the queue is full."""
+        blocked = threading.Event()
+        stream = Mock()
+        stream.write.side_effect = lambda data: blocked.wait(5)
+        access_log = accesslog.AccessLog(stream, max_queue=1, flush_interval=0.01)
+        self.addCleanup(access_log.close)
+        self.addCleanup(blocked.set)
+        access_log.log(FakeRequest(), 200, 0, 0.001)
+        wait_for(lambda: stream.write.called)
+        access_log.log(FakeRequest(), 200, 0, 0.001)
+        access_log.log(FakeRequest(), 200, 0, 0.001)
+        self.assertEqual(access_log.stats()['dropped'], 1)
+
+    def test_unknown_format(self):
+        """Only the known formats are allowed."""
+        with self.assertRaises(ValueError):
+            accesslog.AccessLog(log_format='xml')
@@ -1,3 +1,5 @@
+import inspect
+import shutil
 import tempfile
 
 from unittest.mock import patch, Mock
@@ -6,6 +8,7 @@ from django.core.urlresolvers import reverse
 from django.test import override_settings, SimpleTestCase
 
 from .. import api
+from ..metrics import metrics_view
 from ..test import async_test
 
 # Empty set of URL patterns
@@ -71,9 +74,133 @@ class GetApplicationTestCase(SimpleTestCase):
     @async_test
     def test_static_route(self):
         """Optionally add the routing of static files."""
-        with self.settings(STATIC_URL='/static/', STATIC_ROOT=tempfile.gettempdir()):
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        with self.settings(STATIC_URL='/static/', STATIC_ROOT=static_root):
             app = api.get_aio_application(include_static=True)
             self.assertEqual(len(app.router.routes()), 3)
             request = Mock(method='GET', raw_path='/static/')
             match = yield from app.router.resolve(request)
             self.assertEqual(match.route.name, 'static')
+
+    def test_route_cache(self):
+        """Optionally cache the resolved routes."""
+        app = api.get_aio_application(route_cache_size=10)
+        self.assertEqual(app.router.cache_info().maxsize, 10)
+
+    def test_route_manifest(self):
+        """Routes are loaded from the manifest when given."""
+        with patch('aiodjango.api.load_route_manifest') as mock_load:
+            with patch('aiodjango.api.get_aio_routes') as mock_routes:
+                mock_load.return_value = []
+                app = api.get_aio_application(route_manifest='routes.json')
+                mock_load.assert_called_with('routes.json')
+                self.assertFalse(mock_routes.called)
+        self.assertEqual(len(app.router.routes()), 1)
+
+    def test_stale_route_manifest(self):
+        """Fall back to walking the URL patterns if the manifest can't be used."""
+        with patch('aiodjango.api.load_route_manifest') as mock_load:
+            mock_load.return_value = None
+            app = api.get_aio_application(route_manifest='routes.json')
+        self.assertEqual(len(app.router.routes()), 2)
+
+    def test_executor_options(self):
+        """Thread pool options are passed to the executor."""
+        app = api.get_aio_application(workers=2, max_queue=10, queue_timeout=5)
+        pool = app['django_executor']
+        self.assertEqual(pool.max_workers, 2)
+        self.assertEqual(pool.max_queue, 10)
+        self.assertEqual(pool.queue_timeout, 5)
+
+    def test_native_handler(self):
+        """Django views can be run without the WSGI layer."""
+        with patch('aiodjango.api.get_wsgi_application') as mock_wsgi:
+            with patch('aiodjango.api.DjangoHandler') as mock_handler:
+                api.get_aio_application(native_handler=True)
+                self.assertFalse(mock_wsgi.called)
+                self.assertTrue(mock_handler.called)
+
+    def test_micro_cache(self):
+        """Django responses are buffered and cached when micro_cache_ttl is given."""
+        app = api.get_aio_application(micro_cache_ttl=2)
+        micro_cache = app['micro_cache']
+        self.assertEqual(micro_cache.ttl, 2)
+        route = app.router['wsgi-app']
+        # The router wraps the callable instance in a coroutine
+        self.assertIs(inspect.unwrap(route.handler), micro_cache)
+
+    def test_micro_cache_disabled(self):
+        """Responses are not cached by default."""
+        app = api.get_aio_application()
+        self.assertNotIn('micro_cache', app)
+
+    def test_session_resolver(self):
+        """Sessions for coroutine views are cached for session_cache_ttl."""
+        app = api.get_aio_application(session_cache_ttl=10)
+        self.assertEqual(app['session_resolver'].ttl, 10)
+
+    @async_test
+    def test_session_resolver_closed(self):
+        """The session resolver stops listening for logouts when the application finishes."""
+        app = api.get_aio_application()
+        resolver = app['session_resolver']
+        with patch.object(resolver, 'close', wraps=resolver.close) as close:
+            yield from app.finish()
+        self.assertTrue(close.called)
+
+    def test_broadcast_hub(self):
+        """The broadcast hub uses the given backend."""
+        backend = Mock()
+        app = api.get_aio_application(broadcast_backend=backend)
+        hub = app['broadcast']
+        self.assertIs(hub.backend, backend)
+        self.assertEqual(backend.deliver, hub.deliver)
+
+    def test_websocket_connections(self):
+        """Websocket clients get queues of the given size."""
+        app = api.get_aio_application(websocket_queue_size=5, websocket_overflow='drop')
+        connections = app['connections']
+        self.assertEqual(connections.max_queue, 5)
+        self.assertEqual(connections.overflow, 'drop')
+
+    def test_resources(self):
+        """The given resource pools are started with the application."""
+        pool = Mock()
+        app = api.get_aio_application(resources={'redis': pool})
+        self.assertIs(app['resources']['redis'], pool)
+        self.assertTrue(pool.start.called)
+
+    def test_metrics(self):
+        """Requests are instrumented and the metrics are served at metrics_path."""
+        app = api.get_aio_application(metrics_path='/metrics')
+        self.assertIn(app['metrics'].middleware, app.middlewares)
+        self.assertEqual(app.router['aiodjango-metrics'].handler, metrics_view)
+
+    def test_metrics_disabled(self):
+        """Instrumentation can be turned off."""
+        app = api.get_aio_application(metrics=False)
+        self.assertNotIn('metrics', app)
+        self.assertEqual(app.middlewares, [])
+
+    def test_stall_detector(self):
+        """The stall detector is started when a threshold is given."""
+        with patch('aiodjango.api.StallDetector') as detector:
+            app = api.get_aio_application(stall_threshold=0.2)
+        self.assertIs(app['stall_detector'], detector.return_value)
+        self.assertEqual(detector.call_args[1]['threshold'], 0.2)
+        self.assertTrue(detector.return_value.start.called)
+
+    def test_profiler(self):
+        """Requests are profiled by the innermost middleware when a directory is given."""
+        app = api.get_aio_application(profile_dir='/tmp/profiles', profile_rate=0.01)
+        profiler = app['profiler']
+        self.addCleanup(profiler.close)
+        self.assertEqual(profiler.directory, '/tmp/profiles')
+        self.assertEqual(profiler.sample_rate, 0.01)
+        self.assertEqual(app.middlewares[-1], profiler.middleware)
+
+    def test_profiler_disabled(self):
+        """Requests aren't profiled by default."""
+        app = api.get_aio_application()
+        self.assertNotIn('profiler', app)
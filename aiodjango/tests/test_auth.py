@@ -0,0 +1,159 @@
+import asyncio
+
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.auth.signals import user_logged_out
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import SimpleTestCase, TransactionTestCase
+
+from aiohttp import web
+
+from .. import auth, db
+from ..test import async_test
+
+
+class FakeRequest(dict):
+    """aiohttp requests are dictionaries with the app and cookies as attributes."""
+
+    def __init__(self, app, session_key=None):
+        super().__init__()
+        self.app = app
+        self.cookies = {'sessionid': session_key} if session_key else {}
+
+
+class ResolverMixin:
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.executor = db.DatabaseExecutor(1)
+        self.addCleanup(self.executor.shutdown)
+        self.app = web.Application(loop=self.loop)
+        self.app['db_executor'] = self.executor
+        self.resolver = auth.SessionResolver(self.app)
+        self.addCleanup(self.resolver.close)
+        self.app['session_resolver'] = self.resolver
+
+
+class SessionResolverTestCase(ResolverMixin, SimpleTestCase):
+    """Caching and batching of session lookups."""
+
+    def setUp(self):
+        super().setUp()
+        patcher = patch('aiodjango.auth.load_auth', return_value=({'foo': 'bar'}, 'user'))
+        self.load_auth = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @async_test
+    def test_no_session(self):
+        """Requests without a session cookie get an anonymous user."""
+        user = yield from auth.get_user(FakeRequest(self.app))
+        self.assertIsInstance(user, AnonymousUser)
+        self.assertFalse(self.load_auth.called)
+
+    @async_test
+    def test_lazy(self):
+        """The session is only loaded once for a request and only when used."""
+        request = FakeRequest(self.app, 'abc')
+        self.assertFalse(self.load_auth.called)
+        session = yield from auth.get_session(request)
+        user = yield from auth.get_user(request)
+        self.assertEqual(session, {'foo': 'bar'})
+        self.assertEqual(user, 'user')
+        self.load_auth.assert_called_once_with('abc')
+
+    @async_test
+    def test_cached(self):
+        """Requests with the same session reuse the lookup until it expires."""
+        yield from auth.get_user(FakeRequest(self.app, 'abc'))
+        yield from auth.get_user(FakeRequest(self.app, 'abc'))
+        self.assertEqual(self.load_auth.call_count, 1)
+        self.assertEqual(self.resolver.stats()['hits'], 1)
+        self.resolver._cache['abc'].expires = self.loop.time() - 1
+        yield from auth.get_user(FakeRequest(self.app, 'abc'))
+        self.assertEqual(self.load_auth.call_count, 2)
+
+    @async_test
+    def test_collapsed(self):
+        """Concurrent requests with the same session share a single lookup."""
+        users = yield from asyncio.gather(
+            *(auth.get_user(FakeRequest(self.app, 'abc')) for _ in range(3)), loop=self.loop)
+        self.assertEqual(users, ['user'] * 3)
+        self.assertEqual(self.load_auth.call_count, 1)
+        self.assertEqual(self.resolver.stats()['collapsed'], 2)
+
+    @async_test
+    def test_collapsed_failure(self):
+        """When the shared lookup fails one of the waiting requests tries again."""
+        calls = []
+
+        def load_auth(session_key):
+            calls.append(session_key)
+            if len(calls) == 1:
+                raise RuntimeError('Database went away')
+            return {'foo': 'bar'}, 'user'
+
+        self.load_auth.side_effect = load_auth
+        results = yield from asyncio.gather(
+            *(self.resolver.resolve('abc') for _ in range(3)),
+            loop=self.loop, return_exceptions=True)
+        # The first lookup fails, whichever request it was for
+        errors = [result for result in results if isinstance(result, RuntimeError)]
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(
+            [result.user for result in results if result not in errors], ['user', 'user'])
+        self.assertEqual(self.load_auth.call_count, 2)
+        self.assertEqual(self.resolver._pending, {})
+
+    @async_test
+    def test_logout(self):
+        """Logging out drops the cached session."""
+        yield from auth.get_user(FakeRequest(self.app, 'abc'))
+        request = SimpleNamespace(session=Mock(session_key='abc'))
+        self.resolver._logged_out(sender=User, request=request, user=Mock())
+        yield from asyncio.sleep(0, loop=self.loop)
+        self.assertNotIn('abc', self.resolver._cache)
+
+    def test_closed(self):
+        """Closed resolvers no longer receive the logout signal."""
+        self.resolver.close()
+        with patch.object(self.resolver, 'invalidate') as invalidate:
+            user_logged_out.send(
+                sender=User, request=SimpleNamespace(session=Mock(session_key='abc')), user=None)
+        self.assertFalse(invalidate.called)
+
+    def test_closed_loop(self):
+        """Logouts are ignored once the application's loop is closed."""
+        loop = asyncio.new_event_loop()
+        loop.close()
+        resolver = auth.SessionResolver(web.Application(loop=loop))
+        self.addCleanup(resolver.close)
+        request = SimpleNamespace(session=Mock(session_key='abc'))
+        resolver._logged_out(sender=User, request=request, user=Mock())
+
+
+class LoadAuthTestCase(ResolverMixin, TransactionTestCase):
+    """Loading the session and user from the database."""
+
+    @async_test
+    def test_logged_in(self):
+        """The user is found from the session created on login."""
+        user = User.objects.create_user('test')
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        request = FakeRequest(self.app, session.session_key)
+        result = yield from auth.get_user(request)
+        self.assertEqual(result, user)
+        data = yield from auth.get_session(request)
+        self.assertEqual(data[SESSION_KEY], str(user.pk))
+
+    @async_test
+    def test_unknown_session(self):
+        """Unknown session keys resolve to an anonymous user."""
+        user = yield from auth.get_user(FakeRequest(self.app, 'unknown'))
+        self.assertIsInstance(user, AnonymousUser)
@@ -0,0 +1,340 @@
+import asyncio
+
+from unittest.mock import Mock, patch
+
+from django.test import override_settings, SimpleTestCase
+
+from .. import broadcast
+from ..test import async_test
+
+
+class StubBackend(broadcast.Backend):
+    """Backend which records the upstream calls."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = []
+
+    @asyncio.coroutine
+    def connect(self):
+        self.calls.append(('connect', ))
+
+    @asyncio.coroutine
+    def subscribe(self, topic):
+        self.calls.append(('subscribe', topic))
+
+    @asyncio.coroutine
+    def unsubscribe(self, topic):
+        self.calls.append(('unsubscribe', topic))
+
+    @asyncio.coroutine
+    def publish(self, topic, message):
+        self.calls.append(('publish', topic, message))
+
+
+@asyncio.coroutine
+def settle():
+    """Let the callbacks scheduled by the memory broker run."""
+
+    for _ in range(3):
+        yield from asyncio.sleep(0)
+
+
+class BroadcastHubTestCase(SimpleTestCase):
+    """Fanning out messages to local subscribers."""
+
+    def setUp(self):
+        self.backend = StubBackend()
+        self.hub = broadcast.BroadcastHub(self.backend)
+
+    @async_test
+    def test_single_upstream_subscription(self):
+        """The backend is subscribed once per topic regardless of the subscribers."""
+        for _ in range(3):
+            yield from self.hub.subscribe('room', Mock())
+        self.assertEqual(self.backend.calls, [('connect', ), ('subscribe', 'room')])
+        self.assertEqual(self.hub.stats()['subscribers'], 3)
+
+    @async_test
+    def test_concurrent_subscribe(self):
+        """Concurrent subscribers to a new topic share the upstream subscription."""
+        yield from asyncio.gather(*[self.hub.subscribe('room', Mock()) for _ in range(3)])
+        self.assertEqual(self.backend.calls.count(('subscribe', 'room')), 1)
+
+    @async_test
+    def test_last_unsubscribe(self):
+        """The backend is unsubscribed when the last local subscriber leaves."""
+        first, second = Mock(), Mock()
+        yield from self.hub.subscribe('room', first)
+        yield from self.hub.subscribe('room', second)
+        yield from self.hub.unsubscribe('room', first)
+        self.assertNotIn(('unsubscribe', 'room'), self.backend.calls)
+        yield from self.hub.unsubscribe('room', second)
+        self.assertIn(('unsubscribe', 'room'), self.backend.calls)
+        self.assertEqual(self.hub.stats()['topics'], 0)
+
+    @async_test
+    def test_deliver(self):
+        """Upstream messages are passed to each local subscriber of the topic."""
+        first, second, other = Mock(), Mock(), Mock()
+        yield from self.hub.subscribe('room', first)
+        yield from self.hub.subscribe('room', second)
+        yield from self.hub.subscribe('other', other)
+        self.hub.deliver('room', 'hello')
+        first.assert_called_once_with('hello')
+        second.assert_called_once_with('hello')
+        self.assertFalse(other.called)
+        self.assertEqual(self.hub.stats()['delivered'], 2)
+
+    @async_test
+    def test_failing_subscriber(self):
+        """Subscribers which raise are dropped without affecting the others."""
+        failing, working = Mock(side_effect=RuntimeError), Mock()
+        yield from self.hub.subscribe('room', failing)
+        yield from self.hub.subscribe('room', working)
+        self.hub.deliver('room', 'hello')
+        self.hub.deliver('room', 'again')
+        self.assertEqual(failing.call_count, 1)
+        self.assertEqual(working.call_count, 2)
+        self.assertEqual(self.hub.stats()['failed'], 1)
+
+    @async_test
+    def test_last_subscriber_fails(self):
+        """The backend is unsubscribed once the last subscriber has failed."""
+        yield from self.hub.subscribe('room', Mock(side_effect=RuntimeError))
+        self.hub.deliver('room', 'hello')
+        yield from settle()
+        self.assertIn(('unsubscribe', 'room'), self.backend.calls)
+
+    @async_test
+    def test_publish(self):
+        """Messages are published through the backend."""
+        yield from self.hub.publish('room', 'hello')
+        self.assertEqual(self.backend.calls, [('connect', ), ('publish', 'room', 'hello')])
+
+    @async_test
+    def test_connect_retry(self):
+        """A failed connection is retried on the next call."""
+        self.backend.connect = Mock(side_effect=[OSError, asyncio.coroutine(lambda: None)()])
+        with self.assertRaises(OSError):
+            yield from self.hub.publish('room', 'hello')
+        yield from self.hub.publish('room', 'hello')
+        self.assertEqual(self.backend.connect.call_count, 2)
+        self.assertIn(('publish', 'room', 'hello'), self.backend.calls)
+
+    @async_test
+    def test_connection_lost(self):
+        """A lost connection is logged, reconnected and subscribed to again."""
+        yield from self.hub.subscribe('room', Mock())
+        with self.assertLogs('aiodjango.broadcast', 'ERROR'):
+            self.backend.lost(OSError('Connection reset'))
+        self.assertIsNone(self.hub._connected)
+        yield from self.hub._reconnecting
+        self.assertEqual(self.backend.calls, [
+            ('connect', ), ('subscribe', 'room'), ('connect', ), ('subscribe', 'room')])
+        self.assertEqual(self.hub.stats()['reconnects'], 1)
+
+    @async_test
+    def test_reconnect_retry(self):
+        """Reconnecting is retried until the backend is available."""
+        yield from self.hub.subscribe('room', Mock())
+        self.backend.connect = Mock(side_effect=[OSError, asyncio.coroutine(lambda: None)()])
+        with patch.object(broadcast, 'RECONNECT_DELAY', 0):
+            with self.assertLogs('aiodjango.broadcast', 'WARNING') as logs:
+                self.backend.lost()
+                yield from self.hub._reconnecting
+        self.assertEqual(self.backend.connect.call_count, 2)
+        self.assertIn('Unable to reconnect', logs.output[-1])
+        self.assertEqual(self.backend.calls.count(('subscribe', 'room')), 2)
+
+    @async_test
+    def test_lost_after_close(self):
+        """Connections dropped by closing the hub aren't reconnected."""
+        yield from self.hub.subscribe('room', Mock())
+        yield from self.hub.close()
+        self.backend.lost()
+        self.assertIsNone(self.hub._reconnecting)
+
+
+class MemoryBackendTestCase(SimpleTestCase):
+    """Delivering messages between hubs sharing a memory broker."""
+
+    @async_test
+    def test_between_hubs(self):
+        """Messages published by one hub reach the subscribers of another."""
+        broker = broadcast.MemoryBroker()
+        first = broadcast.BroadcastHub(broadcast.MemoryBackend(broker))
+        second = broadcast.BroadcastHub(broadcast.MemoryBackend(broker))
+        first_subscriber, second_subscriber = Mock(), Mock()
+        yield from first.subscribe('room', first_subscriber)
+        yield from second.subscribe('room', second_subscriber)
+        yield from first.publish('room', 'hello')
+        yield from settle()
+        first_subscriber.assert_called_once_with('hello')
+        second_subscriber.assert_called_once_with('hello')
+
+    @async_test
+    def test_close(self):
+        """Closed backends no longer receive messages."""
+        broker = broadcast.MemoryBroker()
+        hub = broadcast.BroadcastHub(broadcast.MemoryBackend(broker))
+        subscriber = Mock()
+        yield from hub.subscribe('room', subscriber)
+        yield from hub.close()
+        yield from broadcast.MemoryBackend(broker).publish('room', 'hello')
+        yield from settle()
+        self.assertFalse(subscriber.called)
+
+
+class GetBackendTestCase(SimpleTestCase):
+    """Configuring the backend with the AIODJANGO_BROADCAST setting."""
+
+    def test_default(self):
+        """The memory backend is used by default."""
+        self.assertIsInstance(broadcast.get_backend(), broadcast.MemoryBackend)
+
+    @override_settings(AIODJANGO_BROADCAST={
+        'BACKEND': 'aiodjango.broadcast.RedisBackend',
+        'OPTIONS': {'address': ('redis', 6380), 'channel_prefix': 'test.'},
+    })
+    def test_configured(self):
+        """The backend class is imported and given the options."""
+        backend = broadcast.get_backend()
+        self.assertIsInstance(backend, broadcast.RedisBackend)
+        self.assertEqual(backend.address, ('redis', 6380))
+        self.assertEqual(backend.channel_prefix, 'test.')
+
+    @override_settings(AIODJANGO_BROADCAST={
+        'BACKEND': 'aiodjango.broadcast.AMQPBackend',
+        'OPTIONS': {'host': 'rabbit', 'exchange_prefix': 'test.'},
+    })
+    def test_amqp_connection_options(self):
+        """Options other than the exchange prefix are passed to the AMQP connection."""
+        backend = broadcast.get_backend()
+        self.assertEqual(backend.exchange_prefix, 'test.')
+        self.assertEqual(backend.connection_kwargs, {'host': 'rabbit'})
+
+
+class AMQPBackendTestCase(SimpleTestCase):
+    """Noticing when the AMQP connection drops."""
+
+    def setUp(self):
+        self.backend = broadcast.AMQPBackend()
+        self.backend.connection_lost = Mock()
+        self.backend._protocol = Mock()
+
+    def test_connection_lost(self):
+        """The hub is told when the current connection drops."""
+        error = OSError('Connection reset')
+        self.backend._connection_lost(self.backend._protocol, error)
+        self.backend.connection_lost.assert_called_once_with(error)
+
+    def test_closing(self):
+        """Connections which are closed by the backend or replaced aren't reported."""
+        self.backend._connection_lost(Mock(), None)
+        self.backend._closing = True
+        self.backend._connection_lost(self.backend._protocol, None)
+        self.assertFalse(self.backend.connection_lost.called)
+
+
+class FakeRedisChannel:
+    """Stand-in for an aioredis channel fed from a local queue."""
+
+    def __init__(self):
+        self.queue = asyncio.Queue()
+
+    @asyncio.coroutine
+    def wait_message(self):
+        message = yield from self.queue.get()
+        if message is None:
+            return False
+        self.pending = message
+        return True
+
+    @asyncio.coroutine
+    def get(self, encoding=None):
+        return self.pending
+
+
+class FakeRedis:
+    """Stand-in for an aioredis connection with only local pub/sub."""
+
+    def __init__(self, channels):
+        self.channels = channels
+        self.closed = False
+
+    @asyncio.coroutine
+    def subscribe(self, name):
+        self.channels[name] = FakeRedisChannel()
+        return [self.channels[name]]
+
+    @asyncio.coroutine
+    def unsubscribe(self, name):
+        self.channels.pop(name).queue.put_nowait(None)
+
+    @asyncio.coroutine
+    def publish(self, name, message):
+        if name in self.channels:
+            self.channels[name].queue.put_nowait(message)
+
+    def close(self):
+        self.closed = True
+
+
+class RedisBackendTestCase(SimpleTestCase):
+    """Redis backend against a local stand-in for the server."""
+
+    def setUp(self):
+        self.channels = {}
+        self.backend = broadcast.RedisBackend(channel_prefix='test.')
+        self.backend._sub = FakeRedis(self.channels)
+        self.backend._pub = FakeRedis(self.channels)
+        self.hub = broadcast.BroadcastHub(self.backend)
+        # Already connected
+        self.hub._connected = asyncio.Future()
+        self.hub._connected.set_result(None)
+
+    @async_test
+    def test_fan_out(self):
+        """One channel is read per topic and messages reach every subscriber."""
+        subscribers = [Mock(), Mock()]
+        for subscriber in subscribers:
+            yield from self.hub.subscribe('room', subscriber)
+        self.assertEqual(list(self.channels), ['test.room'])
+        yield from self.hub.publish('room', 'hello')
+        yield from settle()
+        for subscriber in subscribers:
+            subscriber.assert_called_once_with('hello')
+        yield from self.hub.close()
+
+    @async_test
+    def test_unsubscribe(self):
+        """The channel and its reader are dropped with the last subscriber."""
+        subscriber = Mock()
+        yield from self.hub.subscribe('room', subscriber)
+        yield from self.hub.unsubscribe('room', subscriber)
+        self.assertEqual(self.channels, {})
+        self.assertEqual(self.backend._readers, {})
+
+    @async_test
+    def test_connection_lost(self):
+        """The hub reconnects when the subscription connection drops."""
+        subscriber = Mock()
+        yield from self.hub.subscribe('room', subscriber)
+
+        @asyncio.coroutine
+        def connect():
+            self.backend._sub = FakeRedis(self.channels)
+            self.backend._pub = FakeRedis(self.channels)
+
+        self.backend.connect = connect
+        with self.assertLogs('aiodjango.broadcast', 'ERROR'):
+            self.backend._sub.closed = True
+            self.channels.pop('test.room').queue.put_nowait(None)
+            yield from settle()
+        yield from self.hub._reconnecting
+        self.assertEqual(list(self.channels), ['test.room'])
+        yield from self.hub.publish('room', 'hello')
+        yield from settle()
+        subscriber.assert_called_once_with('hello')
+        yield from self.hub.close()
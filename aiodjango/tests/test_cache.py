@@ -0,0 +1,158 @@
+import asyncio
+
+from unittest.mock import Mock
+
+from django.test import override_settings, SimpleTestCase
+
+from aiohttp import web
+from aiohttp.multidict import CIMultiDict
+
+from .. import cache
+from ..test import async_test
+
+
+def build_request(method='GET', path_qs='/', headers=None, scheme='http', host='testserver'):
+    """Fake aiohttp request with the attributes used for the cache key."""
+
+    return Mock(method=method, path_qs=path_qs, headers=CIMultiDict(headers or {}),
+                scheme=scheme, host=host)
+
+
+class GetMaxAgeTestCase(SimpleTestCase):
+    """Deciding how long a response can be shared."""
+
+    def test_default(self):
+        """Responses without cache headers use the default."""
+        response = web.Response(body=b'ok')
+        self.assertEqual(cache.get_max_age(response, 5), 5)
+
+    def test_max_age(self):
+        """max-age can shorten but not extend the default."""
+        response = web.Response(body=b'ok', headers={'Cache-Control': 'max-age=2'})
+        self.assertEqual(cache.get_max_age(response, 5), 2)
+        response.headers['Cache-Control'] = 'public, max-age=600'
+        self.assertEqual(cache.get_max_age(response, 5), 5)
+        response.headers['Cache-Control'] = 's-maxage=1, max-age=600'
+        self.assertEqual(cache.get_max_age(response, 5), 1)
+        response.headers['Cache-Control'] = 'max-age=0'
+        self.assertEqual(cache.get_max_age(response, 5), 0)
+
+    def test_uncacheable(self):
+        """Private responses, cookies, errors and Vary: * are not shared."""
+        for headers in ({'Cache-Control': 'private'}, {'Cache-Control': 'no-store'},
+                        {'Set-Cookie': 'a=1'}, {'Vary': '*'}):
+            response = web.Response(body=b'ok', headers=headers)
+            self.assertEqual(cache.get_max_age(response, 5), 0, headers)
+        response = web.Response(body=b'error', status=500)
+        self.assertEqual(cache.get_max_age(response, 5), 0)
+
+
+class MicroCacheTestCase(SimpleTestCase):
+    """Sharing responses between identical requests."""
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.calls = 0
+        self.headers = {}
+        self.micro_cache = cache.MicroCache(self.handler, ttl=5, loop=self.loop)
+
+    @asyncio.coroutine
+    def handler(self, request):
+        self.calls += 1
+        yield from asyncio.sleep(0, loop=self.loop)
+        return web.Response(body=b'ok', headers=self.headers)
+
+    @async_test
+    def test_hit(self):
+        """The second request is served from the cache."""
+        first = yield from self.micro_cache(build_request())
+        second = yield from self.micro_cache(build_request())
+        self.assertEqual(self.calls, 1)
+        self.assertIsNot(first, second)
+        self.assertEqual(second.body, b'ok')
+        self.assertEqual(self.micro_cache.stats()['hits'], 1)
+
+    @async_test
+    def test_hosts(self):
+        """Responses aren't shared between hosts or schemes."""
+        yield from self.micro_cache(build_request(host='one.example.com'))
+        yield from self.micro_cache(build_request(host='two.example.com'))
+        yield from self.micro_cache(build_request(host='two.example.com', scheme='https'))
+        self.assertEqual(self.calls, 3)
+        yield from self.micro_cache(build_request(host='two.example.com'))
+        self.assertEqual(self.calls, 3)
+
+    @async_test
+    def test_proxy_ssl_header(self):
+        """The header Django trusts for the scheme is part of the key."""
+        with override_settings(SECURE_PROXY_SSL_HEADER=('HTTP_X_FORWARDED_PROTO', 'https')):
+            micro_cache = cache.MicroCache(self.handler, ttl=5, loop=self.loop)
+        yield from micro_cache(build_request(headers={'X-Forwarded-Proto': 'https'}))
+        yield from micro_cache(build_request())
+        self.assertEqual(self.calls, 2)
+
+    @async_test
+    def test_expired(self):
+        """Entries are dropped once the TTL has passed."""
+        yield from self.micro_cache(build_request())
+        for entry in self.micro_cache._cache.values():
+            entry.expires = self.loop.time() - 1
+        yield from self.micro_cache(build_request())
+        self.assertEqual(self.calls, 2)
+
+    @async_test
+    def test_collapsed(self):
+        """Concurrent requests for the same URL share a single call."""
+        responses = yield from asyncio.gather(
+            *(self.micro_cache(build_request()) for _ in range(3)), loop=self.loop)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual([r.body for r in responses], [b'ok'] * 3)
+        self.assertEqual(self.micro_cache.stats()['collapsed'], 2)
+
+    @async_test
+    def test_collapsed_uncacheable(self):
+        """Waiting requests make their own call when the response can't be shared."""
+        self.headers = {'Cache-Control': 'private'}
+        yield from asyncio.gather(
+            *(self.micro_cache(build_request()) for _ in range(3)), loop=self.loop)
+        self.assertEqual(self.calls, 3)
+
+    @async_test
+    def test_bypass(self):
+        """Unsafe methods and authorized requests are never cached."""
+        yield from self.micro_cache(build_request(method='POST'))
+        yield from self.micro_cache(build_request(method='POST'))
+        yield from self.micro_cache(build_request(headers={'Authorization': 'Basic Zm9v'}))
+        yield from self.micro_cache(build_request(headers={'Authorization': 'Basic Zm9v'}))
+        self.assertEqual(self.calls, 4)
+        self.assertEqual(self.micro_cache.stats()['entries'], 0)
+
+    @async_test
+    def test_vary(self):
+        """Cached responses are only used for matching Vary headers."""
+        self.headers = {'Vary': 'Accept-Language'}
+        yield from self.micro_cache(build_request(headers={'Accept-Language': 'en'}))
+        yield from self.micro_cache(build_request(headers={'Accept-Language': 'en'}))
+        self.assertEqual(self.calls, 1)
+        yield from self.micro_cache(build_request(headers={'Accept-Language': 'de'}))
+        self.assertEqual(self.calls, 2)
+
+    @async_test
+    def test_max_entries(self):
+        """The least recently used entries are evicted."""
+        self.micro_cache.max_entries = 2
+        for path in ('/a/', '/b/', '/a/', '/c/'):
+            yield from self.micro_cache(build_request(path_qs=path))
+        self.assertEqual([key[-1] for key in self.micro_cache._cache], ['/a/', '/c/'])
+
+    @async_test
+    def test_streamed_response(self):
+        """Streamed responses are not cached."""
+
+        @asyncio.coroutine
+        def handler(request):
+            return web.StreamResponse()
+
+        micro_cache = cache.MicroCache(handler, loop=self.loop)
+        yield from micro_cache(build_request())
+        self.assertEqual(micro_cache.stats()['entries'], 0)
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import shutil
+import tempfile
+
+from django.test import override_settings
+
+from aiohttp import MsgType, web
+
+from ..routing import DjangoRegexRoute
+from ..test import AioTestCase, async_test
+
+
+@asyncio.coroutine
+def echo(request):
+    """Websocket which sends back each message."""
+
+    ws = web.WebSocketResponse()
+    yield from ws.prepare(request)
+    while True:
+        msg = yield from ws.receive()
+        if msg.tp != MsgType.text:
+            break
+        ws.send_str(msg.data.upper())
+    return ws
+
+
+class TestClientTestCase(AioTestCase):
+    """Requests to the application in memory."""
+
+    def get_application(self):
+        app = super().get_application()
+        app.router.register_route(DjangoRegexRoute('GET', echo, 'echo', r'^/echo/$'))
+        return app
+
+    @async_test
+    def test_coroutine_view(self):
+        """Coroutine routes are handled on the test loop."""
+        response = yield from self.aio_client.get('/async-ok/')
+        self.assertEqual(response.status, 200)
+        text = yield from response.text()
+        self.assertEqual(text, 'ok')
+
+    @async_test
+    def test_django_view(self):
+        """Django views are reached through the wsgi-app route."""
+        response = yield from self.aio_client.get('/ok/')
+        self.assertEqual(response.status, 200)
+        text = yield from response.text()
+        self.assertEqual(text, 'ok')
+
+    @async_test
+    def test_not_found(self):
+        """Unknown paths get the Django 404."""
+        response = yield from self.aio_client.post('/missing/', data=b'body')
+        self.assertEqual(response.status, 404)
+
+    @async_test
+    def test_concurrent(self):
+        """Requests can be made at the same time."""
+        responses = yield from asyncio.gather(
+            self.aio_client.get('/ok/'), self.aio_client.get('/async-ok/'))
+        self.assertEqual([response.status for response in responses], [200, 200])
+
+    @async_test
+    def test_websocket(self):
+        """Websockets exchange messages with the client."""
+        ws = yield from self.aio_client.ws_connect('/echo/')
+        ws.send_str('hello')
+        msg = yield from ws.receive()
+        self.assertEqual(msg.data, 'HELLO')
+        yield from ws.close()
+
+    def test_fresh_loop(self):
+        """Each test has its own loop which is the default loop."""
+        self.assertIs(asyncio.get_event_loop(), self.loop)
+        self.assertIs(self.app.loop, self.loop)
+        self.assertFalse(self.loop.is_closed())
+
+
+class StaticTestClientTestCase(AioTestCase):
+    """Serving static files without a socket."""
+
+    app_kwargs = {'include_static': True}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        # Larger than the memory cache so it would be sent with sendfile
+        self.content = b'body {}\n' * 10000
+        with open(os.path.join(self.directory, 'site.css'), 'wb') as f:
+            f.write(self.content)
+        settings = override_settings(STATIC_URL='/static/', STATIC_ROOT=self.directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        super().setUp()
+
+    @async_test
+    def test_static_file(self):
+        """Static files are sent without sendfile."""
+        response = yield from self.aio_client.get('/static/site.css')
+        self.assertEqual(response.status, 200)
+        body = yield from response.read()
+        self.assertEqual(body, self.content)
@@ -1,11 +1,19 @@
+import cProfile
 import errno
+import json
+import os
+import shutil
+import tempfile
 
 from io import StringIO
 from unittest.mock import patch
 
-from django.test import TestCase
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import override_settings, SimpleTestCase, TestCase
 
 from aiodjango.management.commands.runserver import Command
+from aiodjango.profiling import PROFILE_HEADER, check_token
 
 
 class RunserverTestCase(TestCase):
@@ -60,6 +68,21 @@ class RunserverTestCase(TestCase):
         mock_set_loop.assert_called_with(mock_loop.return_value)
         mock_loop.return_value.run_forever.assert_called_with()
 
+    @patch('aiodjango.management.commands.runserver.new_event_loop')
+    @patch('asyncio.set_event_loop')
+    def test_loop_option(self, mock_set_loop, mock_new_loop):
+        """Another event loop can be chosen and tuned from the command line."""
+        self.cmd.handle(loop='uvloop', loop_debug=True, slow_callback=0.05)
+        mock_new_loop.assert_called_with('uvloop', debug=True, slow_callback_duration=0.05)
+        mock_set_loop.assert_called_with(mock_new_loop.return_value)
+        mock_new_loop.return_value.run_forever.assert_called_with()
+
+    @override_settings(AIODJANGO_LOOP='tokio')
+    def test_invalid_loop_setting(self):
+        """Unknown loops in the settings are reported as command errors."""
+        with self.assertRaises(CommandError):
+            self.cmd.handle()
+
     @patch('asyncio.get_event_loop')
     def test_handle_general_socket_errors(self, mock_loop):
         """Handle socket errors when createing the server."""
@@ -92,3 +115,119 @@ class RunserverTestCase(TestCase):
         mock_loop.return_value.run_forever.side_effect = KeyboardInterrupt
         with self.assertRaises(SystemExit):
             self.cmd.handle()
+
+
+@override_settings(ROOT_URLCONF='aiodjango.tests.urls')
+class AioRoutesTestCase(SimpleTestCase):
+    """Writing the route manifest."""
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def test_write_manifest(self):
+        """Discovered routes are written to the given path."""
+        stdout = StringIO()
+        call_command('aioroutes', self.path, stdout=stdout)
+        with open(self.path) as f:
+            manifest = json.load(f)
+        self.assertEqual(len(manifest['routes']), 1)
+        self.assertIn('Wrote 1 routes', stdout.getvalue())
+
+    def test_invalid_view(self):
+        """Errors building the manifest are reported as command errors."""
+        with patch('aiodjango.management.commands.aioroutes.build_route_manifest') as mock_build:
+            mock_build.side_effect = ValueError('Bad view')
+            with self.assertRaises(CommandError):
+                call_command('aioroutes', self.path)
+
+
+class AioServeTestCase(SimpleTestCase):
+    """Running the pre-forking server."""
+
+    def call(self, *args):
+        stdout = StringIO()
+        with patch('aiodjango.management.commands.aioserve.Supervisor') as mock_supervisor:
+            mock_supervisor.return_value.workers = 2
+            call_command('aioserve', *args, stdout=stdout)
+        return mock_supervisor
+
+    def test_defaults(self):
+        """By default the server listens on localhost with SO_REUSEPORT if available."""
+        mock_supervisor = self.call()
+        args, kwargs = mock_supervisor.call_args
+        self.assertEqual(args[1:], ('127.0.0.1', 8000))
+        self.assertEqual(kwargs['workers'], None)
+        self.assertEqual(kwargs['max_requests'], 0)
+        self.assertEqual(kwargs['reuse_port'], None)
+        mock_supervisor.return_value.run.assert_called_with()
+
+    def test_options(self):
+        """Address, workers, recycling and socket sharing are configurable."""
+        mock_supervisor = self.call(
+            '[::1]:9000', '--workers=4', '--max-requests=1000', '--no-reuse-port')
+        args, kwargs = mock_supervisor.call_args
+        self.assertEqual(args[1:], ('::1', 9000))
+        self.assertEqual(kwargs['workers'], 4)
+        self.assertEqual(kwargs['max_requests'], 1000)
+        self.assertEqual(kwargs['reuse_port'], False)
+
+    def test_loop_options(self):
+        """Each worker creates its event loop with the loop options."""
+        mock_supervisor = self.call('--loop=auto', '--slow-callback=0.1')
+        loop_factory = mock_supervisor.call_args[1]['loop_factory']
+        self.assertEqual(loop_factory.args, ('auto', ))
+        self.assertEqual(loop_factory.keywords, {'debug': False, 'slow_callback_duration': 0.1})
+
+    def test_invalid_address(self):
+        """Invalid addresses are reported as command errors."""
+        with self.assertRaises(CommandError):
+            self.call('localhost:http')
+
+    def test_invalid_app(self):
+        """The application factory must be importable."""
+        with self.assertRaises(CommandError):
+            self.call('--app=aiodjango.missing')
+
+
+class AioProfileTestCase(SimpleTestCase):
+    """Combining request profiles."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        for name in ('home.1.1.0.prof', 'home.2.1.1.prof', 'wsgi-app.3.1.2.prof'):
+            profiler = cProfile.Profile()
+            profiler.runcall(sorted, [3, 2, 1])
+            profiler.dump_stats(os.path.join(self.directory, name))
+
+    def call(self, *args):
+        stdout = StringIO()
+        call_command('aioprofile', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_combine(self):
+        """All profiles in the directory are combined."""
+        output = self.call(self.directory)
+        self.assertIn('Combined 3 profiles', output)
+        self.assertIn('sorted', output)
+
+    def test_route(self):
+        """Profiles can be limited to a route."""
+        merged = os.path.join(self.directory, 'merged.out')
+        output = self.call(self.directory, '--route=home', '--output={}'.format(merged))
+        self.assertIn('Combined 2 profiles', output)
+        self.assertTrue(os.path.exists(merged))
+
+    def test_no_profiles(self):
+        """A directory without profiles is reported as a command error."""
+        with self.assertRaises(CommandError):
+            self.call(self.directory, '--route=missing')
+
+    def test_token(self):
+        """A signed header value is printed for profiling a request."""
+        output = self.call('--token')
+        header, token = output.strip().split(': ')
+        self.assertEqual(header, PROFILE_HEADER)
+        self.assertTrue(check_token(token))
@@ -0,0 +1,78 @@
+import asyncio
+import threading
+
+from unittest.mock import Mock, patch
+
+from django.contrib.auth.models import User
+from django.test import TransactionTestCase, SimpleTestCase
+
+from aiohttp import web
+
+from .. import db
+from ..test import async_test
+
+
+class RunWithConnectionTestCase(SimpleTestCase):
+    """Connection handling around ORM calls."""
+
+    def test_close_old_connections(self):
+        """Old connections are closed before and after the call."""
+        func = Mock(return_value='result')
+        with patch('aiodjango.db.close_old_connections') as mock_close:
+            result = db.run_with_connection(func, 1, foo='bar')
+            self.assertEqual(mock_close.call_count, 2)
+        self.assertEqual(result, 'result')
+        func.assert_called_with(1, foo='bar')
+
+    def test_close_on_error(self):
+        """Connections are still checked when the call fails."""
+        func = Mock(side_effect=ValueError)
+        with patch('aiodjango.db.close_old_connections') as mock_close:
+            with self.assertRaises(ValueError):
+                db.run_with_connection(func)
+            self.assertEqual(mock_close.call_count, 2)
+
+
+class DatabaseExecutorTestCase(SimpleTestCase):
+    """Thread pool for ORM calls."""
+
+    def test_default_workers(self):
+        """Default number of workers."""
+        executor = db.DatabaseExecutor()
+        self.addCleanup(executor.shutdown)
+        self.assertEqual(executor.max_workers, db.DEFAULT_DB_WORKERS)
+
+    def test_connection_handling(self):
+        """Calls are wrapped with the connection handling."""
+        executor = db.DatabaseExecutor(1)
+        self.addCleanup(executor.shutdown)
+        with patch('aiodjango.db.close_old_connections') as mock_close:
+            future = executor.submit(threading.current_thread)
+            self.assertIsNot(future.result(5), threading.current_thread())
+            self.assertEqual(mock_close.call_count, 2)
+        self.assertEqual(executor.stats()['completed'], 1)
+
+
+class RunInDatabaseTestCase(TransactionTestCase):
+    """Calling the ORM from coroutines."""
+
+    def setUp(self):
+        self.executor = db.DatabaseExecutor(1)
+        self.addCleanup(self.executor.shutdown)
+        self.app = web.Application(loop=asyncio.get_event_loop())
+        self.app['db_executor'] = self.executor
+
+    @async_test
+    def test_query(self):
+        """ORM calls are run in the database threads."""
+        User.objects.create_user('test')
+        count = yield from db.run_in_db(self.app, User.objects.filter(username='test').count)
+        self.assertEqual(count, 1)
+
+    @async_test
+    def test_arguments(self):
+        """Positional and keyword arguments are passed to the callable."""
+        func = Mock(return_value='result')
+        result = yield from db.run_in_db(self.app, func, 1, foo='bar')
+        self.assertEqual(result, 'result')
+        func.assert_called_with(1, foo='bar')
@@ -0,0 +1,225 @@
+import asyncio
+import threading
+import time
+
+from unittest.mock import Mock, patch
+
+from django.test import SimpleTestCase
+
+from aiohttp import web
+
+from .. import api, executor
+from ..test import AioTestCase, async_test
+
+
+class BoundedExecutorTestCase(SimpleTestCase):
+    """Thread pool with a limited queue."""
+
+    def setUp(self):
+        self.executor = executor.BoundedExecutor(1, max_queue=1, queue_timeout=60)
+        self.addCleanup(self.executor.shutdown)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def block(self):
+        self.release.wait(5)
+        return 'done'
+
+    def test_default_workers(self):
+        """The number of workers is based on the number of CPUs by default."""
+        pool = executor.BoundedExecutor()
+        self.addCleanup(pool.shutdown)
+        self.assertGreaterEqual(pool.max_workers, 5)
+
+    def test_run(self):
+        """Calls are run in the pool and counted."""
+        future = self.executor.submit(lambda x: x * 2, 2)
+        self.assertEqual(future.result(5), 4)
+        stats = self.executor.stats()
+        self.assertEqual(stats['completed'], 1)
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['active'], 0)
+
+    def test_queue_full(self):
+        """Calls beyond the queue limit are rejected immediately."""
+        running = self.executor.submit(self.block)
+        waiting = self.executor.submit(self.block)
+        with self.assertRaises(executor.QueueFull):
+            self.executor.submit(self.block)
+        stats = self.executor.stats()
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['queued'], 1)
+        self.release.set()
+        self.assertEqual(running.result(5), 'done')
+        self.assertEqual(waiting.result(5), 'done')
+
+    def test_queue_timeout(self):
+        """Calls which waited too long for a worker aren't run."""
+        self.executor.queue_timeout = 0.05
+        self.executor.submit(self.block)
+        waiting = self.executor.submit(Mock())
+        time.sleep(0.1)
+        self.release.set()
+        with self.assertRaises(executor.QueueTimeout):
+            waiting.result(5)
+        self.assertEqual(self.executor.stats()['timed_out'], 1)
+
+    @async_test
+    def test_queue_timeout_loop(self):
+        """Calls submitted from the loop fail as soon as they have waited too long."""
+        self.executor.queue_timeout = 0.05
+        loop = asyncio.get_event_loop()
+        self.executor.submit(self.block)
+        waiting = Mock()
+        started = time.monotonic()
+        with self.assertRaises(executor.QueueTimeout):
+            yield from loop.run_in_executor(self.executor, waiting)
+        self.assertLess(time.monotonic() - started, 1)
+        stats = self.executor.stats()
+        self.assertEqual(stats['timed_out'], 1)
+        self.assertEqual(stats['queued'], 0)
+        self.release.set()
+        yield from loop.run_in_executor(self.executor, self.block)
+        self.assertFalse(waiting.called)
+
+    @async_test
+    def test_queue_timeout_cancelled(self):
+        """The queue timeout is dropped from the loop once the call has finished."""
+        self.executor.queue_timeout = 60
+        loop = asyncio.get_event_loop()
+        timers = []
+
+        def call_later(*args):
+            timers.append(original(*args))
+            return timers[-1]
+
+        original = loop.call_later
+        with patch.object(loop, 'call_later', call_later):
+            result = yield from loop.run_in_executor(self.executor, Mock(return_value=1))
+        self.assertEqual(result, 1)
+        yield from asyncio.sleep(0)
+        self.assertEqual(len(timers), 1)
+        self.assertTrue(timers[0]._cancelled)
+
+    @async_test
+    def test_cancel_waiting(self):
+        """Cancelling a call which is waiting for a worker stops it from running."""
+        loop = asyncio.get_event_loop()
+        self.executor.submit(self.block)
+        waiting = Mock()
+        future = loop.run_in_executor(self.executor, waiting)
+        future.cancel()
+        yield from asyncio.sleep(0)
+        self.assertEqual(self.executor.stats()['queued'], 0)
+        self.release.set()
+        yield from loop.run_in_executor(self.executor, self.block)
+        self.assertFalse(waiting.called)
+
+    def test_wait_time(self):
+        """Time spent waiting for a worker is tracked."""
+        self.executor.submit(self.block)
+        waiting = self.executor.submit(Mock())
+        self.release.set()
+        waiting.result(5)
+        stats = self.executor.stats()
+        self.assertGreater(stats['max_wait'], 0)
+        self.assertGreater(stats['mean_wait'], 0)
+
+
+class SaturatedPoolTestCase(AioTestCase):
+    """Shedding requests which can't get a worker in time."""
+
+    app_kwargs = {'workers': 1, 'queue_timeout': 0.1}
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        super().setUp()
+
+    def get_application(self):
+        return api.get_aio_application(wsgi=self.application, **self.app_kwargs)
+
+    def application(self, environ, start_response):
+        self.release.wait(5)
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'ok']
+
+    @async_test
+    def test_service_unavailable(self):
+        """Requests get a 503 once they have waited queue_timeout for a worker."""
+        running = asyncio.ensure_future(self.aio_client.get('/'))
+        yield from asyncio.sleep(0.05)
+        started = time.monotonic()
+        response = yield from self.aio_client.get('/')
+        self.assertEqual(response.status, 503)
+        self.assertLess(time.monotonic() - started, 1)
+        self.release.set()
+        response = yield from running
+        self.assertEqual(response.status, 200)
+
+
+class RecordWaitTestCase(SimpleTestCase):
+    """Tracking the executor wait for each request."""
+
+    def test_wait(self):
+        """The time until the call started is stored on the request."""
+        request = {}
+        pool = executor.BoundedExecutor(1)
+        self.addCleanup(pool.shutdown)
+        func = Mock(return_value='result')
+        future = pool.submit(executor.record_wait(request, func), 1, foo='bar')
+        self.assertEqual(future.result(5), 'result')
+        func.assert_called_with(1, foo='bar')
+        self.assertGreaterEqual(request[executor.EXECUTOR_WAIT_KEY], 0)
+        self.assertGreaterEqual(request[executor.EXECUTOR_RUN_KEY], 0)
+
+    def test_profiler(self):
+        """The request's profiler is enabled in the worker thread during the call."""
+        profiler = Mock()
+        request = {executor.EXECUTOR_PROFILER_KEY: profiler}
+
+        def func():
+            self.assertTrue(profiler.enable.called)
+            self.assertFalse(profiler.disable.called)
+
+        executor.record_wait(request, func)()
+        self.assertTrue(profiler.disable.called)
+
+
+class ShedLoadTestCase(SimpleTestCase):
+    """Responding with 503 when the executor is overloaded."""
+
+    @async_test
+    def test_queue_full(self):
+        """Full queues become service unavailable responses."""
+
+        @asyncio.coroutine
+        def handler(request):
+            raise executor.QueueFull()
+
+        with self.assertRaises(web.HTTPServiceUnavailable) as context:
+            yield from executor.shed_load(handler)(Mock())
+        self.assertEqual(context.exception.headers['Retry-After'], '1')
+
+    @async_test
+    def test_queue_timeout(self):
+        """Timed out calls become service unavailable responses."""
+
+        @asyncio.coroutine
+        def handler(request):
+            raise executor.QueueTimeout()
+
+        with self.assertRaises(web.HTTPServiceUnavailable):
+            yield from executor.shed_load(handler)(Mock())
+
+    @async_test
+    def test_response(self):
+        """Other responses are returned as is."""
+        response = web.Response(text='ok')
+
+        @asyncio.coroutine
+        def handler(request):
+            return response
+
+        result = yield from executor.shed_load(handler)(Mock())
+        self.assertIs(result, response)
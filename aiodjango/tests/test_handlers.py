@@ -0,0 +1,211 @@
+import asyncio
+import io
+
+from unittest.mock import MagicMock, Mock, patch
+
+from django.test import override_settings, SimpleTestCase
+
+from aiohttp import web
+from aiohttp.multidict import CIMultiDict
+
+from .. import handlers, streams
+from ..test import async_test
+
+
+def build_request(method='GET', path='/', query_string='', headers=None, body=b''):
+    """Fake aiohttp request with the attributes used to build a Django request."""
+
+    addresses = {
+        'sockname': ('127.0.0.1', 8000),
+        'peername': ('10.0.0.1', 54321),
+    }
+    transport = Mock()
+    transport.get_extra_info.side_effect = addresses.get
+    request = MagicMock(
+        method=method, path=path, query_string=query_string, version=(1, 1),
+        scheme='http', transport=transport, headers=CIMultiDict(headers or {}),
+        content_length=None)
+
+    @asyncio.coroutine
+    def read():
+        return body
+
+    request.read = read
+    return request
+
+
+class GetMetaTestCase(SimpleTestCase):
+    """Building META from an aiohttp request."""
+
+    def test_cgi_variables(self):
+        """CGI style variables are populated from the request."""
+        request = build_request(
+            method='POST', path='/foo/', query_string='a=1',
+            headers={'Content-Type': 'text/plain', 'Content-Length': '3'})
+        meta = handlers.get_meta(request, 3, '', '/foo/')
+        self.assertEqual(meta['REQUEST_METHOD'], 'POST')
+        self.assertEqual(meta['PATH_INFO'], '/foo/')
+        self.assertEqual(meta['QUERY_STRING'], 'a=1')
+        self.assertEqual(meta['CONTENT_TYPE'], 'text/plain')
+        self.assertEqual(meta['CONTENT_LENGTH'], '3')
+        self.assertEqual(meta['SERVER_NAME'], '127.0.0.1')
+        self.assertEqual(meta['SERVER_PORT'], '8000')
+        self.assertEqual(meta['REMOTE_ADDR'], '10.0.0.1')
+        self.assertEqual(meta['SERVER_PROTOCOL'], 'HTTP/1.1')
+        self.assertNotIn('HTTP_CONTENT_TYPE', meta)
+
+    def test_headers(self):
+        """Other headers are prefixed and repeated headers are joined."""
+        headers = CIMultiDict()
+        headers.add('X-Forwarded-For', '1.1.1.1')
+        headers.add('X-Forwarded-For', '2.2.2.2')
+        headers.add('Host', 'example.com')
+        request = build_request(headers=headers)
+        meta = handlers.get_meta(request, 0, '', '/')
+        self.assertEqual(meta['HTTP_X_FORWARDED_FOR'], '1.1.1.1,2.2.2.2')
+        self.assertEqual(meta['HTTP_HOST'], 'example.com')
+
+    def test_hop_by_hop(self):
+        """Hop-by-hop headers aren't passed to Django."""
+        request = build_request(headers={
+            'Connection': 'keep-alive', 'Keep-Alive': '300', 'Transfer-Encoding': 'chunked',
+            'Upgrade': 'websocket', 'Accept': 'text/html'})
+        meta = handlers.get_meta(request, 0, '', '/')
+        for key in ('HTTP_CONNECTION', 'HTTP_KEEP_ALIVE', 'HTTP_TRANSFER_ENCODING', 'HTTP_UPGRADE'):
+            self.assertNotIn(key, meta)
+        self.assertEqual(meta['HTTP_ACCEPT'], 'text/html')
+
+
+def build_django_request(request, body=b''):
+    return handlers.AioDjangoRequest(request, io.BytesIO(body), len(body))
+
+
+class AioDjangoRequestTestCase(SimpleTestCase):
+    """Django request built from the aiohttp request."""
+
+    def test_path(self):
+        """Path and method are copied from the request."""
+        request = build_django_request(build_request(path='/foo/'))
+        self.assertEqual(request.path, '/foo/')
+        self.assertEqual(request.path_info, '/foo/')
+        self.assertEqual(request.method, 'GET')
+
+    @override_settings(FORCE_SCRIPT_NAME='/mount')
+    def test_script_name(self):
+        """The forced script name is included in the path."""
+        request = build_django_request(build_request(path='/foo/'))
+        self.assertEqual(request.path, '/mount/foo/')
+        self.assertEqual(request.path_info, '/foo/')
+
+    def test_query(self):
+        """Query string is parsed into GET."""
+        request = build_django_request(build_request(query_string='a=1&a=2'))
+        self.assertEqual(request.GET.getlist('a'), ['1', '2'])
+
+    def test_post(self):
+        """Form bodies are parsed into POST."""
+        request = build_django_request(build_request(
+            method='POST', headers={'Content-Type': 'application/x-www-form-urlencoded'}),
+            b'a=1')
+        self.assertEqual(request.POST['a'], '1')
+        self.assertEqual(request.body, b'a=1')
+
+    def test_cookies(self):
+        """Cookies are parsed from the header."""
+        request = build_django_request(build_request(headers={'Cookie': 'a=1'}))
+        self.assertEqual(request.COOKIES, {'a': '1'})
+
+    def test_scheme(self):
+        """Scheme is taken from the aiohttp request."""
+        request = build_request()
+        request.scheme = 'https'
+        self.assertTrue(build_django_request(request).is_secure())
+
+
+@override_settings(ROOT_URLCONF='aiodjango.tests.urls')
+class DjangoHandlerTestCase(SimpleTestCase):
+    """Running Django views without WSGI."""
+
+    def setUp(self):
+        self.handler = handlers.DjangoHandler(loop=asyncio.get_event_loop())
+
+    @async_test
+    def test_response(self):
+        """Django responses are converted to aiohttp responses."""
+        response = yield from self.handler.handle_request(build_request(path='/ok/'))
+        self.assertIsInstance(response, web.Response)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.body, b'ok')
+        self.assertTrue(response.headers['Content-Type'].startswith('text/html'))
+
+    @async_test
+    def test_not_found(self):
+        """Django error responses are passed through."""
+        response = yield from self.handler.handle_request(build_request(path='/missing/'))
+        self.assertEqual(response.status, 404)
+
+    def test_cookies(self):
+        """Cookies set by Django are added to the response headers."""
+        django_response = Mock(
+            status_code=200, reason_phrase='OK', streaming=False, content=b'')
+        django_response.items.return_value = [('Content-Type', 'text/plain')]
+        cookie = Mock()
+        cookie.output.return_value = ' a=1; Path=/'
+        django_response.cookies = {'a': cookie}
+        self.handler.get_django_response = Mock(return_value=django_response)
+        response = self.handler._run(build_request(), io.BytesIO(), 0)
+        self.assertEqual(response.headers.getall('Set-Cookie'), ['a=1; Path=/'])
+        django_response.close.assert_called_with()
+
+
+class StreamingWSGIHandlerTestCase(SimpleTestCase):
+    """Streaming request bodies to the WSGI application."""
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.handler = handlers.StreamingWSGIHandler(Mock(), loop=self.loop)
+
+    @async_test
+    def test_environ(self):
+        """The WSGI environ includes the CGI variables and a streamed input."""
+        request = build_request(method='POST', path='/foo/', headers={'Content-Length': '3'})
+        request.match_info = {'path_info': 'foo/'}
+        request.content_length = 3
+        environ = yield from self.handler._get_environ(request)
+        self.assertEqual(environ['SCRIPT_NAME'], '')
+        self.assertEqual(environ['PATH_INFO'], '/foo/')
+        self.assertEqual(environ['CONTENT_LENGTH'], '3')
+        self.assertEqual(environ['wsgi.url_scheme'], 'http')
+        self.assertIsInstance(environ['wsgi.input'], streams.StreamingInput)
+
+    @async_test
+    def test_buffered_response(self):
+        """Bodies which fit in the buffer are returned as a complete response."""
+
+        def application(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [b'foo', b'bar']
+
+        handler = handlers.StreamingWSGIHandler(application, buffer_size=10, loop=self.loop)
+        request = build_request(path='/foo/')
+        request.match_info = {'path_info': 'foo/'}
+        response = yield from handler.handle_request(request)
+        self.assertIsInstance(response, web.Response)
+        self.assertFalse(response.prepared)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.body, b'foobar')
+        self.assertEqual(response.headers['Content-Type'], 'text/plain')
+        self.assertEqual(response.headers['Content-Length'], '6')
+
+    def test_buffer_overflow(self):
+        """Bodies larger than the buffer are streamed starting with the held back chunks."""
+        response = handlers.StreamingWSGIResponse(Mock(), Mock(), buffer_size=4)
+        response.start_response('200 OK', [])
+        write_head = patch.object(handlers.StreamingWSGIResponse, '_write_head')
+        with write_head, patch('aiodjango.handlers.call_in_loop') as call_in_loop:
+            response.write(b'foo')
+            self.assertFalse(call_in_loop.called)
+            response.write(b'bar')
+            call_in_loop.assert_called_once_with(
+                response._handler._loop, streams.write_chunk, response._response, b'foobar')
+        self.assertIs(response.get_response(), response._response)
@@ -0,0 +1,61 @@
+import asyncio
+
+from unittest.mock import Mock, patch
+
+from django.test import override_settings, SimpleTestCase
+
+from .. import loops
+
+
+class GetLoopNameTestCase(SimpleTestCase):
+    """Choosing the event loop implementation."""
+
+    def test_default(self):
+        """The standard library loop is used by default."""
+        self.assertEqual(loops.get_loop_name(), 'asyncio')
+
+    @override_settings(AIODJANGO_LOOP='uvloop')
+    def test_setting(self):
+        """The default can be changed with the AIODJANGO_LOOP setting."""
+        self.assertEqual(loops.get_loop_name(), 'uvloop')
+        self.assertEqual(loops.get_loop_name('asyncio'), 'asyncio')
+
+    @override_settings(AIODJANGO_LOOP='tokio')
+    def test_unknown(self):
+        """Unknown loop names are rejected."""
+        with self.assertRaises(ValueError):
+            loops.get_loop_name()
+
+
+class NewEventLoopTestCase(SimpleTestCase):
+    """Creating and tuning event loops."""
+
+    def test_asyncio(self):
+        """The standard library loop."""
+        loop = loops.new_event_loop('asyncio')
+        self.addCleanup(loop.close)
+        self.assertIsInstance(loop, asyncio.AbstractEventLoop)
+        self.assertFalse(loop.get_debug())
+
+    def test_uvloop(self):
+        """uvloop is used when installed."""
+        uvloop = Mock()
+        with patch.dict('sys.modules', uvloop=uvloop):
+            loop = loops.new_event_loop('auto')
+        self.assertIs(loop, uvloop.new_event_loop.return_value)
+
+    def test_uvloop_missing(self):
+        """The standard library loop is used when uvloop isn't installed."""
+        with patch.dict('sys.modules', uvloop=None):
+            with patch('aiodjango.loops.logger') as mock_logger:
+                loop = loops.new_event_loop('uvloop')
+                self.addCleanup(loop.close)
+                self.assertTrue(mock_logger.warning.called)
+        self.assertIsInstance(loop, asyncio.AbstractEventLoop)
+
+    def test_slow_callback(self):
+        """Setting the slow callback threshold enables debug mode."""
+        loop = loops.new_event_loop(slow_callback_duration=0.05)
+        self.addCleanup(loop.close)
+        self.assertTrue(loop.get_debug())
+        self.assertEqual(loop.slow_callback_duration, 0.05)
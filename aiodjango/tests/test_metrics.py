@@ -0,0 +1,183 @@
+import asyncio
+
+from unittest.mock import Mock
+
+from django.test import SimpleTestCase
+
+from aiohttp import web
+
+from .. import metrics
+from ..executor import EXECUTOR_RUN_KEY, EXECUTOR_WAIT_KEY
+from ..routing import DjangoRegexRoute
+from ..test import async_test
+
+
+class FakeRequest(dict):
+    """Request with a matched route."""
+
+    def __init__(self, route=None):
+        super().__init__()
+        self.match_info = Mock(route=route)
+
+
+def build_route(name):
+    route = Mock()
+    route.name = name
+    return route
+
+
+class HistogramTestCase(SimpleTestCase):
+    """Counting observations in buckets."""
+
+    def test_observe(self):
+        """Observations are counted in the first bucket they fit."""
+        histogram = metrics.Histogram(buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 1, 1])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 2.65)
+
+    def test_samples(self):
+        """Bucket samples are cumulative and end with +Inf."""
+        histogram = metrics.Histogram(buckets=(0.1, 1.0))
+        histogram.observe(0.05)
+        histogram.observe(2.0)
+        samples = list(histogram.samples('latency', (('route', 'home'), )))
+        self.assertEqual(samples, [
+            ('latency_bucket', (('route', 'home'), ('le', '0.1')), 1),
+            ('latency_bucket', (('route', 'home'), ('le', '1.0')), 1),
+            ('latency_bucket', (('route', 'home'), ('le', '+Inf')), 2),
+            ('latency_sum', (('route', 'home'), ), 2.05),
+            ('latency_count', (('route', 'home'), ), 2),
+        ])
+
+
+class RouteNameTestCase(SimpleTestCase):
+    """Labelling requests by route."""
+
+    def test_named(self):
+        """Named routes use their name."""
+        self.assertEqual(metrics.get_route_name(FakeRequest(build_route('home'))), 'home')
+
+    def test_unnamed_coroutine_route(self):
+        """Unnamed coroutine routes use their pattern."""
+        route = DjangoRegexRoute('*', Mock(), None, r'^/items/(?P<pk>[0-9]+)/$')
+        request = FakeRequest(route)
+        self.assertEqual(metrics.get_route_name(request), r'^/items/(?P<pk>[0-9]+)/$')
+
+    def test_not_found(self):
+        """Requests which didn't match a route have no name."""
+        self.assertEqual(metrics.get_route_name(FakeRequest()), '-')
+
+
+class MiddlewareTestCase(SimpleTestCase):
+    """Instrumenting requests."""
+
+    def setUp(self):
+        self.metrics = metrics.Metrics()
+
+    @async_test
+    def test_latency(self):
+        """The latency of each request is recorded by route and status code."""
+        handler = asyncio.coroutine(Mock(return_value=web.Response(status=201)))
+        instrument = yield from self.metrics.middleware(Mock(), handler)
+        yield from instrument(FakeRequest(build_route('wsgi-app')))
+        histogram = self.metrics.latency[('wsgi-app', 'wsgi')]
+        self.assertEqual(histogram.count, 1)
+        self.assertEqual(self.metrics.responses[('wsgi-app', 'wsgi', 201)], 1)
+        self.assertEqual(self.metrics.in_flight['wsgi'], 0)
+
+    @async_test
+    def test_http_exception(self):
+        """HTTP exceptions are recorded with their status."""
+        handler = asyncio.coroutine(Mock(side_effect=web.HTTPNotFound()))
+        instrument = yield from self.metrics.middleware(Mock(), handler)
+        with self.assertRaises(web.HTTPNotFound):
+            yield from instrument(FakeRequest())
+        self.assertEqual(self.metrics.responses[('-', '-', 404)], 1)
+
+    @async_test
+    def test_error(self):
+        """Other errors are recorded as server errors."""
+        handler = asyncio.coroutine(Mock(side_effect=ValueError()))
+        instrument = yield from self.metrics.middleware(Mock(), handler)
+        with self.assertRaises(ValueError):
+            yield from instrument(FakeRequest())
+        self.assertEqual(self.metrics.responses[('-', '-', 500)], 1)
+
+    @async_test
+    def test_in_flight(self):
+        """Requests are counted while they are handled."""
+        counts = []
+
+        @asyncio.coroutine
+        def handler(request):
+            counts.append(self.metrics.in_flight['wsgi'])
+            return web.Response()
+
+        instrument = yield from self.metrics.middleware(Mock(), handler)
+        yield from instrument(FakeRequest(build_route('wsgi-app')))
+        self.assertEqual(counts, [1])
+        self.assertEqual(self.metrics.in_flight['wsgi'], 0)
+
+    def test_executor_times(self):
+        """The executor wait and run times of Django requests are recorded."""
+        request = FakeRequest(build_route('wsgi-app'))
+        request[EXECUTOR_WAIT_KEY] = 0.02
+        request[EXECUTOR_RUN_KEY] = 0.2
+        self.metrics.observe(request, 'wsgi', 200, 0.3)
+        self.assertEqual(self.metrics.executor_wait.count, 1)
+        self.assertEqual(self.metrics.executor_run.sum, 0.2)
+
+
+class RenderTestCase(SimpleTestCase):
+    """Prometheus text exposition."""
+
+    def test_render(self):
+        """Metrics are rendered with their type and labels."""
+        collected = metrics.Metrics(buckets=(1.0, ))
+        collected.observe(FakeRequest(build_route('home')), 'async', 200, 0.5)
+        text = collected.render()
+        self.assertIn('# TYPE aiodjango_request_duration_seconds histogram\n', text)
+        self.assertIn(
+            'aiodjango_request_duration_seconds_bucket'
+            '{route="home",type="async",le="+Inf"} 1\n', text)
+        self.assertIn(
+            'aiodjango_responses_total{route="home",type="async",code="200"} 1\n', text)
+        self.assertTrue(text.endswith('\n'))
+
+    def test_escaping(self):
+        """Quotes and backslashes in labels are escaped."""
+        self.assertEqual(metrics.format_labels((('route', 'a"b\\c'), )), r'{route="a\"b\\c"}')
+
+    def test_application_gauges(self):
+        """Executor and websocket gauges are read from the application."""
+        executor = Mock()
+        executor.stats.return_value = {'queued': 3, 'active': 2, 'rejected': 1, 'timed_out': 0}
+        connections = Mock()
+        connections.stats.return_value = {
+            'connections': 2, 'routes': {'chat': 2}, 'queued': 5, 'max_queued': 4,
+            'dropped': 0, 'evicted': 1,
+        }
+        app = {'django_executor': executor, 'connections': connections}
+        text = metrics.Metrics().render(app)
+        self.assertIn('aiodjango_executor_queued 3\n', text)
+        self.assertIn('aiodjango_executor_rejected_total 1\n', text)
+        self.assertIn('aiodjango_websocket_connections{route="chat"} 2\n', text)
+        self.assertIn('aiodjango_websocket_evicted_total 1\n', text)
+
+    @async_test
+    def test_view(self):
+        """The view serves the application's metrics as text."""
+        app = {'metrics': metrics.Metrics()}
+        response = yield from metrics.metrics_view(Mock(app=app))
+        self.assertEqual(response.headers['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertIn(b'aiodjango_request_duration_seconds', response.body)
+
+    def test_stalls(self):
+        """Event loop stalls are rendered by view."""
+        detector = Mock(stalls={'blocking': 2}, durations=metrics.Histogram())
+        text = metrics.Metrics().render({'stall_detector': detector})
+        self.assertIn('aiodjango_loop_stalls_total{view="blocking"} 2\n', text)
+        self.assertIn('aiodjango_loop_stall_seconds_count 0\n', text)
@@ -0,0 +1,173 @@
+import asyncio
+import cProfile
+import os
+import pstats
+import shutil
+import tempfile
+
+from unittest.mock import Mock, patch
+
+from django.test import SimpleTestCase
+
+from aiohttp import web
+
+from .. import profiling
+from ..executor import EXECUTOR_PROFILER_KEY, record_wait
+from ..test import async_test
+
+
+class FakeRequest(dict):
+    """Request with headers and a matched route."""
+
+    def __init__(self, headers=None, route_name='home'):
+        super().__init__()
+        self.headers = headers or {}
+        route = Mock()
+        route.name = route_name
+        self.match_info = Mock(route=route)
+
+
+def work():
+    return sum(range(100))
+
+
+def unrelated():
+    return sum(range(100))
+
+
+class TokenTestCase(SimpleTestCase):
+    """Signing the profiling header."""
+
+    def test_valid(self):
+        """Tokens made for profiling are accepted."""
+        self.assertTrue(profiling.check_token(profiling.make_token()))
+
+    def test_invalid(self):
+        """Tampered tokens are rejected."""
+        self.assertFalse(profiling.check_token('profile:forged'))
+
+    def test_expired(self):
+        """Tokens are only accepted for max_age seconds."""
+        token = profiling.make_token()
+        with patch('time.time', return_value=10 ** 10):
+            self.assertFalse(profiling.check_token(token))
+
+
+class ProfileCoroutineTestCase(SimpleTestCase):
+    """Profiling a coroutine while it runs."""
+
+    @async_test
+    def test_result(self):
+        """The result of the coroutine is returned."""
+
+        @asyncio.coroutine
+        def handler():
+            yield from asyncio.sleep(0)
+            work()
+            return 'done'
+
+        profiler = cProfile.Profile()
+        result = yield from profiling.profile_coroutine(profiler, handler())
+        self.assertEqual(result, 'done')
+        profiler.create_stats()
+        functions = {name for _, _, name in profiler.stats}
+        self.assertIn('work', functions)
+
+    @async_test
+    def test_other_tasks(self):
+        """Other tasks which run while the coroutine waits aren't profiled."""
+
+        @asyncio.coroutine
+        def handler():
+            yield from asyncio.sleep(0.01)
+
+        @asyncio.coroutine
+        def other():
+            unrelated()
+
+        profiler = cProfile.Profile()
+        task = asyncio.get_event_loop().create_task(other())
+        yield from profiling.profile_coroutine(profiler, handler())
+        yield from task
+        profiler.create_stats()
+        functions = {name for _, _, name in profiler.stats}
+        self.assertNotIn('unrelated', functions)
+
+    @async_test
+    def test_error(self):
+        """Errors are raised to the caller."""
+
+        @asyncio.coroutine
+        def handler():
+            yield from asyncio.sleep(0)
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            yield from profiling.profile_coroutine(cProfile.Profile(), handler())
+
+
+class RequestProfilerTestCase(SimpleTestCase):
+    """Profiling requests to files."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.profiler = profiling.RequestProfiler(self.directory)
+
+    def test_should_profile(self):
+        """Requests with a valid header are profiled."""
+        token = profiling.make_token()
+        self.assertTrue(self.profiler.should_profile(
+            FakeRequest({profiling.PROFILE_HEADER: token})))
+        self.assertFalse(self.profiler.should_profile(
+            FakeRequest({profiling.PROFILE_HEADER: 'forged'})))
+        self.assertFalse(self.profiler.should_profile(FakeRequest()))
+
+    def test_sample_rate(self):
+        """A fraction of all requests are profiled."""
+        self.profiler.sample_rate = 0.1
+        with patch('random.random', return_value=0.05):
+            self.assertTrue(self.profiler.should_profile(FakeRequest()))
+        with patch('random.random', return_value=0.5):
+            self.assertFalse(self.profiler.should_profile(FakeRequest()))
+
+    @async_test
+    def test_not_profiled(self):
+        """Requests which aren't profiled are passed straight to the handler."""
+        response = web.Response()
+        handler = asyncio.coroutine(Mock(return_value=response))
+        profile_request = yield from self.profiler.middleware(Mock(), handler)
+        request = FakeRequest()
+        result = yield from profile_request(request)
+        self.assertIs(result, response)
+        self.assertNotIn(EXECUTOR_PROFILER_KEY, request)
+        self.assertEqual(self.profiler.profiled, 0)
+
+    @async_test
+    def test_write_profile(self):
+        """The handler and its Django call are written to a file named for the route."""
+
+        @asyncio.coroutine
+        def handler(request):
+            work()
+            loop = asyncio.get_event_loop()
+            yield from loop.run_in_executor(None, record_wait(request, unrelated))
+            return web.Response()
+
+        profile_request = yield from self.profiler.middleware(Mock(), handler)
+        token = profiling.make_token()
+        yield from profile_request(FakeRequest({profiling.PROFILE_HEADER: token}))
+        self.profiler.close()
+        names = os.listdir(self.directory)
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names[0].startswith('home.'))
+        self.assertTrue(names[0].endswith(profiling.PROFILE_SUFFIX))
+        stats = pstats.Stats(os.path.join(self.directory, names[0]))
+        functions = {name for _, _, name in stats.stats}
+        self.assertIn('work', functions)
+        self.assertIn('unrelated', functions)
+
+    def test_clean_route(self):
+        """Route patterns are made safe for file names."""
+        self.assertEqual(profiling.clean_route(r'^/items/(?P<pk>[0-9]+)/$'), 'items_P_pk_0-9')
+        self.assertEqual(profiling.clean_route('-'), 'unknown')
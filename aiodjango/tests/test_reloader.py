@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import time
+
+from unittest import skipIf
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+from django.utils import autoreload
+
+from .. import reloader
+
+
+LIBC = reloader.get_libc()
+
+
+@skipIf(LIBC is None, 'inotify is not available.')
+class InotifyWatcherTestCase(SimpleTestCase):
+    """Watching the code and templates for changes."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.module = self.write('module.py', 'x = 1')
+        self.templates = os.path.join(self.root, 'templates')
+        os.mkdir(self.templates)
+        self.watcher = reloader.InotifyWatcher(LIBC)
+        self.addCleanup(self.watcher.close)
+        self.watcher.watch_file(self.module)
+        self.watcher.watch_tree(self.templates)
+
+    def write(self, name, content):
+        path = os.path.join(self.root, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_idle(self):
+        """Nothing is returned when nothing has changed."""
+        self.assertIsNone(self.watcher.wait(0.05))
+
+    def test_module_changed(self):
+        """Changes to watched modules need a reload."""
+        time.sleep(0.01)
+        self.write('module.py', 'x = 10')
+        self.assertEqual(self.watcher.wait(1), autoreload.FILE_MODIFIED)
+
+    def test_renamed(self):
+        """Editors which save by renaming a new file are noticed."""
+        temp = self.write('module.py.new', 'x = 100')
+        os.rename(temp, self.module)
+        self.assertEqual(self.watcher.wait(1), autoreload.FILE_MODIFIED)
+
+    def test_unrelated(self):
+        """Files which aren't loaded are ignored."""
+        self.write('notes.txt', 'hello')
+        self.write('.module.py.swp', 'x')
+        self.assertIsNone(self.watcher.wait(0.1))
+
+    def test_debounce(self):
+        """A burst of changes is reported once."""
+        for i in range(3):
+            self.write('module.py', 'x = {}'.format(i + 2))
+        self.assertEqual(self.watcher.wait(1), autoreload.FILE_MODIFIED)
+        self.assertIsNone(self.watcher.wait(0.05))
+
+    def test_template(self):
+        """Templates, including those in new directories, need a reload."""
+        os.mkdir(os.path.join(self.templates, 'app'))
+        self.assertIsNone(self.watcher.wait(0.1))
+        self.write(os.path.join('templates', 'app', 'index.html'), '<p></p>')
+        self.assertEqual(self.watcher.wait(1), autoreload.FILE_MODIFIED)
+
+    def test_translations(self):
+        """Changed translations only reset the translation cache."""
+        catalog = self.write('django.mo', '')
+        self.watcher.watch_file(catalog)
+        with open(catalog, 'w') as f:
+            f.write('changed')
+        self.assertEqual(self.watcher.wait(1), autoreload.I18N_MODIFIED)
+
+
+class MainTestCase(SimpleTestCase):
+    """Choosing the reloader."""
+
+    def test_parent(self):
+        """The parent process uses Django's process restart loop."""
+        with patch.dict('os.environ', {}, clear=True):
+            with patch('django.utils.autoreload.main') as mock_main:
+                reloader.main(len, None, {})
+                mock_main.assert_called_with(len, None, {})
+
+    def test_fallback(self):
+        """Django's reloader is used when inotify isn't available."""
+        with patch.dict('os.environ', {'RUN_MAIN': 'true'}):
+            with patch('aiodjango.reloader.get_libc', return_value=None):
+                with patch('django.utils.autoreload.main') as mock_main:
+                    reloader.main(len, None, {})
+                    mock_main.assert_called_with(len, None, {})
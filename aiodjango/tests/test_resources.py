@@ -0,0 +1,255 @@
+import asyncio
+
+from unittest.mock import Mock
+
+from django.test import override_settings, SimpleTestCase
+
+from .. import resources
+from ..test import async_test
+
+
+class Connection:
+    """Connection created by the stub resource."""
+
+    def __init__(self, number):
+        self.number = number
+        self.healthy = True
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class StubResource(resources.Resource):
+    """Resource which counts the connections it creates."""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.connections = []
+        # Number of the next creates which fail
+        self.failures = 0
+
+    @asyncio.coroutine
+    def create(self, loop):
+        # Connecting takes a turn of the loop
+        yield from asyncio.sleep(0)
+        if self.failures:
+            self.failures -= 1
+            raise OSError('Connection refused')
+        connection = Connection(len(self.connections))
+        self.connections.append(connection)
+        return connection
+
+    @asyncio.coroutine
+    def check(self, connection):
+        return connection.healthy
+
+
+def build_connection(**options):
+    """Factory for the FACTORY setting."""
+
+    return Connection(options)
+
+
+@asyncio.coroutine
+def settle():
+    """Let the pool's background tasks run."""
+
+    for _ in range(3):
+        yield from asyncio.sleep(0)
+
+
+class ResourcePoolTestCase(SimpleTestCase):
+    """Leasing connections from a pool."""
+
+    def setUp(self):
+        self.resource = StubResource()
+
+    def build_pool(self, **kwargs):
+        kwargs.setdefault('check_interval', None)
+        return resources.ResourcePool('stub', self.resource, **kwargs)
+
+    @async_test
+    def test_start(self):
+        """min_size connections are created when the pool starts."""
+        pool = self.build_pool(size=3, min_size=2)
+        yield from pool.start()
+        self.assertEqual(len(self.resource.connections), 2)
+        self.assertEqual(pool.stats()['idle'], 2)
+
+    @async_test
+    def test_lease(self):
+        """Connections are returned to the pool at the end of the block."""
+        pool = self.build_pool(size=2)
+        with (yield from pool) as connection:
+            self.assertEqual(pool.stats()['idle'], 1)
+        self.assertEqual(pool.stats()['idle'], 2)
+        with (yield from pool) as again:
+            self.assertIs(again, connection)
+
+    @async_test
+    def test_size_limit(self):
+        """Callers wait for a connection once all of them are leased."""
+        pool = self.build_pool(size=1)
+        first = yield from pool.acquire()
+        waiting = asyncio.ensure_future(pool.acquire())
+        yield from settle()
+        self.assertFalse(waiting.done())
+        self.assertEqual(pool.stats()['waiting'], 1)
+        pool.release(first)
+        second = yield from waiting
+        self.assertIs(second, first)
+        self.assertEqual(len(self.resource.connections), 1)
+
+    @async_test
+    def test_concurrent_first_acquire(self):
+        """Concurrent callers don't create more than size connections."""
+        pool = self.build_pool(size=2, min_size=0)
+        leased = yield from asyncio.gather(*[pool.acquire() for _ in range(2)])
+        waiting = asyncio.ensure_future(pool.acquire())
+        yield from settle()
+        self.assertEqual(len(self.resource.connections), 2)
+        pool.release(leased[0])
+        self.assertIs((yield from waiting), leased[0])
+
+    @async_test
+    def test_broken_connection(self):
+        """Connections are discarded when the block raises a connection error."""
+        pool = self.build_pool(size=1)
+        with self.assertRaises(OSError):
+            with (yield from pool) as connection:
+                raise OSError('Connection reset')
+        yield from settle()
+        self.assertTrue(connection.closed)
+        with (yield from pool) as replacement:
+            self.assertIsNot(replacement, connection)
+        self.assertEqual(pool.stats()['discarded'], 1)
+
+    @async_test
+    def test_application_error(self):
+        """Other errors don't discard the connection."""
+        pool = self.build_pool(size=1)
+        with self.assertRaises(ValueError):
+            with (yield from pool) as connection:
+                raise ValueError()
+        self.assertFalse(connection.closed)
+        self.assertEqual(pool.stats()['idle'], 1)
+
+    @async_test
+    def test_shared(self):
+        """Shared connections are handed out in turn without leasing."""
+        pool = self.build_pool(size=2, shared=True)
+        connections = []
+        for _ in range(4):
+            connections.append((yield from pool.acquire()))
+        self.assertEqual(len(self.resource.connections), 2)
+        self.assertEqual(connections[0:2], connections[2:4])
+        self.assertIsNot(connections[0], connections[1])
+
+    @async_test
+    def test_health_check(self):
+        """Idle connections which fail their check are replaced."""
+        pool = self.build_pool(size=2)
+        yield from pool.start()
+        broken, healthy = self.resource.connections
+        broken.healthy = False
+        yield from pool.check()
+        yield from settle()
+        self.assertTrue(broken.closed)
+        self.assertFalse(healthy.closed)
+        self.assertEqual(pool.stats()['connections'], 2)
+        self.assertEqual(len(self.resource.connections), 3)
+
+    @async_test
+    def test_leased_not_checked(self):
+        """Leased connections aren't checked."""
+        pool = self.build_pool(size=1)
+        connection = yield from pool.acquire()
+        connection.healthy = False
+        yield from pool.check()
+        self.assertFalse(connection.closed)
+        pool.release(connection)
+
+    @async_test
+    def test_start_failure(self):
+        """Failing to connect at startup is retried when a connection is acquired."""
+        pool = self.build_pool(size=1)
+        self.resource.failures = 1
+        yield from pool.start()
+        self.assertEqual(pool.stats()['connections'], 0)
+        with (yield from pool) as connection:
+            self.assertIsInstance(connection, Connection)
+
+    @async_test
+    def test_shared_start_failure(self):
+        """Concurrent callers all get the shared connection created after a failed start."""
+        pool = self.build_pool(size=1, shared=True)
+        self.resource.failures = 1
+        connections = yield from asyncio.wait_for(
+            asyncio.gather(*[pool.acquire() for _ in range(5)]), 1)
+        self.assertEqual(len(self.resource.connections), 1)
+        self.assertEqual(connections, self.resource.connections * 5)
+
+    @async_test
+    def test_close(self):
+        """All of the connections are closed and waiters are released."""
+        pool = self.build_pool(size=1)
+        connection = yield from pool.acquire()
+        waiting = asyncio.ensure_future(pool.acquire())
+        yield from settle()
+        yield from pool.close()
+        self.assertTrue(connection.closed)
+        with self.assertRaises(resources.PoolClosed):
+            yield from waiting
+        with self.assertRaises(resources.PoolClosed):
+            yield from pool.acquire()
+
+
+class GetResourcesTestCase(SimpleTestCase):
+    """Configuring pools with the AIODJANGO_RESOURCES setting."""
+
+    def test_empty(self):
+        """There are no pools by default."""
+        self.assertEqual(resources.get_resources(), {})
+
+    @override_settings(AIODJANGO_RESOURCES={
+        'http': {'BACKEND': 'aiodjango.resources.ClientSessionResource'},
+        'redis': {
+            'BACKEND': 'aiodjango.resources.RedisResource',
+            'OPTIONS': {'address': ('redis', 6379)},
+            'SIZE': 5,
+            'MIN_SIZE': 1,
+        },
+    })
+    def test_backends(self):
+        """The resource class is imported and given the options."""
+        pools = resources.get_resources()
+        self.assertTrue(pools['http'].shared)
+        self.assertEqual(pools['http'].size, 1)
+        self.assertFalse(pools['redis'].shared)
+        self.assertEqual(pools['redis'].size, 5)
+        self.assertEqual(pools['redis'].min_size, 1)
+        self.assertEqual(pools['redis'].resource.options, {'address': ('redis', 6379)})
+
+    @async_test
+    def test_factory(self):
+        """A factory function can be given instead of a resource class."""
+        pools = resources.get_resources({
+            'stub': {
+                'FACTORY': 'aiodjango.tests.test_resources.build_connection',
+                'OPTIONS': {'name': 'stub'},
+                'CHECK_INTERVAL': None,
+            },
+        })
+        with (yield from pools['stub']) as connection:
+            self.assertEqual(connection.number, {'name': 'stub'})
+        yield from pools.close()
+        self.assertTrue(connection.closed)
+
+    @async_test
+    def test_coroutine_factory(self):
+        """Factories can be coroutines."""
+        factory = asyncio.coroutine(Mock(return_value='connection'))
+        resource = resources.CallableResource(factory, host='localhost')
+        connection = yield from resource.create(asyncio.get_event_loop())
+        self.assertEqual(connection, 'connection')
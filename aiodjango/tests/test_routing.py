@@ -1,14 +1,21 @@
 import asyncio
+import json
+import os
+import re
+import tempfile
 
 from unittest.mock import Mock, patch
 
 from django.conf.urls import url
+from django.core.urlresolvers import NoReverseMatch
 from django.http import HttpResponse
 from django.test import override_settings, SimpleTestCase
 
 from aiohttp.web import Response
 
+from . import urls, views
 from .. import routing
+from ..test import async_test
 
 
 @asyncio.coroutine
@@ -87,27 +94,319 @@ class DjangoRouteTestCase(SimpleTestCase):
 
     def test_build_simple_url(self):
         """Build URL with no parameters."""
-        route = routing.DjangoRegexRoute('GET', Mock(), 'test', r'^$')
+        route = routing.DjangoRegexRoute('GET', Mock(), 'test', r'^test/$')
         with patch('aiodjango.routing.reverse') as mock_reverse:
-            mock_reverse.return_value = '/test/'
             url = route.url()
             self.assertEqual(url, '/test/')
-            mock_reverse.assert_called_with('test', kwargs={})
+            self.assertFalse(mock_reverse.called)
 
     def test_build_dynamic_url(self):
         """Build URL with dynamic path parameters."""
         route = routing.DjangoRegexRoute('GET', Mock(), 'test', r'^(?P<name>\w+)$')
         with patch('aiodjango.routing.reverse') as mock_reverse:
-            mock_reverse.return_value = '/foo/'
             url = route.url(name='foo')
-            self.assertEqual(url, '/foo/')
-            mock_reverse.assert_called_with('test', kwargs={'name': 'foo'})
+            self.assertEqual(url, '/foo')
+            self.assertFalse(mock_reverse.called)
 
     def test_build_with_query(self):
         """Build URL with query arguments."""
-        route = routing.DjangoRegexRoute('GET', Mock(), 'test', r'^$')
+        route = routing.DjangoRegexRoute('GET', Mock(), 'test', r'^test/$')
+        url = route.url(query={'foo': 'bar'})
+        self.assertEqual(url, '/test/?foo=bar')
+
+    def test_build_quoted_url(self):
+        """Arguments are quoted the same as reverse."""
+        route = routing.DjangoRegexRoute('GET', Mock(), 'test', r'^(?P<name>.+)/$')
+        url = route.url(name='foo bar')
+        self.assertEqual(url, '/foo%20bar/')
+
+    def test_build_with_script_prefix(self):
+        """The current script prefix is included in the URL."""
+        route = routing.DjangoRegexRoute('GET', Mock(), 'test', r'^(?P<name>\w+)/$')
+        with patch('aiodjango.routing.get_script_prefix') as mock_prefix:
+            mock_prefix.return_value = '/'
+            self.assertEqual(route.url(name='foo'), '/foo/')
+            mock_prefix.return_value = '/mount/'
+            self.assertEqual(route.url(name='foo'), '/mount/foo/')
+
+    def test_build_cached(self):
+        """Built URLs are cached by prefix and arguments."""
+        route = routing.DjangoRegexRoute('GET', Mock(), 'test', r'^(?P<name>\w+)/$')
+        route.url(name='foo')
+        route.url(name='foo')
+        route.url(name='bar')
+        info = route._build_url.cache_info()
+        self.assertEqual(info.hits, 1)
+        self.assertEqual(info.misses, 2)
+
+    def test_build_cached_equal_values(self):
+        """Values which compare equal but are different text are cached separately."""
+        route = routing.DjangoRegexRoute('GET', Mock(), 'test', r'^(?P<value>[.\w]+)/$')
+        self.assertEqual(route.url(value=1), '/1/')
+        self.assertEqual(route.url(value=True), '/True/')
+        self.assertEqual(route.url(value=1.0), '/1.0/')
+        self.assertEqual(route.url(value='1'), '/1/')
+        self.assertEqual(route._build_url.cache_info().hits, 1)
+
+    def test_build_unhashable(self):
+        """Unhashable arguments are built from their text."""
+        route = routing.DjangoRegexRoute('GET', Mock(), 'test', r'^(?P<value>.+)/$')
+        self.assertEqual(route.url(value=['a']), "/%5B'a'%5D/")
+
+    def test_invalid_arguments(self):
+        """Arguments which don't match the pattern are left to reverse to report."""
+        route = routing.DjangoRegexRoute('GET', Mock(), 'test', r'^(?P<pk>[0-9]+)/$')
         with patch('aiodjango.routing.reverse') as mock_reverse:
-            mock_reverse.return_value = '/test/'
-            url = route.url(query={'foo': 'bar'})
-            self.assertEqual(url, '/test/?foo=bar')
-            mock_reverse.assert_called_with('test', kwargs={})
+            mock_reverse.side_effect = NoReverseMatch
+            with self.assertRaises(NoReverseMatch):
+                route.url(pk='abc')
+            mock_reverse.assert_called_with('test', kwargs={'pk': 'abc'})
+            with self.assertRaises(NoReverseMatch):
+                route.url(slug='abc')
+
+
+class RouteMatcherTestCase(SimpleTestCase):
+    """Combined single pass matching of coroutine routes."""
+
+    def build_matcher(self, *regexes):
+        routes = [
+            routing.DjangoRegexRoute('*', Mock(), 'route-{}'.format(i), regex)
+            for i, regex in enumerate(regexes)]
+        return routes, routing.RouteMatcher(routes)
+
+    def test_no_routes(self):
+        """Nothing matches when there are no routes."""
+        routes, matcher = self.build_matcher()
+        self.assertIsNone(matcher.match('/'))
+
+    def test_simple_match(self):
+        """Find the matching route without variables."""
+        routes, matcher = self.build_matcher(r'^$', r'^foo/$')
+        self.assertEqual(matcher.match('/'), (routes[0], {}))
+        self.assertEqual(matcher.match('/foo/'), (routes[1], {}))
+        self.assertIsNone(matcher.match('/bar/'))
+
+    def test_named_groups(self):
+        """Named groups are returned using their original names."""
+        routes, matcher = self.build_matcher(
+            r'^foo/(?P<pk>[0-9]+)/$', r'^bar/(?P<pk>\w+)/(?P<slug>[-\w]+)/$')
+        self.assertEqual(matcher.match('/foo/123/'), (routes[0], {'pk': '123'}))
+        self.assertEqual(
+            matcher.match('/bar/abc/x-y/'), (routes[1], {'pk': 'abc', 'slug': 'x-y'}))
+
+    def test_back_reference(self):
+        """Back references to named groups continue to work."""
+        routes, matcher = self.build_matcher(r'^(?P<name>\w+)/(?P=name)/$')
+        self.assertEqual(matcher.match('/foo/foo/'), (routes[0], {'name': 'foo'}))
+        self.assertIsNone(matcher.match('/foo/bar/'))
+
+    def test_numbered_back_reference(self):
+        """Patterns with numbered back references are matched on their own in order."""
+        routes, matcher = self.build_matcher(
+            r'^foo/$', r'^(\w+)/\1/$', r'^(?P<pk>\w+)/bar/$', r'^x(\d)/\1/$')
+        self.assertEqual(len(matcher.segments), 4)
+        self.assertEqual(matcher.match('/foo/'), (routes[0], {}))
+        self.assertEqual(matcher.match('/bar/bar/'), (routes[1], {}))
+        self.assertEqual(matcher.match('/baz/bar/'), (routes[2], {'pk': 'baz'}))
+        self.assertEqual(matcher.match('/x1/1/'), (routes[3], {}))
+        self.assertIsNone(matcher.match('/foo/baz/'))
+        # A matching pattern after the back reference doesn't win over it
+        routes, matcher = self.build_matcher(r'^(\w+)/\1/$', r'^(?P<pk>\w+)/\w+/$')
+        self.assertEqual(matcher.match('/bar/bar/'), (routes[0], {}))
+        self.assertEqual(matcher.match('/baz/bar/'), (routes[1], {'pk': 'baz'}))
+
+    def test_route_order(self):
+        """The first matching route is used as with the route by route scan."""
+        routes, matcher = self.build_matcher(r'^foo/', r'^foo/bar/$')
+        self.assertEqual(matcher.match('/foo/bar/'), (routes[0], {}))
+
+    def test_alternation(self):
+        """Alternatives within a pattern don't leak into the other routes."""
+        routes, matcher = self.build_matcher(r'^foo/$|^/bar/$', r'^baz/$')
+        self.assertEqual(matcher.match('/foo/'), (routes[0], {}))
+        self.assertEqual(matcher.match('/bar/'), (routes[0], {}))
+        self.assertEqual(matcher.match('/baz/'), (routes[1], {}))
+        self.assertIsNone(matcher.match('/foo/baz/'))
+
+    def test_literal_prefix(self):
+        """Find the literal portion at the start of each pattern."""
+        cases = (
+            (r'^/$', '/'),
+            (r'^/foo/(?P<pk>[0-9]+)/$', '/foo/'),
+            (r'^/foo/?$', '/foo'),
+            (r'^/foo|/bar', ''),
+            (r'(?i)^/foo/', ''),
+        )
+        for regex, expected in cases:
+            self.assertEqual(routing.literal_prefix(re.compile(regex)), expected)
+
+
+@override_settings(ROOT_URLCONF='aiodjango.tests.urls')
+class DjangoUrlDispatcherTestCase(SimpleTestCase):
+    """Resolving requests using the combined matcher."""
+
+    def setUp(self):
+        self.router = routing.DjangoUrlDispatcher()
+        for route in routing.get_aio_routes():
+            self.router.register_route(route)
+        self.router.add_route('*', '/{path_info:.*}', example, name='wsgi-app')
+
+    @async_test
+    def test_resolve_coroutine(self):
+        """Coroutine routes are found by the combined matcher."""
+        request = Mock(method='GET', raw_path='/async-ok/')
+        match = yield from self.router.resolve(request)
+        self.assertEqual(match.route.name, 'aiohttp-ok')
+
+    @async_test
+    def test_resolve_fallback(self):
+        """Other routes are tried when no coroutine route matches."""
+        request = Mock(method='GET', raw_path='/ok/')
+        match = yield from self.router.resolve(request)
+        self.assertEqual(match.route.name, 'wsgi-app')
+        self.assertEqual(match['path_info'], 'ok/')
+
+    @async_test
+    def test_not_found(self):
+        """No matching routes is a 404."""
+        router = routing.DjangoUrlDispatcher()
+        request = Mock(method='GET', raw_path='/ok/')
+        match = yield from router.resolve(request)
+        self.assertEqual(match.route.status, 404)
+
+    def test_matcher_rebuilt(self):
+        """Adding a new coroutine route discards the compiled matcher."""
+        matcher = self.router.get_matcher()
+        self.assertIs(self.router.get_matcher(), matcher)
+        self.router.register_route(
+            routing.DjangoRegexRoute('*', example, 'new-route', r'^new/$'))
+        self.assertIsNot(self.router.get_matcher(), matcher)
+
+
+class ResolutionCacheTestCase(SimpleTestCase):
+    """Caching resolved routes by method and path."""
+
+    def setUp(self):
+        self.router = routing.DjangoUrlDispatcher(cache_size=2)
+        self.router.register_route(
+            routing.DjangoRegexRoute('*', example, 'example', r'^foo/(?P<pk>[0-9]+)/$'))
+        self.router.add_route('*', '/{path_info:.*}', example, name='wsgi-app')
+
+    def test_disabled_by_default(self):
+        """No cache is used unless a size is given."""
+        router = routing.DjangoUrlDispatcher()
+        self.assertIsNone(router.cache_info())
+
+    @async_test
+    def test_cache_hit(self):
+        """Repeated paths are served from the cache."""
+        request = Mock(method='GET', raw_path='/foo/1/')
+        first = yield from self.router.resolve(request)
+        with patch.object(routing.RouteMatcher, 'match') as mock_match:
+            second = yield from self.router.resolve(request)
+            self.assertFalse(mock_match.called)
+        self.assertEqual(first, second)
+        self.assertIs(first.route, second.route)
+        info = self.router.cache_info()
+        self.assertEqual(info.hits, 1)
+        self.assertEqual(info.misses, 1)
+
+    @async_test
+    def test_match_info_copied(self):
+        """Each request gets its own copy of the cached match info."""
+        request = Mock(method='GET', raw_path='/foo/1/')
+        first = yield from self.router.resolve(request)
+        first['pk'] = 'changed'
+        second = yield from self.router.resolve(request)
+        self.assertEqual(second['pk'], '1')
+
+    @async_test
+    def test_cache_bounded(self):
+        """Least recently used paths are dropped from the cache."""
+        for path in ('/foo/1/', '/foo/2/', '/foo/3/'):
+            yield from self.router.resolve(Mock(method='GET', raw_path=path))
+        self.assertEqual(self.router.cache_info().currsize, 2)
+
+    @async_test
+    def test_invalidate_on_register(self):
+        """Adding routes clears the cache."""
+        yield from self.router.resolve(Mock(method='GET', raw_path='/foo/1/'))
+        self.router.register_route(
+            routing.DjangoRegexRoute('*', example, 'other', r'^bar/$'))
+        self.assertEqual(self.router.cache_info().currsize, 0)
+
+
+@override_settings(ROOT_URLCONF='aiodjango.tests.urls')
+class RouteManifestTestCase(SimpleTestCase):
+    """Persisting discovered routes to skip walking the URL patterns."""
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def write_manifest(self, manifest):
+        with open(self.path, 'w') as f:
+            json.dump(manifest, f)
+
+    def test_build_manifest(self):
+        """Describe coroutine views by import path, regex and name."""
+        manifest = routing.build_route_manifest()
+        self.assertEqual(manifest['urlconf'], 'aiodjango.tests.urls')
+        self.assertEqual(manifest['routes'], [{
+            'view': 'aiodjango.tests.views.coroutine_ok',
+            'regex': '^/async-ok/',
+            'name': 'aiohttp-ok',
+        }])
+        self.assertIn(os.path.abspath(urls.__file__), manifest['sources'])
+        self.assertIn(os.path.abspath(views.__file__), manifest['sources'])
+
+    def test_load_manifest(self):
+        """Routes are built from the manifest without walking the patterns."""
+        self.write_manifest(routing.build_route_manifest())
+        with patch('aiodjango.routing.get_aio_routes') as mock_routes:
+            routes = routing.load_route_manifest(self.path)
+            self.assertFalse(mock_routes.called)
+        self.assertEqual(len(routes), 1)
+        route = routes.pop()
+        self.assertEqual(route.name, 'aiohttp-ok')
+        self.assertIs(route.handler, views.coroutine_ok)
+        self.assertIsNotNone(route.match('/async-ok/'))
+
+    def test_missing_manifest(self):
+        """Missing or invalid manifests aren't used."""
+        with open(self.path, 'w') as f:
+            f.write('not json')
+        self.assertIsNone(routing.load_route_manifest(self.path))
+        self.assertIsNone(routing.load_route_manifest(self.path + '.missing'))
+
+    def test_stale_manifest(self):
+        """Manifests older than the URL conf modules aren't used."""
+        manifest = routing.build_route_manifest()
+        for filename in manifest['sources']:
+            manifest['sources'][filename] -= 10
+        self.write_manifest(manifest)
+        self.assertIsNone(routing.load_route_manifest(self.path))
+
+    def test_other_urlconf(self):
+        """Manifests for another ROOT_URLCONF aren't used."""
+        manifest = routing.build_route_manifest()
+        manifest['urlconf'] = 'other.urls'
+        self.write_manifest(manifest)
+        self.assertIsNone(routing.load_route_manifest(self.path))
+
+    def test_missing_view(self):
+        """Manifests with views which can't be imported aren't used."""
+        manifest = routing.build_route_manifest()
+        for view in ('aiodjango.tests.views.removed', 'aiodjango.tests.missing.view',
+                     'aiodjango.tests.views.View.get'):
+            manifest['routes'][0]['view'] = view
+            self.write_manifest(manifest)
+            self.assertIsNone(routing.load_route_manifest(self.path))
+
+    def test_local_view(self):
+        """Views which can't be imported by path can't be added to the manifest."""
+        patterns = (url(r'^$', asyncio.coroutine(lambda request: None), name='local'), )
+        with patch('aiodjango.tests.urls.urlpatterns', patterns):
+            with self.assertRaises(ValueError):
+                routing.build_route_manifest()
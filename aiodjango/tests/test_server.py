@@ -0,0 +1,186 @@
+import asyncio
+import os
+import signal
+import socket
+
+from unittest.mock import Mock, patch
+
+from django.test import SimpleTestCase
+
+from .. import server
+from ..test import async_test
+
+
+class BindSocketTestCase(SimpleTestCase):
+    """Creating the listening sockets."""
+
+    def test_bind(self):
+        """The socket is listening and non-blocking."""
+        sock = server.bind_socket('127.0.0.1', 0)
+        self.addCleanup(sock.close)
+        self.assertEqual(sock.getsockname()[0], '127.0.0.1')
+        self.assertEqual(sock.gettimeout(), 0.0)
+
+    def test_reuse_port(self):
+        """Several sockets can be bound to the same port."""
+        if not server.supports_reuse_port():
+            self.skipTest('SO_REUSEPORT is not available.')
+        first = server.bind_socket('127.0.0.1', 0, reuse_port=True)
+        self.addCleanup(first.close)
+        second = server.bind_socket('127.0.0.1', first.getsockname()[1], reuse_port=True)
+        self.addCleanup(second.close)
+        self.assertEqual(second.getsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT), 1)
+
+
+class InheritSocketTestCase(SimpleTestCase):
+    """Taking over the listening socket from the previous generation."""
+
+    def test_inherit(self):
+        """The socket is rebuilt from the file descriptor."""
+        original = server.bind_socket('127.0.0.1', 0)
+        self.addCleanup(original.close)
+        host, port = original.getsockname()
+        sock = server.inherit_socket(os.dup(original.fileno()), host, port)
+        self.addCleanup(sock.close)
+        self.assertEqual(sock.getsockname(), (host, port))
+        self.assertEqual(sock.gettimeout(), 0.0)
+
+
+class DrainTestCase(SimpleTestCase):
+    """Stopping a worker without cutting off connections."""
+
+    @async_test
+    def test_drain(self):
+        """The server stops listening, websockets are closed and connections finish."""
+        calls = []
+
+        def record(name):
+            return asyncio.coroutine(lambda *args, **kwargs: calls.append(name))
+
+        app = Mock(finish=record('finish'))
+        handler = Mock(finish_connections=record('finish_connections'))
+        listener = Mock(wait_closed=record('wait_closed'))
+        with patch('aiodjango.server.drain_websockets') as mock_drain:
+            yield from server.drain(app, handler, listener, timeout=5, reconnect_delay=(1, 2))
+            mock_drain.assert_called_with(app, reconnect_delay=(1, 2))
+        listener.close.assert_called_with()
+        self.assertEqual(calls, ['wait_closed', 'finish_connections', 'finish'])
+
+
+class WorkerTestCase(SimpleTestCase):
+    """Serving requests in a worker process."""
+
+    def setUp(self):
+        self.worker = server.Worker(Mock(), Mock(), max_requests=2)
+        self.worker.loop = asyncio.get_event_loop()
+        self.worker._stopping = asyncio.Future(loop=self.worker.loop)
+
+    @async_test
+    def test_max_requests(self):
+        """The worker stops once it has handled max_requests."""
+
+        @asyncio.coroutine
+        def handler(request):
+            return 'response'
+
+        middleware = yield from self.worker.count_requests(Mock(), handler)
+        response = yield from middleware(Mock())
+        self.assertEqual(response, 'response')
+        self.assertFalse(self.worker._stopping.done())
+        yield from middleware(Mock())
+        yield from asyncio.sleep(0, loop=self.worker.loop)
+        self.assertTrue(self.worker._stopping.done())
+
+    @async_test
+    def test_middleware_order(self):
+        """Requests are counted outside of the application's middleware."""
+        profiler = Mock()
+        app = Mock(middlewares=[profiler])
+        self.worker.app_factory = Mock(return_value=app)
+        self.worker.stop()
+        create_server = asyncio.coroutine(Mock())
+        with patch.object(self.worker.loop, 'create_server', create_server):
+            with patch('aiodjango.server.drain', asyncio.coroutine(Mock())):
+                yield from self.worker.serve()
+        self.assertEqual(app.middlewares, [self.worker.count_requests, profiler])
+
+    def test_stop_twice(self):
+        """Stopping an already stopping worker is ignored."""
+        self.worker.stop()
+        self.worker.stop()
+        self.assertTrue(self.worker._stopping.done())
+
+
+class SupervisorTestCase(SimpleTestCase):
+    """Forking and replacing the workers."""
+
+    def setUp(self):
+        self.supervisor = server.Supervisor(Mock(), '127.0.0.1', 0, workers=2, reuse_port=False)
+        patcher = patch('aiodjango.server.signal.signal')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_default_workers(self):
+        """One worker is started for each CPU by default."""
+        with patch('os.cpu_count', return_value=3):
+            supervisor = server.Supervisor(Mock(), '127.0.0.1', 0)
+        self.assertEqual(supervisor.workers, 3)
+
+    @patch('aiodjango.server.time.sleep')
+    @patch('os.wait')
+    @patch('os.fork')
+    def test_restart(self, mock_fork, mock_wait, mock_sleep):
+        """Workers which exit are replaced until the supervisor is stopped."""
+        mock_fork.side_effect = [101, 102, 103]
+
+        def wait():
+            if mock_wait.call_count == 1:
+                return 101, 1 << 8
+            self.supervisor.stopping = True
+            return mock_wait.call_count == 2 and (102, 0) or (103, 0)
+
+        mock_wait.side_effect = wait
+        self.supervisor.run()
+        self.assertEqual(mock_fork.call_count, 3)
+        self.assertEqual(self.supervisor.children, {})
+        self.assertTrue(mock_sleep.called)
+
+    @patch('subprocess.Popen')
+    def test_reload(self, mock_popen):
+        """Reloading starts a new generation which is handed the listening socket."""
+        self.supervisor.sock = sock = server.bind_socket('127.0.0.1', 0)
+        self.addCleanup(sock.close)
+        self.supervisor.handle_reload(signal.SIGHUP, None)
+        args, kwargs = mock_popen.call_args
+        self.assertEqual(kwargs['env'][server.LISTEN_FD_ENV], str(sock.fileno()))
+        self.assertEqual(kwargs['env'][server.PARENT_PID_ENV], str(os.getpid()))
+        self.assertEqual(kwargs['pass_fds'], (sock.fileno(), ))
+
+    @patch('os.kill')
+    @patch('aiodjango.server.time.sleep')
+    @patch('os.wait', side_effect=ChildProcessError)
+    @patch('os.fork', return_value=101)
+    def test_new_generation(self, mock_fork, mock_wait, mock_sleep, mock_kill):
+        """The new generation drains the previous one once its workers have started."""
+        original = server.bind_socket('127.0.0.1', 0)
+        self.addCleanup(original.close)
+        self.supervisor.host, self.supervisor.port = original.getsockname()
+        env = {
+            server.LISTEN_FD_ENV: str(os.dup(original.fileno())),
+            server.PARENT_PID_ENV: '99',
+        }
+        with patch.dict('os.environ', env):
+            self.supervisor.run()
+            self.assertNotIn(server.LISTEN_FD_ENV, os.environ)
+        mock_kill.assert_called_with(99, signal.SIGTERM)
+
+    @patch('os.kill')
+    def test_stop(self, mock_kill):
+        """Stopping sends SIGTERM to the workers and then SIGKILL."""
+        self.supervisor.children = {101: 0, 102: 0}
+        self.supervisor.handle_stop(signal.SIGTERM, None)
+        mock_kill.assert_any_call(101, signal.SIGTERM)
+        mock_kill.assert_any_call(102, signal.SIGTERM)
+        self.supervisor.handle_stop(signal.SIGINT, None)
+        mock_kill.assert_any_call(101, signal.SIGKILL)
+        self.assertTrue(self.supervisor.stopping)
@@ -0,0 +1,217 @@
+import asyncio
+
+from unittest.mock import Mock, patch
+
+from django.test import SimpleTestCase
+
+from aiohttp import web
+
+from .. import sse
+from ..test import async_test
+
+
+def build_response(**kwargs):
+    """Event stream response which records what is written."""
+
+    response = sse.EventSourceResponse(**kwargs)
+    response.written = []
+    response.write = response.written.append
+    response.drain = asyncio.coroutine(Mock())
+    response.eof = Mock()
+    response.write_eof = asyncio.coroutine(response.eof)
+    return response
+
+
+class EventTestCase(SimpleTestCase):
+    """Encoding events."""
+
+    def test_data(self):
+        """Each line of the data gets its own field."""
+        event = sse.Event('first\nsecond')
+        self.assertEqual(event.encode(), b'data: first\ndata: second\n\n')
+
+    def test_fields(self):
+        """The event name and id are included when given."""
+        event = sse.Event('{"count": 1}', event='count', id=5)
+        self.assertEqual(event.encode(), b'event: count\nid: 5\ndata: {"count": 1}\n\n')
+
+    def test_empty(self):
+        """Empty data still has a data field."""
+        self.assertEqual(sse.Event('').encode(), b'data: \n\n')
+
+
+class EventChannelTestCase(SimpleTestCase):
+    """Buffering events for clients to read."""
+
+    def test_numbering(self):
+        """Events are numbered in the order they are published."""
+        channel = sse.EventChannel()
+        ids = [channel.publish(str(i)).id for i in range(3)]
+        self.assertEqual(ids, [1, 2, 3])
+        self.assertEqual(channel.last_id, 3)
+
+    def test_explicit_ids(self):
+        """Given ids must increase."""
+        channel = sse.EventChannel()
+        channel.publish('first', id=10)
+        with self.assertRaises(ValueError):
+            channel.publish('second', id=10)
+
+    def test_since(self):
+        """Events after the given id are returned."""
+        channel = sse.EventChannel()
+        for i in range(5):
+            channel.publish(str(i))
+        self.assertEqual([e.data for e in channel.since(3)], ['3', '4'])
+        self.assertEqual(channel.since(5), [])
+
+    def test_since_sparse_ids(self):
+        """Ids don't need to be contiguous."""
+        channel = sse.EventChannel()
+        for i in (10, 20, 30):
+            channel.publish(str(i), id=i)
+        self.assertEqual([e.id for e in channel.since(15)], [20, 30])
+        self.assertEqual([e.id for e in channel.since(20)], [30])
+
+    def test_replay_limit(self):
+        """Clients which have fallen behind the buffer skip the missed events."""
+        channel = sse.EventChannel(max_history=3)
+        for i in range(10):
+            channel.publish(str(i))
+        self.assertEqual([e.id for e in channel.since(2)], [8, 9, 10])
+        self.assertEqual(channel.skipped, 1)
+
+    @async_test
+    def test_wait(self):
+        """Waiting clients are woken by the next event."""
+        channel = sse.EventChannel()
+        waiting = asyncio.ensure_future(channel.wait(channel.last_id, timeout=5))
+        yield from asyncio.sleep(0)
+        channel.publish('hello')
+        events = yield from waiting
+        self.assertEqual([e.data for e in events], ['hello'])
+
+    @async_test
+    def test_wait_timeout(self):
+        """No events are returned when the timeout passes."""
+        channel = sse.EventChannel()
+        events = yield from channel.wait(channel.last_id, timeout=0.01)
+        self.assertEqual(events, [])
+
+    @async_test
+    def test_wait_ahead(self):
+        """Waiting from an id the channel hasn't reached returns the next event."""
+        channel = sse.EventChannel()
+        for i in range(3):
+            channel.publish(str(i))
+        waiting = asyncio.ensure_future(channel.wait(500, timeout=5))
+        yield from asyncio.sleep(0)
+        channel.publish('hello')
+        events = yield from waiting
+        self.assertEqual([(e.id, e.data) for e in events], [(4, 'hello')])
+
+    @async_test
+    def test_close(self):
+        """Closing the channel wakes the waiting clients."""
+        channel = sse.EventChannel()
+        waiting = asyncio.ensure_future(channel.wait(channel.last_id, timeout=5))
+        yield from asyncio.sleep(0)
+        channel.close()
+        self.assertEqual((yield from waiting), [])
+        with self.assertRaises(RuntimeError):
+            channel.publish('hello')
+
+
+class EventSourceResponseTestCase(SimpleTestCase):
+    """Streaming events to a client."""
+
+    def test_headers(self):
+        """The response is an uncached event stream."""
+        response = sse.EventSourceResponse()
+        self.assertEqual(response.content_type, 'text/event-stream')
+        self.assertEqual(response.headers['Cache-Control'], 'no-cache')
+
+    @async_test
+    def test_prepare(self):
+        """The id to resume from is read from the request."""
+        response = build_response(retry=2.5)
+        request = Mock(headers={'Last-Event-ID': '42'})
+        with patch.object(web.StreamResponse, 'prepare', asyncio.coroutine(Mock())):
+            yield from response.prepare(request)
+        self.assertEqual(response.last_event_id, 42)
+        self.assertEqual(response.written, [b'retry: 2500\n\n'])
+
+    @async_test
+    def test_invalid_last_event_id(self):
+        """Ids which aren't numbers are ignored."""
+        response = build_response()
+        request = Mock(headers={'Last-Event-ID': 'abc'})
+        with patch.object(web.StreamResponse, 'prepare', asyncio.coroutine(Mock())):
+            yield from response.prepare(request)
+        self.assertIsNone(response.last_event_id)
+
+    @async_test
+    def test_stream_new_events(self):
+        """Clients without a Last-Event-ID only get new events."""
+        channel = sse.EventChannel()
+        channel.publish('old')
+        response = build_response()
+        streaming = asyncio.ensure_future(response.stream(channel))
+        yield from asyncio.sleep(0)
+        channel.publish('new')
+        channel.close()
+        yield from streaming
+        self.assertEqual(response.written, [b'id: 2\ndata: new\n\n'])
+        self.assertTrue(response.eof.called)
+
+    @async_test
+    def test_stream_resume(self):
+        """Missed events are sent together to clients resuming with a Last-Event-ID."""
+        channel = sse.EventChannel()
+        for i in range(3):
+            channel.publish(str(i))
+        channel.close()
+        response = build_response()
+        response.last_event_id = 1
+        yield from response.stream(channel)
+        self.assertEqual(response.written, [b'id: 2\ndata: 1\n\nid: 3\ndata: 2\n\n'])
+
+    @async_test
+    def test_stream_after_restart(self):
+        """Clients with an id from before a restart get the new events."""
+        channel = sse.EventChannel()
+        for i in range(3):
+            channel.publish(str(i))
+        response = build_response()
+        response.last_event_id = 500
+        streaming = asyncio.ensure_future(response.stream(channel))
+        yield from asyncio.sleep(0)
+        channel.publish('new')
+        channel.publish('newer')
+        yield from asyncio.sleep(0)
+        channel.close()
+        yield from streaming
+        self.assertEqual(
+            b''.join(response.written), b'id: 4\ndata: new\n\nid: 5\ndata: newer\n\n')
+
+    @async_test
+    def test_heartbeat(self):
+        """Comments are sent while there are no events."""
+        channel = sse.EventChannel()
+        response = build_response(heartbeat=0.01)
+        streaming = asyncio.ensure_future(response.stream(channel))
+        yield from asyncio.sleep(0.05)
+        channel.close()
+        yield from streaming
+        self.assertIn(b': \n\n', response.written)
+
+    @async_test
+    def test_disconnect(self):
+        """Streaming stops when the client has gone away."""
+        channel = sse.EventChannel()
+        response = build_response()
+        response.drain = asyncio.coroutine(Mock(side_effect=ConnectionResetError))
+        channel.publish('hello')
+        response.last_event_id = 0
+        yield from response.stream(channel)
+        self.assertFalse(response.eof.called)
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+
+from unittest.mock import Mock
+
+from django.test import SimpleTestCase
+
+from aiohttp import web
+from aiohttp.multidict import CIMultiDict
+
+from .. import static
+from ..test import async_test
+
+
+class StaticFilesMixin:
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.write('css/app.css', b'body {}')
+        self.write('css/app.css.gz', b'gzipped')
+        self.write('css/app.css.br', b'brotli')
+        self.write('css/app.0123456789ab.css', b'body {}')
+        self.write('js/app.js', b'x' * 1024)
+        self.write('archive.tar.gz', b'tar')
+        self.write(static.MANIFEST_NAME, json.dumps({
+            'paths': {'css/app.css': 'css/app.0123456789ab.css'},
+            'version': '1.0',
+        }).encode('utf-8'))
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, *name.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+
+
+class BuildIndexTestCase(StaticFilesMixin, SimpleTestCase):
+    """Indexing the static files at startup."""
+
+    def test_index(self):
+        """All files are indexed by their URL path."""
+        index = static.build_index(self.directory)
+        self.assertEqual(set(index), {
+            'css/app.css', 'css/app.0123456789ab.css', 'js/app.js', 'archive.tar.gz',
+            static.MANIFEST_NAME,
+        })
+
+    def test_variants(self):
+        """Precompressed siblings are served through the original file."""
+        asset = static.build_index(self.directory)['css/app.css']
+        self.assertEqual(list(asset.files), ['br', 'gzip', None])
+        self.assertEqual(asset.content_type, 'text/css')
+
+    def test_hashed_names(self):
+        """Files from the staticfiles manifest are immutable."""
+        index = static.build_index(self.directory)
+        self.assertTrue(index['css/app.0123456789ab.css'].immutable)
+        self.assertFalse(index['css/app.css'].immutable)
+
+    def test_no_manifest(self):
+        """Static files don't need to be collected with the manifest storage."""
+        os.remove(os.path.join(self.directory, static.MANIFEST_NAME))
+        index = static.build_index(self.directory)
+        self.assertFalse(any(asset.immutable for asset in index.values()))
+
+
+class NegotiateTestCase(StaticFilesMixin, SimpleTestCase):
+    """Choosing a precompressed variant."""
+
+    def setUp(self):
+        super().setUp()
+        self.asset = static.build_index(self.directory)['css/app.css']
+
+    def test_accepted_encodings(self):
+        """Parse the codings from the Accept-Encoding header."""
+        self.assertEqual(
+            static.accepted_encodings('gzip, deflate;q=0.5, br;q=0'), {'gzip', 'deflate'})
+        self.assertEqual(static.accepted_encodings(''), {''})
+
+    def test_prefer_brotli(self):
+        """Brotli is preferred over gzip."""
+        coding, static_file = self.asset.negotiate('gzip, br')
+        self.assertEqual(coding, 'br')
+        self.assertTrue(static_file.path.endswith('.br'))
+
+    def test_gzip(self):
+        """Gzip is used when brotli isn't accepted."""
+        coding, static_file = self.asset.negotiate('gzip, deflate')
+        self.assertEqual(coding, 'gzip')
+
+    def test_identity(self):
+        """The original file is used when no variants are accepted."""
+        coding, static_file = self.asset.negotiate('')
+        self.assertIsNone(coding)
+        self.assertTrue(static_file.path.endswith('app.css'))
+
+    def test_etags(self):
+        """Each variant has its own strong ETag."""
+        etags = {static_file.etag for static_file in self.asset.files.values()}
+        self.assertEqual(len(etags), 3)
+        self.assertTrue(all(etag.startswith('"') for etag in etags))
+
+
+class IndexedStaticRouteTestCase(StaticFilesMixin, SimpleTestCase):
+    """Serving files from the index."""
+
+    def setUp(self):
+        super().setUp()
+        self.response = Mock(headers=CIMultiDict())
+
+        @asyncio.coroutine
+        def prepare(request):
+            pass
+
+        self.response.prepare = Mock(side_effect=prepare)
+        self.factory = Mock(return_value=self.response)
+        self.route = static.IndexedStaticRoute(
+            'static', '/static/', self.directory, response_factory=self.factory,
+            cache_max_bytes=2048, cache_max_file_size=1024)
+
+    def build_request(self, filename, headers=None):
+        return Mock(
+            match_info={'filename': filename}, headers=CIMultiDict(headers or {}),
+            if_modified_since=None)
+
+    @async_test
+    def test_missing_file(self):
+        """Files which aren't in the index are not found."""
+        with self.assertRaises(web.HTTPNotFound):
+            yield from self.route.handle(self.build_request('missing.css'))
+
+    @async_test
+    def test_serve_variant(self):
+        """Serve the precompressed variant with the matching encoding."""
+        request = self.build_request('css/app.css', {'Accept-Encoding': 'gzip'})
+        yield from self.route.handle(request)
+        headers = self.factory.call_args[1]['headers']
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertNotIn('Cache-Control', headers)
+        self.assertEqual(self.response.headers['Content-Encoding'], 'gzip')
+        self.response.write.assert_called_with(b'gzipped')
+
+    @async_test
+    def test_immutable(self):
+        """Hashed files are cached forever."""
+        yield from self.route.handle(self.build_request('css/app.0123456789ab.css'))
+        headers = self.factory.call_args[1]['headers']
+        self.assertEqual(headers['Cache-Control'], static.IMMUTABLE_CACHE_CONTROL)
+
+    @async_test
+    def test_not_modified(self):
+        """Matching ETags get a 304."""
+        asset = self.route.index['js/app.js']
+        request = self.build_request('js/app.js', {'If-None-Match': asset.files[None].etag})
+        with self.assertRaises(web.HTTPNotModified):
+            yield from self.route.handle(request)
+
+    @async_test
+    def test_memory_cache(self):
+        """Small files are kept in memory up to the size limit."""
+        yield from self.route.handle(self.build_request('js/app.js'))
+        yield from self.route.handle(self.build_request('css/app.css'))
+        self.assertEqual(len(self.route._cache), 2)
+        self.write('js/app.js', b'changed')
+        yield from self.route.handle(self.build_request('js/app.js'))
+        self.response.write.assert_called_with(b'x' * 1024)
+        self.route.cache_max_bytes = 1024
+        yield from self.route.handle(self.build_request('css/app.0123456789ab.css'))
+        self.assertLessEqual(self.route._cache_bytes, 1024)
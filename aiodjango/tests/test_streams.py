@@ -0,0 +1,166 @@
+import asyncio
+import io
+
+from concurrent.futures import TimeoutError
+from functools import partial
+from unittest.mock import Mock
+
+from django.test import SimpleTestCase
+
+from aiohttp.streams import StreamReader
+
+from .. import streams
+from ..test import async_test
+
+
+class CallInLoopTestCase(SimpleTestCase):
+    """Running coroutines on the loop from worker threads."""
+
+    @async_test
+    def test_result(self):
+        """The result of the coroutine is returned to the thread."""
+        loop = asyncio.get_event_loop()
+
+        @asyncio.coroutine
+        def double(value):
+            return value * 2
+
+        result = yield from loop.run_in_executor(None, streams.call_in_loop, loop, double, 2)
+        self.assertEqual(result, 4)
+
+    @async_test
+    def test_exception(self):
+        """Errors are raised in the thread."""
+        loop = asyncio.get_event_loop()
+
+        @asyncio.coroutine
+        def fail():
+            raise ValueError('Bad value')
+
+        with self.assertRaises(ValueError):
+            yield from loop.run_in_executor(None, streams.call_in_loop, loop, fail)
+
+    @async_test
+    def test_timeout(self):
+        """Calls which don't finish in time are cancelled and raise in the thread."""
+        loop = asyncio.get_event_loop()
+        waiting = asyncio.Future()
+
+        @asyncio.coroutine
+        def wait():
+            yield from waiting
+
+        call = partial(streams.call_in_loop, loop, wait, timeout=0.01)
+        with self.assertRaises(TimeoutError):
+            yield from loop.run_in_executor(None, call)
+        yield from asyncio.sleep(0)
+        self.assertTrue(waiting.cancelled())
+
+    def test_closed_loop(self):
+        """Calls to a closed loop raise rather than waiting."""
+        loop = asyncio.new_event_loop()
+        loop.close()
+        with self.assertRaises(RuntimeError):
+            streams.call_in_loop(loop, asyncio.sleep, 0)
+
+
+class StreamingInputTestCase(SimpleTestCase):
+    """Reading the request body from a worker thread."""
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.content = StreamReader(loop=self.loop)
+        self.stream = streams.StreamingInput(self.loop, self.content, chunk_size=4)
+
+    def feed(self, data):
+        self.content.feed_data(data)
+        self.content.feed_eof()
+
+    def in_thread(self, func, *args):
+        return self.loop.run_in_executor(None, func, *args)
+
+    @async_test
+    def test_read_all(self):
+        """Read the entire body."""
+        self.feed(b'0123456789')
+        data = yield from self.in_thread(self.stream.read)
+        self.assertEqual(data, b'0123456789')
+        data = yield from self.in_thread(self.stream.read)
+        self.assertEqual(data, b'')
+
+    @async_test
+    def test_read_size(self):
+        """Reads return the requested size until the end of the body."""
+        self.feed(b'0123456789')
+        data = yield from self.in_thread(self.stream.read, 6)
+        self.assertEqual(data, b'012345')
+        data = yield from self.in_thread(self.stream.read, 6)
+        self.assertEqual(data, b'6789')
+
+    @async_test
+    def test_readline(self):
+        """Read the body line by line."""
+        self.feed(b'one\ntwo\nthree')
+        data = yield from self.in_thread(self.stream.readline, 2)
+        self.assertEqual(data, b'on')
+        lines = yield from self.in_thread(self.stream.readlines)
+        self.assertEqual(lines, [b'e\n', b'two\n', b'three'])
+
+    @async_test
+    def test_readline_size(self):
+        """Lines longer than the size aren't read past it."""
+        self.content.feed_data(b'0123456789\n')
+        data = yield from self.in_thread(self.stream.readline, 4)
+        self.assertEqual(data, b'0123')
+        self.assertEqual(self.content.read_nowait(), b'456789\n')
+
+    @async_test
+    def test_not_read_ahead(self):
+        """Nothing is read from the socket until it is asked for."""
+        self.content.feed_data(b'0123456789')
+        yield from self.in_thread(self.stream.read, 2)
+        self.assertEqual(self.content.read_nowait(), b'23456789')
+
+
+class GetInputTestCase(SimpleTestCase):
+    """Choosing how to pass the request body."""
+
+    @async_test
+    def test_content_length(self):
+        """Bodies with a known length are streamed."""
+        request = Mock(content_length=10)
+        stream, length = yield from streams.get_input(request, asyncio.get_event_loop())
+        self.assertIsInstance(stream, streams.StreamingInput)
+        self.assertEqual(length, 10)
+
+    @async_test
+    def test_chunked(self):
+        """Bodies without a known length are buffered."""
+        request = Mock(content_length=None)
+
+        @asyncio.coroutine
+        def read():
+            return b'body'
+
+        request.read = read
+        stream, length = yield from streams.get_input(request, asyncio.get_event_loop())
+        self.assertIsInstance(stream, io.BytesIO)
+        self.assertEqual(length, 4)
+
+
+class WriteChunkTestCase(SimpleTestCase):
+    """Writing streamed responses with backpressure."""
+
+    @async_test
+    def test_drain(self):
+        """Each chunk waits for the transport to drain."""
+        response = Mock()
+
+        @asyncio.coroutine
+        def drain():
+            pass
+
+        response.drain = Mock(side_effect=drain)
+        yield from streams.write_chunk(response, b'data')
+        response.write.assert_called_with(b'data')
+        response.drain.assert_called_with()
@@ -0,0 +1,98 @@
+import asyncio
+import sys
+import time
+
+from unittest.mock import Mock, patch
+
+from django.test import SimpleTestCase
+
+from .. import watchdog
+from ..routing import DjangoRegexRoute
+from ..test import async_test
+
+
+@asyncio.coroutine
+def blocking_view(request):
+    """View which blocks the loop in a helper."""
+
+    block(0.3)
+    yield from asyncio.sleep(0)
+
+
+@asyncio.coroutine
+def polite_view(request):
+    yield from asyncio.sleep(0.3)
+
+
+def block(seconds):
+    time.sleep(seconds)
+
+
+def build_route(name, handler):
+    return DjangoRegexRoute('*', handler, name, r'^/{}/$'.format(name))
+
+
+class FindViewTestCase(SimpleTestCase):
+    """Finding the coroutine view on a stack."""
+
+    def test_view_code(self):
+        """Views are found by their code objects."""
+        views = watchdog.get_view_code([build_route('blocking', blocking_view)])
+        self.assertEqual(views, {blocking_view.__code__: 'blocking'})
+
+    def test_find_view(self):
+        """The view is found further up the stack."""
+        views = {self.test_find_view.__func__.__code__: 'test'}
+
+        def inner():
+            return watchdog.find_view(sys._getframe(), views)
+
+        self.assertEqual(inner(), 'test')
+
+    def test_no_view(self):
+        """None is returned when no view is on the stack."""
+        self.assertIsNone(watchdog.find_view(sys._getframe(), {}))
+
+
+class StallDetectorTestCase(SimpleTestCase):
+    """Detecting the event loop being blocked."""
+
+    def setUp(self):
+        routes = [build_route('blocking', blocking_view), build_route('polite', polite_view)]
+        self.detector = watchdog.StallDetector(
+            asyncio.get_event_loop(), threshold=0.05, routes=routes)
+        self.detector.start()
+        self.addCleanup(self.detector.stop)
+
+    @async_test
+    def test_blocking_view(self):
+        """Stalls are attributed to the view which caused them."""
+        yield from asyncio.sleep(0.05)
+        with patch.object(watchdog.logger, 'warning') as warning:
+            yield from blocking_view(Mock())
+            yield from asyncio.sleep(0.05)
+        self.assertEqual(self.detector.stalls, {'blocking': 1})
+        self.assertEqual(self.detector.durations.count, 1)
+        self.assertGreater(self.detector.durations.sum, 0.1)
+        message = warning.call_args[0][0] % warning.call_args[0][1:]
+        self.assertIn('blocking', message)
+        self.assertIn('in block', message)
+
+    @async_test
+    def test_waiting_view(self):
+        """Views which wait without blocking aren't reported."""
+        yield from asyncio.sleep(0.05)
+        yield from polite_view(Mock())
+        self.assertEqual(self.detector.stalls, {})
+
+    def test_unsampled_stall(self):
+        """Stalls which end before they are sampled are counted without a view."""
+        self.detector._last_beat = time.monotonic() - 0.2
+        with patch.object(self.detector.loop, 'call_later'):
+            self.detector._beat()
+        self.assertEqual(self.detector.stalls, {'-': 1})
+
+    def test_stop(self):
+        """The monitor thread stops."""
+        self.detector.stop()
+        self.assertFalse(self.detector._monitor.is_alive())
@@ -0,0 +1,251 @@
+import asyncio
+import json
+import weakref
+
+from unittest.mock import call, Mock, patch
+
+from django.test import SimpleTestCase
+
+from aiohttp import web
+
+from .. import websockets
+from ..test import async_test
+
+
+def build_websocket():
+    """Websocket response which looks like it has been prepared."""
+
+    ws = websockets.TrackedWebSocketResponse()
+    ws._writer = Mock()
+    ws._resp_impl = Mock()
+    ws._resp_impl.transport.drain = asyncio.coroutine(Mock())
+    return ws
+
+
+def build_client(manager=None, **kwargs):
+    """Client wrapping a prepared websocket for a websocket route."""
+
+    request = Mock()
+    request.match_info.route.name = 'chat'
+    if manager is not None:
+        return manager.register(request, build_websocket())
+    return websockets.WebSocketClient(request, build_websocket(), **kwargs)
+
+
+@asyncio.coroutine
+def settle():
+    """Let the writer task run."""
+
+    for _ in range(3):
+        yield from asyncio.sleep(0)
+
+
+class DrainTestCase(SimpleTestCase):
+    """Closing websockets when the server drains."""
+
+    def test_close_frame(self):
+        """A close frame is sent with a reconnect hint within the range."""
+        ws = build_websocket()
+        delay = ws.close_for_restart(reconnect_delay=(5, 10))
+        self.assertTrue(5 <= delay <= 10)
+        self.assertTrue(ws.closed)
+        code, message = ws._writer.close.call_args[0]
+        self.assertEqual(code, websockets.CLOSE_SERVICE_RESTART)
+        self.assertEqual(json.loads(message), {'reconnect': delay})
+
+    def test_already_closed(self):
+        """Closed websockets are skipped."""
+        ws = build_websocket()
+        ws.close_for_restart()
+        self.assertIsNone(ws.close_for_restart())
+        self.assertEqual(ws._writer.close.call_count, 1)
+
+    def test_not_prepared(self):
+        """Websockets which haven't been prepared are skipped."""
+        ws = websockets.TrackedWebSocketResponse()
+        self.assertIsNone(ws.close_for_restart())
+
+    def test_drain_websockets(self):
+        """All of the open websockets of the application are closed."""
+        app = {'websockets': weakref.WeakSet()}
+        sockets = [build_websocket() for _ in range(3)]
+        app['websockets'].update(sockets)
+        sockets[0].close_for_restart()
+        self.assertEqual(websockets.drain_websockets(app), 2)
+        self.assertTrue(all(ws.closed for ws in sockets))
+
+
+class PrepareWebsocketTestCase(SimpleTestCase):
+    """Starting tracked websockets."""
+
+    @async_test
+    def test_tracked(self):
+        """The websocket is added to the application's websockets."""
+        app = web.Application(loop=asyncio.get_event_loop())
+        app['websockets'] = weakref.WeakSet()
+        request = Mock(app=app)
+        prepare = asyncio.coroutine(Mock())
+        with patch.object(websockets.TrackedWebSocketResponse, 'prepare', prepare):
+            ws = yield from websockets.prepare_websocket(request, autoping=False)
+        self.assertIn(ws, app['websockets'])
+        self.assertIsInstance(ws, web.WebSocketResponse)
+
+    @async_test
+    def test_counted(self):
+        """Websockets without a client are counted as connections while they are open."""
+        app = web.Application(loop=asyncio.get_event_loop())
+        app['websockets'] = weakref.WeakSet()
+        app['connections'] = websockets.ConnectionManager(loop=app.loop)
+        request = Mock(app=app)
+        request.match_info.route.name = 'echo'
+        prepare = asyncio.coroutine(Mock())
+        with patch.object(websockets.TrackedWebSocketResponse, 'prepare', prepare):
+            ws = yield from websockets.prepare_websocket(request)
+        stats = app['connections'].stats()
+        self.assertEqual(stats['connections'], 1)
+        self.assertEqual(stats['routes'], {'echo': 1})
+        ws._closed = True
+        stats = app['connections'].stats()
+        self.assertEqual(stats['connections'], 0)
+        self.assertEqual(stats['routes'], {})
+
+
+class WebSocketClientTestCase(SimpleTestCase):
+    """Sending to websockets through a bounded queue."""
+
+    @async_test
+    def test_send(self):
+        """Queued messages are written in order by the writer task."""
+        client = build_client()
+        client.send('first')
+        client.send(b'second')
+        yield from settle()
+        client.ws._writer.send.assert_has_calls([
+            call('first', binary=False), call(b'second', binary=True)])
+        self.assertEqual(client.sent, 2)
+        self.assertEqual(client.queued, 0)
+        client.close()
+
+    @async_test
+    def test_batches(self):
+        """The socket is drained once for each batch of messages."""
+        client = build_client(batch_size=2)
+        drain = Mock()
+        client.ws._resp_impl.transport.drain = asyncio.coroutine(drain)
+        for i in range(5):
+            client.send(str(i))
+        yield from settle()
+        self.assertEqual(client.ws._writer.send.call_count, 5)
+        self.assertEqual(drain.call_count, 3)
+        client.close()
+
+    def test_send_does_not_block(self):
+        """Messages are only queued until the writer task runs."""
+        client = build_client()
+        client.send('hello')
+        self.assertEqual(client.queued, 1)
+        self.assertFalse(client.ws._writer.send.called)
+        client.close()
+
+    def test_overflow_close(self):
+        """Clients whose queue is full are evicted by aborting the connection."""
+        client = build_client(max_queue=2)
+        client.send('first')
+        client.send('second')
+        with self.assertRaises(websockets.ClientClosed):
+            client.send('third')
+        self.assertTrue(client.evicted)
+        self.assertTrue(client.closed)
+        self.assertEqual(client.queued, 0)
+        self.assertTrue(client.transport.abort.called)
+
+    def test_overflow_drop(self):
+        """The oldest messages are dropped when the queue is full."""
+        client = build_client(max_queue=2, overflow='drop')
+        for message in ('first', 'second', 'third'):
+            client.send(message)
+        self.assertEqual(list(client._queue), ['second', 'third'])
+        self.assertEqual(client.dropped, 1)
+        self.assertFalse(client.closed)
+        client.close()
+
+    def test_unknown_overflow(self):
+        """Only the known overflow policies are allowed."""
+        with self.assertRaises(ValueError):
+            build_client(overflow='block')
+
+    def test_send_closed(self):
+        """Sending to a closed client raises so that subscribers can be dropped."""
+        client = build_client()
+        client.ws.close_for_restart()
+        with self.assertRaises(websockets.ClientClosed):
+            client.send('hello')
+        client.close()
+
+    @async_test
+    def test_writer_error(self):
+        """The client is closed when writing to the websocket fails."""
+        client = build_client()
+        client.ws._writer.send.side_effect = RuntimeError
+        client.send('hello')
+        yield from settle()
+        self.assertTrue(client.closed)
+
+
+class ConnectionManagerTestCase(SimpleTestCase):
+    """Tracking the websocket clients of an application."""
+
+    def test_register(self):
+        """Clients are tracked until they are closed."""
+        manager = websockets.ConnectionManager()
+        client = build_client(manager)
+        self.assertIn(client, manager.clients)
+        client.close()
+        self.assertNotIn(client, manager.clients)
+
+    def test_broadcast(self):
+        """Broadcast messages are queued for all of the open clients."""
+        manager = websockets.ConnectionManager(max_queue=1)
+        first, second = build_client(manager), build_client(manager)
+        second.send('backlog')
+        self.assertEqual(manager.broadcast('hello'), 1)
+        self.assertEqual(list(first._queue), ['hello'])
+        self.assertNotIn(second, manager.clients)
+        first.close()
+
+    def test_stats(self):
+        """Connections are counted by route along with the queue depths."""
+        manager = websockets.ConnectionManager(max_queue=1, overflow='drop')
+        first, second = build_client(manager), build_client(manager)
+        first.send('hello')
+        first.send('again')
+        self.assertEqual(manager.stats(), {
+            'connections': 2,
+            'routes': {'chat': 2},
+            'queued': 1,
+            'max_queued': 1,
+            'dropped': 1,
+            'evicted': 0,
+        })
+        first.close()
+        second.close()
+
+
+class ConnectWebsocketTestCase(SimpleTestCase):
+    """Starting websockets with send queues."""
+
+    @async_test
+    def test_registered(self):
+        """The client is registered with the application's connections."""
+        app = web.Application(loop=asyncio.get_event_loop())
+        app['websockets'] = weakref.WeakSet()
+        app['connections'] = websockets.ConnectionManager(loop=app.loop)
+        request = Mock(app=app)
+        prepare = asyncio.coroutine(Mock())
+        with patch.object(websockets.TrackedWebSocketResponse, 'prepare', prepare):
+            client = yield from websockets.connect_websocket(request)
+        self.assertIn(client, app['connections'].clients)
+        self.assertIn(client.ws, app['websockets'])
+        # Counted once as a client rather than also as a bare websocket
+        self.assertEqual(app['connections'].stats()['connections'], 1)
+        client.close()
@@ -0,0 +1,145 @@
+"""
+Detects the event loop being blocked and which view blocked it.
+"""
+import inspect
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from collections import Counter
+
+from .metrics import Histogram, get_route_label
+
+
+logger = logging.getLogger(__name__)
+
+# Default seconds the loop can be blocked before it is reported
+STALL_THRESHOLD = 0.1
+
+# Upper bounds in seconds of the stall duration histogram buckets
+STALL_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Number of frames from the sampled stack included in the log
+STACK_LIMIT = 20
+
+
+def get_view_code(routes):
+    """Map the code objects of the coroutine views to their route labels."""
+
+    views = {}
+    for route in routes:
+        handler = inspect.unwrap(route.handler)
+        code = getattr(handler, '__code__', None)
+        if code is not None:
+            views[code] = get_route_label(route)
+    return views
+
+
+def find_view(frame, views):
+    """Label of the innermost coroutine view on the stack or None."""
+
+    while frame is not None:
+        label = views.get(frame.f_code)
+        if label is not None:
+            return label
+        frame = frame.f_back
+    return None
+
+
+class StallDetector:
+    """Watchdog for callbacks which block the event loop.
+
+    A callback on the loop records a heartbeat every interval seconds. A
+    monitor thread checks the heartbeat at the same interval. When the loop is
+    late by more than the threshold, the monitor samples the stack of the loop
+    thread. It logs the stack with the coroutine view found on it. Once the
+    loop recovers, the stall is counted by that view along with how long it
+    lasted. Stalls which end before the monitor samples them are counted
+    without a view. The cost while the loop is healthy is one callback per
+    interval.
+    """
+
+    def __init__(self, loop, *, threshold=STALL_THRESHOLD, interval=None, routes=(),
+                 stack_limit=STACK_LIMIT):
+        self.loop = loop
+        self.threshold = threshold
+        self.interval = threshold / 2 if interval is None else interval
+        self.stack_limit = stack_limit
+        self.views = get_view_code(routes)
+        self.stalls = Counter()
+        self.durations = Histogram(STALL_BUCKETS)
+        self._thread_id = None
+        self._last_beat = None
+        self._sampled = None
+        self._sample = None
+        self._handle = None
+        self._stopped = threading.Event()
+        self._monitor = threading.Thread(target=self._watch, name='aiodjango-stall-detector')
+        self._monitor.daemon = True
+
+    def start(self):
+        self._handle = self.loop.call_soon(self._beat)
+        self._monitor.start()
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+        self._stopped.set()
+        if self._monitor.is_alive():
+            self._monitor.join(self.interval * 2)
+
+    def stats(self):
+        return {
+            'stalls': sum(self.stalls.values()),
+            'by_view': dict(self.stalls),
+            'total': self.durations.sum,
+        }
+
+    def _beat(self):
+        if self._stopped.is_set():
+            return
+        now = time.monotonic()
+        if self._last_beat is None:
+            self._thread_id = threading.get_ident()
+        else:
+            lag = now - self._last_beat - self.interval
+            if lag >= self.threshold:
+                sampled = self._sampled == self._last_beat
+                view = self._sample if sampled else None
+                self._sample = None
+                if not sampled:
+                    logger.warning('Event loop was blocked for %.3fs', lag)
+                self.record(view or '-', lag)
+        self._last_beat = now
+        self._handle = self.loop.call_later(self.interval, self._beat)
+
+    def record(self, view, duration):
+        self.stalls[view] += 1
+        self.durations.observe(duration)
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            beat = self._last_beat
+            if beat is None or beat == self._sampled or not self.loop.is_running():
+                continue
+            lag = time.monotonic() - beat - self.interval
+            if lag >= self.threshold:
+                self.sample(lag)
+                # Only sample each stall once
+                self._sampled = beat
+
+    def sample(self, lag):
+        """Log the stack of the loop thread and note the view on it."""
+
+        frame = sys._current_frames().get(self._thread_id)
+        if frame is None:
+            return
+        view = find_view(frame, self.views)
+        self._sample = view
+        stack = ''.join(traceback.format_stack(frame, limit=self.stack_limit))
+        del frame
+        logger.warning(
+            'Event loop blocked for over %.3fs in %s:\n%s', lag, view or 'an unknown callback',
+            stack)
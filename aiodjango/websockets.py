@@ -0,0 +1,278 @@
+"""
+Websockets which are tracked by the application so they can be closed cleanly.
+"""
+import asyncio
+import json
+import logging
+import random
+import weakref
+
+from collections import Counter, deque
+
+from aiohttp import web
+
+
+logger = logging.getLogger(__name__)
+
+
+# Close code for "Service Restart" which tells clients to reconnect
+CLOSE_SERVICE_RESTART = 1012
+
+# Range of seconds clients are told to wait before reconnecting
+RECONNECT_DELAY = (1.0, 30.0)
+
+# Default number of outbound messages queued for each client
+MAX_QUEUE = 100
+
+# Maximum number of messages written before waiting for the socket to drain
+BATCH_SIZE = 20
+
+# What happens to a client whose queue is full
+OVERFLOW_DROP = 'drop'
+OVERFLOW_CLOSE = 'close'
+OVERFLOW_CHOICES = (OVERFLOW_DROP, OVERFLOW_CLOSE)
+
+
+class ClientClosed(RuntimeError):
+    """Raised when sending to a client which has been closed or evicted."""
+
+
+class TrackedWebSocketResponse(web.WebSocketResponse):
+    """WebSocketResponse which can be closed while its handler is receiving."""
+
+    def close_for_restart(self, *, code=CLOSE_SERVICE_RESTART, reconnect_delay=RECONNECT_DELAY):
+        """Send a close frame with a randomized hint for when to reconnect.
+
+        Unlike close this doesn't wait for the client's reply. The handler's
+        own receive() gets the reply and returns so the handler can finish.
+        """
+
+        if self.closed or not self.prepared:
+            return None
+        delay = round(random.uniform(*reconnect_delay), 1)
+        self._closed = True
+        self._writer.close(code, json.dumps({'reconnect': delay}))
+        return delay
+
+
+@asyncio.coroutine
+def prepare_websocket(request, **kwargs):
+    """Start a websocket response which is closed cleanly when the server drains.
+
+    The keyword arguments are passed to the WebSocketResponse. The websocket
+    is counted by the application's connections while it is open.
+    """
+
+    ws = TrackedWebSocketResponse(**kwargs)
+    yield from ws.prepare(request)
+    request.app['websockets'].add(ws)
+    connections = request.app.get('connections')
+    if connections is not None:
+        connections.track(request, ws)
+    return ws
+
+
+def drain_websockets(app, *, reconnect_delay=RECONNECT_DELAY):
+    """Close the open websockets of the application and return how many were closed."""
+
+    closed = 0
+    for ws in list(app.get('websockets', ())):
+        if ws.close_for_restart(reconnect_delay=reconnect_delay) is not None:
+            closed += 1
+    return closed
+
+
+def get_route_name(request):
+    return getattr(getattr(request.match_info, 'route', None), 'name', None)
+
+
+def check_overflow(overflow):
+    if overflow not in OVERFLOW_CHOICES:
+        raise ValueError('Unknown overflow policy "{}". Choices are: {}.'.format(
+            overflow, ', '.join(OVERFLOW_CHOICES)))
+
+
+class WebSocketClient:
+    """Websocket with a bounded queue of outbound messages.
+
+    send never blocks. Messages are written by a task in batches of up to
+    batch_size, waiting for the socket to drain after each batch, so the
+    transport buffer stays small. When the queue is full either the oldest
+    message is dropped or the client is evicted by aborting the connection,
+    depending on overflow.
+    """
+
+    def __init__(self, request, ws, *, manager=None, max_queue=MAX_QUEUE,
+                 batch_size=BATCH_SIZE, overflow=OVERFLOW_CLOSE, loop=None):
+        check_overflow(overflow)
+        self.loop = loop or asyncio.get_event_loop()
+        self.ws = ws
+        self.transport = request.transport
+        self.route = get_route_name(request)
+        self.manager = manager
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.sent = 0
+        self.dropped = 0
+        self.evicted = False
+        self._queue = deque()
+        self._ready = asyncio.Event(loop=self.loop)
+        self._closed = False
+        self._writer = self.loop.create_task(self._write())
+
+    @property
+    def closed(self):
+        return self._closed or self.ws.closed
+
+    @property
+    def queued(self):
+        return len(self._queue)
+
+    def send(self, message):
+        """Queue a str or bytes message to be sent to the client."""
+
+        if self.closed:
+            raise ClientClosed('Websocket is closed.')
+        if len(self._queue) >= self.max_queue:
+            if self.overflow == OVERFLOW_CLOSE:
+                self.evict()
+                raise ClientClosed('Websocket was evicted with {} queued messages.'.format(
+                    self.max_queue))
+            self._queue.popleft()
+            self.dropped += 1
+            if self.manager is not None:
+                self.manager.dropped += 1
+        self._queue.append(message)
+        self._ready.set()
+
+    def evict(self):
+        """Abort the connection of a client which isn't keeping up.
+
+        No close frame is sent since it would wait behind the data the client
+        hasn't read. The handler's receive() returns once the connection is lost.
+        """
+
+        logger.info('Evicting slow websocket client of %s', self.route)
+        self.evicted = True
+        if self.manager is not None:
+            self.manager.evicted += 1
+        self.close()
+        self.transport.abort()
+
+    def close(self):
+        """Stop sending to the client and remove it from the manager."""
+
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.clear()
+        if self._writer is not None:
+            self._writer.cancel()
+        if self.manager is not None:
+            self.manager.unregister(self)
+
+    @asyncio.coroutine
+    def _write(self):
+        try:
+            while True:
+                yield from self._ready.wait()
+                self._ready.clear()
+                while self._queue:
+                    count = min(len(self._queue), self.batch_size)
+                    for _ in range(count):
+                        message = self._queue.popleft()
+                        if isinstance(message, str):
+                            self.ws.send_str(message)
+                        else:
+                            self.ws.send_bytes(message)
+                    self.sent += count
+                    yield from self.ws.drain()
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # Typically the websocket was closed by the client or a drain
+            logger.debug('Stopped writing to websocket client', exc_info=True)
+            # Cancelling this task while it finishes would leave a CancelledError unretrieved
+            self._writer = None
+            self.close()
+
+
+class ConnectionManager:
+    """Registry of the websocket clients of an application.
+
+    Gives each client a bounded queue and reports the number of connections
+    for each route along with the queue depths. Websockets which are prepared
+    without a client are counted as connections until they close but have no
+    queue.
+    """
+
+    def __init__(self, *, max_queue=MAX_QUEUE, batch_size=BATCH_SIZE,
+                 overflow=OVERFLOW_CLOSE, loop=None):
+        check_overflow(overflow)
+        self.loop = loop or asyncio.get_event_loop()
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.clients = set()
+        self.dropped = 0
+        self.evicted = 0
+        self._sockets = weakref.WeakKeyDictionary()
+
+    def track(self, request, ws):
+        """Count a websocket which is used without a client."""
+
+        self._sockets[ws] = get_route_name(request)
+
+    def register(self, request, ws):
+        self._sockets.pop(ws, None)
+        client = WebSocketClient(
+            request, ws, manager=self, max_queue=self.max_queue,
+            batch_size=self.batch_size, overflow=self.overflow, loop=self.loop)
+        self.clients.add(client)
+        return client
+
+    def unregister(self, client):
+        self.clients.discard(client)
+
+    def broadcast(self, message):
+        """Queue a message for every client and return how many accepted it."""
+
+        sent = 0
+        for client in list(self.clients):
+            try:
+                client.send(message)
+            except ClientClosed:
+                pass
+            else:
+                sent += 1
+        return sent
+
+    def stats(self):
+        depths = [client.queued for client in self.clients]
+        routes = Counter(client.route for client in self.clients)
+        for ws, route in list(self._sockets.items()):
+            if ws.closed:
+                del self._sockets[ws]
+            else:
+                routes[route] += 1
+        return {
+            'connections': sum(routes.values()),
+            'routes': dict(routes),
+            'queued': sum(depths),
+            'max_queued': max(depths, default=0),
+            'dropped': self.dropped,
+            'evicted': self.evicted,
+        }
+
+
+@asyncio.coroutine
+def connect_websocket(request, **kwargs):
+    """Start a tracked websocket and register it with the application's connections.
+
+    Returns the WebSocketClient. The handler should call its close method
+    when it is done receiving.
+    """
+
+    ws = yield from prepare_websocket(request, **kwargs)
+    return request.app['connections'].register(request, ws)
@@ -0,0 +1,79 @@
+"""
+Settings, server and load generator shared by the benchmark scripts.
+"""
+import asyncio
+import socket
+import time
+
+from contextlib import contextmanager
+
+import aiohttp
+
+from django.conf import settings
+
+
+def configure(**options):
+    """Configure Django to serve the test URLconf unless it already is."""
+
+    if not settings.configured:
+        settings.configure(
+            ROOT_URLCONF='aiodjango.tests.urls',
+            ALLOWED_HOSTS=['*'],
+            MIDDLEWARE_CLASSES=(
+                'django.middleware.common.CommonMiddleware',
+            ),
+            **options
+        )
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def serving(app):
+    """Serve the application on a local port and yield a client session and the base URL.
+
+    The session, connections, application and loop are all closed afterwards.
+    """
+
+    loop = app.loop
+    handler = app.make_handler()
+    port = free_port()
+    server = loop.run_until_complete(loop.create_server(handler, '127.0.0.1', port))
+    session = aiohttp.ClientSession(loop=loop)
+    try:
+        yield session, 'http://127.0.0.1:{}'.format(port)
+    finally:
+        session.close()
+        loop.run_until_complete(handler.finish_connections(1.0))
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.run_until_complete(app.finish())
+        loop.close()
+
+
+@asyncio.coroutine
+def load(loop, session, urls, requests, concurrency):
+    """Request the urls in turn and return the elapsed time, latencies and errors."""
+
+    remaining = iter(range(requests))
+    latencies = []
+    errors = 0
+
+    @asyncio.coroutine
+    def worker():
+        nonlocal errors
+        for i in remaining:
+            started = time.monotonic()
+            response = yield from session.get(urls[i % len(urls)])
+            yield from response.read()
+            latencies.append(time.monotonic() - started)
+            if response.status != 200:
+                errors += 1
+
+    started = time.monotonic()
+    yield from asyncio.gather(*[worker() for _ in range(concurrency)], loop=loop)
+    return time.monotonic() - started, latencies, errors
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"""
+Compare the throughput of Django views served through aiohttp-wsgi against
+the native Django handler.
+
+    $ python benchmarks/handlers.py --requests 2000 --concurrency 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import configure, load, serving  # noqa
+
+configure()
+
+from aiodjango import get_aio_application  # noqa
+
+
+def run(native_handler, args):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    app = get_aio_application(native_handler=native_handler)
+    with serving(app) as (session, base_url):
+        elapsed, _, _ = loop.run_until_complete(
+            load(loop, session, [base_url + '/ok/'], args.requests, args.concurrency))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=20)
+    args = parser.parse_args()
+
+    for name, native_handler in (('aiohttp-wsgi', False), ('native', True)):
+        elapsed = run(native_handler, args)
+        print('{:<14} {:8.1f} requests/s'.format(name, args.requests / elapsed))
+
+
+if __name__ == '__main__':
+    main()
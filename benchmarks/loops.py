@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Compare the throughput of coroutine and Django views under each event loop.
+
+    $ python benchmarks/loops.py --requests 5000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import configure, load, serving  # noqa
+
+configure()
+
+from aiodjango import get_aio_application  # noqa
+from aiodjango.loops import new_event_loop  # noqa
+
+
+PATHS = (
+    ('coroutine', '/async-ok/'),
+    ('django', '/ok/'),
+)
+
+
+def has_uvloop():
+    try:
+        import uvloop  # noqa
+    except ImportError:
+        return False
+    return True
+
+
+def run(loop_name, args):
+    loop = new_event_loop(loop_name)
+    asyncio.set_event_loop(loop)
+    app = get_aio_application()
+    results = []
+    with serving(app) as (session, base_url):
+        for name, path in PATHS:
+            elapsed, _, _ = loop.run_until_complete(
+                load(loop, session, [base_url + path], args.requests, args.concurrency))
+            results.append((name, args.requests / elapsed))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    loop_names = ['asyncio']
+    if has_uvloop():
+        loop_names.append('uvloop')
+    else:
+        print('uvloop is not installed, only running asyncio.')
+    for loop_name in loop_names:
+        for name, rate in run(loop_name, args):
+            print('{:<8} {:<10} {:8.1f} requests/s'.format(loop_name, name, rate))
+
+
+if __name__ == '__main__':
+    main()
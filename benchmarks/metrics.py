@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Measure the overhead of the request metrics on each request.
+
+    $ python benchmarks/metrics.py --requests 5000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import configure, load, serving  # noqa
+
+configure()
+
+from aiodjango import get_aio_application  # noqa
+from aiodjango.metrics import Metrics  # noqa
+
+
+class FakeRoute:
+    name = 'wsgi-app'
+
+
+class FakeMatchInfo:
+    route = FakeRoute()
+
+
+class FakeRequest(dict):
+    match_info = FakeMatchInfo()
+
+
+class FakeResponse:
+    status = 200
+
+
+def observe_cost(number):
+    """Seconds spent recording a single request."""
+
+    metrics = Metrics()
+    request = FakeRequest()
+    elapsed = timeit.timeit(
+        lambda: metrics.observe(request, 'wsgi', 200, 0.01), number=number)
+    return elapsed / number
+
+
+def finish(coro):
+    """Result of a coroutine which doesn't wait on anything."""
+
+    try:
+        coro.send(None)
+    except StopIteration as e:
+        return e.value
+    raise RuntimeError('The coroutine waited.')
+
+
+def middleware_cost(number):
+    """Seconds the middleware adds to a handler which returns straight away."""
+
+    response = FakeResponse()
+
+    @asyncio.coroutine
+    def handler(request):
+        return response
+
+    request = FakeRequest()
+    instrumented = finish(Metrics().middleware(None, handler))
+    bare = timeit.timeit(lambda: finish(handler(request)), number=number)
+    elapsed = timeit.timeit(lambda: finish(instrumented(request)), number=number)
+    return (elapsed - bare) / number
+
+
+def run(metrics, path, args):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    app = get_aio_application(metrics=metrics)
+    with serving(app) as (session, base_url):
+        elapsed, _, _ = loop.run_until_complete(
+            load(loop, session, [base_url + path], args.requests, args.concurrency))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    print('{:<22} {:8.2f} us/request'.format('observe', observe_cost(100000) * 1000000))
+    print('{:<22} {:8.2f} us/request'.format('middleware', middleware_cost(100000) * 1000000))
+    for name, path in (('coroutine', '/async-ok/'), ('django', '/ok/')):
+        for metrics in (False, True):
+            elapsed = run(metrics, path, args)
+            label = '{} {}'.format(name, 'metrics' if metrics else 'no metrics')
+            print('{:<22} {:8.1f} requests/s'.format(label, args.requests / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""
+Compare building URLs for coroutine routes with the precompiled templates
+against calling Django's reverse.
+
+    $ python benchmarks/reverse.py
+"""
+import argparse
+import asyncio
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from django.conf import settings  # noqa
+
+if not settings.configured:
+    settings.configure(ROOT_URLCONF=__name__)
+
+import django  # noqa
+from django.conf.urls import url  # noqa
+from django.core.urlresolvers import reverse  # noqa
+
+from aiodjango.routing import get_aio_routes  # noqa
+
+
+@asyncio.coroutine
+def handler(request):
+    pass  # pragma: no cover
+
+
+urlpatterns = [
+    url(r'^api/resource-{}/(?P<pk>[0-9]+)/(?P<slug>[-\w]+)/$'.format(i),
+        handler, name='route-{}'.format(i))
+    for i in range(100)
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=100000)
+    args = parser.parse_args()
+
+    django.setup()
+    route = get_aio_routes()[-1]
+    kwargs = {'pk': '123', 'slug': 'hello-world'}
+    cases = (
+        ('reverse', lambda: reverse(route.name, kwargs=kwargs)),
+        ('route.url', lambda: route.url(**kwargs)),
+    )
+    for name, func in cases:
+        elapsed = timeit.timeit(func, number=args.number)
+        print('{:<10} {:8.2f} us/url'.format(name, elapsed / args.number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
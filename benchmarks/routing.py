@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Compare resolving requests with the combined route matcher against the
+default aiohttp route by route scan.
+
+    $ python benchmarks/routing.py --routes 300
+"""
+import argparse
+import asyncio
+import os
+import sys
+import timeit
+
+from unittest.mock import Mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from django.conf import settings  # noqa
+
+if not settings.configured:
+    settings.configure()
+
+from aiohttp.web import UrlDispatcher  # noqa
+
+from aiodjango.routing import DjangoRegexRoute, DjangoUrlDispatcher  # noqa
+
+
+@asyncio.coroutine
+def handler(request):
+    pass  # pragma: no cover
+
+
+def build_router(router, count):
+    for i in range(count):
+        regex = r'^api/resource-{}/(?P<pk>[0-9]+)/$'.format(i)
+        router.register_route(DjangoRegexRoute('*', handler, 'route_{}'.format(i), regex))
+    router.add_route('*', '/{path_info:.*}', handler, name='wsgi-app')
+    return router
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--routes', type=int, default=300)
+    parser.add_argument('--number', type=int, default=10000)
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    paths = (
+        ('first coroutine', '/api/resource-0/1/'),
+        ('last coroutine', '/api/resource-{}/1/'.format(args.routes - 1)),
+        ('wsgi fallback', '/accounts/login/'),
+    )
+    routers = (
+        ('route by route', build_router(UrlDispatcher(), args.routes)),
+        ('combined', build_router(DjangoUrlDispatcher(), args.routes)),
+    )
+    print('{} coroutine routes, {} lookups each'.format(args.routes, args.number))
+    for label, path in paths:
+        request = Mock(method='GET', raw_path=path)
+        for name, router in routers:
+            elapsed = timeit.timeit(
+                lambda: loop.run_until_complete(router.resolve(request)),
+                number=args.number)
+            print('{:<16} {:<16} {:8.2f} us/lookup'.format(
+                label, name, elapsed / args.number * 1e6))
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+"""
+Load test the application with Django, coroutine, mixed, static and websocket
+broadcast traffic and compare the results of two runs.
+
+    $ python benchmarks/suite.py run --output before.json
+    $ python benchmarks/suite.py run --output after.json
+    $ python benchmarks/suite.py compare before.json after.json --threshold 0.1
+"""
+import argparse
+import asyncio
+import atexit
+import gc
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from django.conf import settings  # noqa
+
+from benchmarks.common import configure, load, serving  # noqa
+
+if not settings.configured:
+    STATIC_ROOT = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, STATIC_ROOT, True)
+    configure(STATIC_URL='/static/', STATIC_ROOT=STATIC_ROOT)
+
+import aiohttp  # noqa
+
+from aiodjango import __version__, get_aio_application  # noqa
+from aiodjango.loops import LOOP_CHOICES, new_event_loop  # noqa
+from aiodjango.routing import DjangoRegexRoute  # noqa
+from aiodjango.websockets import MAX_QUEUE, connect_websocket  # noqa
+
+
+# Version of the results format
+FORMAT = 1
+
+SCENARIOS = ('wsgi', 'coroutine', 'mixed', 'static', 'broadcast')
+
+# Paths requested by each HTTP scenario in turn
+PATHS = {
+    'wsgi': ('/ok/', ),
+    'coroutine': ('/async-ok/', ),
+    'mixed': ('/ok/', '/async-ok/'),
+    'static': ('/static/bench.css', ),
+}
+
+TOPIC = 'benchmark'
+
+# Metrics which are worse when they go down rather than up
+HIGHER_IS_BETTER = {'rps'}
+
+
+def percentile(values, percent):
+    """Nearest rank percentile of the values."""
+
+    ordered = sorted(values)
+    rank = max(int(math.ceil(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[rank]
+
+
+def summarize(runs):
+    """Median throughput of the runs and latency percentiles in milliseconds over all of them."""
+
+    rps = [len(latencies) / elapsed for elapsed, latencies, _ in runs]
+    latencies = [latency for _, run_latencies, _ in runs for latency in run_latencies]
+    return {
+        'rps': round(statistics.median(rps), 1),
+        'rps_runs': [round(value, 1) for value in rps],
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'count': len(latencies),
+        'errors': sum(errors for _, _, errors in runs),
+    }
+
+
+@asyncio.coroutine
+def broadcast_view(request):
+    """Websocket which receives every message published to the benchmark topic."""
+
+    client = yield from connect_websocket(request)
+    hub = request.app['broadcast']
+    yield from hub.subscribe(TOPIC, client.send)
+    try:
+        yield from client.ws.receive()
+    finally:
+        yield from hub.unsubscribe(TOPIC, client.send)
+        client.close()
+    return client.ws
+
+
+@asyncio.coroutine
+def broadcast(loop, session, app, url, messages, subscribers):
+    """Publish messages to websocket subscribers and return the delivery latencies.
+
+    Messages are published in windows which fit the client queues, waiting
+    for every subscriber to receive each window, so no client is evicted.
+    """
+
+    sockets = []
+    for _ in range(subscribers):
+        sockets.append((yield from session.ws_connect(url)))
+    hub = app['broadcast']
+    while hub.stats()['subscribers'] < subscribers:
+        yield from asyncio.sleep(0.01, loop=loop)
+    latencies = []
+    caught_up = {'target': 0, 'future': None}
+
+    @asyncio.coroutine
+    def receive(ws):
+        while True:
+            msg = yield from ws.receive()
+            if msg.tp != aiohttp.MsgType.text:
+                break
+            latencies.append(time.monotonic() - float(msg.data))
+            future = caught_up['future']
+            if len(latencies) >= caught_up['target'] and not future.done():
+                future.set_result(None)
+
+    receivers = [loop.create_task(receive(ws)) for ws in sockets]
+    window = max(MAX_QUEUE // 2, 1)
+    started = time.monotonic()
+    for first in range(0, messages, window):
+        count = min(window, messages - first)
+        caught_up['target'] = (first + count) * subscribers
+        caught_up['future'] = asyncio.Future(loop=loop)
+        for _ in range(count):
+            yield from hub.publish(TOPIC, repr(time.monotonic()))
+        yield from asyncio.wait_for(caught_up['future'], 30, loop=loop)
+    elapsed = time.monotonic() - started
+    for ws in sockets:
+        yield from ws.close()
+    yield from asyncio.gather(*receivers, loop=loop)
+    # Don't let the next run start before these clients are gone
+    while hub.stats()['subscribers']:
+        yield from asyncio.sleep(0.01, loop=loop)
+    return elapsed, latencies, 0
+
+
+def run_scenario(name, args):
+    """Serve a new application on a local socket and load it with the scenario's traffic."""
+
+    loop = new_event_loop(args.loop)
+    asyncio.set_event_loop(loop)
+    app = get_aio_application(include_static=(name == 'static'), metrics=args.metrics)
+    app.router.register_route(
+        DjangoRegexRoute('GET', broadcast_view, 'bench-broadcast', r'^/bench/broadcast/$'))
+    runs = []
+    with serving(app) as (session, base_url):
+        if name == 'broadcast':
+            url = base_url + '/bench/broadcast/'
+            work = partial(broadcast, loop, session, app, url, subscribers=args.subscribers)
+            warmup, requests = args.warmup // args.subscribers, args.messages
+        else:
+            urls = [base_url + path for path in PATHS[name]]
+            work = partial(load, loop, session, urls, concurrency=args.concurrency)
+            warmup, requests = args.warmup, args.requests
+        if warmup:
+            loop.run_until_complete(work(warmup))
+        for _ in range(args.repeat):
+            gc.collect()
+            runs.append(loop.run_until_complete(work(requests)))
+    return summarize(runs)
+
+
+def run(args):
+    with open(os.path.join(settings.STATIC_ROOT, 'bench.css'), 'w') as f:
+        f.write('body { color: black; }\n' * 100)
+    results = {
+        'format': FORMAT,
+        'aiodjango': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'loop': args.loop,
+        'options': {
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'messages': args.messages,
+            'subscribers': args.subscribers,
+            'warmup': args.warmup,
+            'repeat': args.repeat,
+            'metrics': args.metrics,
+        },
+        'scenarios': {},
+    }
+    for name in args.scenarios:
+        results['scenarios'][name] = summary = run_scenario(name, args)
+        print('{:<10} {:10.1f} req/s  p50 {:8.3f}ms  p99 {:8.3f}ms  errors {}'.format(
+            name, summary['rps'], summary['p50_ms'], summary['p99_ms'], summary['errors']),
+            file=sys.stderr)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+def compare_results(baseline, current, threshold):
+    """Relative change of each metric and whether it is a regression beyond the threshold."""
+
+    changes = []
+    for name in SCENARIOS:
+        before = baseline['scenarios'].get(name)
+        after = current['scenarios'].get(name)
+        if before is None or after is None:
+            continue
+        for metric in ('rps', 'p50_ms', 'p99_ms'):
+            old, new = before[metric], after[metric]
+            change = (new - old) / old if old else 0.0
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            changes.append((name, metric, old, new, change, worse > threshold))
+    return changes
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    for key in ('python', 'loop', 'options'):
+        if baseline.get(key) != current.get(key):
+            print('Warning: the runs differ in {}'.format(key), file=sys.stderr)
+    changes = compare_results(baseline, current, args.threshold)
+    regressions = 0
+    for name, metric, old, new, change, regressed in changes:
+        regressions += regressed
+        print('{:<10} {:<7} {:12.3f} {:12.3f} {:+8.1%}{}'.format(
+            name, metric, old, new, change, '  REGRESSION' if regressed else ''))
+    if regressions:
+        print('{} regressions beyond {:.0%}'.format(regressions, args.threshold))
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run_parser = commands.add_parser('run', help='Run the scenarios and write the results as JSON.')
+    run_parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    run_parser.add_argument('--requests', type=int, default=5000)
+    run_parser.add_argument('--concurrency', type=int, default=50)
+    run_parser.add_argument('--messages', type=int, default=1000)
+    run_parser.add_argument('--subscribers', type=int, default=50)
+    run_parser.add_argument('--warmup', type=int, default=500)
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--loop', choices=LOOP_CHOICES, default='asyncio')
+    run_parser.add_argument('--no-metrics', dest='metrics', action='store_false')
+    run_parser.add_argument('--output', help='Write the results to this file.')
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser(
+        'compare', help='Compare two results and exit with 1 if any regressed.')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help='Fraction a metric can get worse by before it is a regression.')
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
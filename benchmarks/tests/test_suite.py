@@ -0,0 +1,120 @@
+import json
+import os
+import tempfile
+
+from argparse import Namespace
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from .. import suite
+
+
+def build_results(**scenarios):
+    """Results of a suite run with the given metrics for each scenario."""
+
+    return {
+        'python': '3.5.1',
+        'loop': 'asyncio',
+        'options': {},
+        'scenarios': {
+            name: dict(zip(('rps', 'p50_ms', 'p99_ms'), metrics))
+            for name, metrics in scenarios.items()},
+    }
+
+
+class SummarizeTestCase(SimpleTestCase):
+    """Reducing the runs of a scenario."""
+
+    def test_percentile(self):
+        """Nearest rank percentiles."""
+        values = list(range(1, 101))
+        self.assertEqual(suite.percentile(values, 50), 50)
+        self.assertEqual(suite.percentile(values, 99), 99)
+        self.assertEqual(suite.percentile([5], 99), 5)
+
+    def test_summarize(self):
+        """Throughput is the median of the runs and latencies cover all of them."""
+        runs = [
+            (1.0, [0.001] * 100, 0),
+            (2.0, [0.002] * 100, 1),
+            (0.5, [0.003] * 100, 0),
+        ]
+        summary = suite.summarize(runs)
+        self.assertEqual(summary['rps'], 100.0)
+        self.assertEqual(summary['rps_runs'], [100.0, 50.0, 200.0])
+        self.assertEqual(summary['p50_ms'], 2.0)
+        self.assertEqual(summary['p99_ms'], 3.0)
+        self.assertEqual(summary['count'], 300)
+        self.assertEqual(summary['errors'], 1)
+
+
+class CompareResultsTestCase(SimpleTestCase):
+    """Finding regressions between two runs."""
+
+    def regressions(self, changes):
+        return [(name, metric) for name, metric, _, _, _, regressed in changes if regressed]
+
+    def test_unchanged(self):
+        """Identical runs have no regressions."""
+        results = build_results(wsgi=(1000, 5, 20))
+        changes = suite.compare_results(results, results, 0.1)
+        self.assertEqual(len(changes), 3)
+        self.assertEqual(self.regressions(changes), [])
+        self.assertEqual([change[4] for change in changes], [0.0, 0.0, 0.0])
+
+    def test_throughput(self):
+        """Throughput regresses when it drops by more than the threshold."""
+        baseline = build_results(wsgi=(1000, 5, 20), coroutine=(1000, 5, 20))
+        current = build_results(wsgi=(850, 5, 20), coroutine=(950, 5, 20))
+        changes = suite.compare_results(baseline, current, 0.1)
+        self.assertEqual(self.regressions(changes), [('wsgi', 'rps')])
+
+    def test_latency(self):
+        """Latency regresses when it rises by more than the threshold."""
+        baseline = build_results(wsgi=(1000, 5, 20))
+        current = build_results(wsgi=(1000, 4, 25))
+        changes = suite.compare_results(baseline, current, 0.1)
+        self.assertEqual(self.regressions(changes), [('wsgi', 'p99_ms')])
+
+    def test_improvements(self):
+        """Large improvements aren't regressions."""
+        baseline = build_results(wsgi=(1000, 5, 20))
+        current = build_results(wsgi=(2000, 2, 10))
+        changes = suite.compare_results(baseline, current, 0.1)
+        self.assertEqual(self.regressions(changes), [])
+
+    def test_missing_scenario(self):
+        """Scenarios which are only in one of the runs are skipped."""
+        baseline = build_results(wsgi=(1000, 5, 20), static=(5000, 1, 2))
+        current = build_results(wsgi=(1000, 5, 20), broadcast=(100, 1, 2))
+        changes = suite.compare_results(baseline, current, 0.1)
+        self.assertEqual({change[0] for change in changes}, {'wsgi'})
+
+    def test_zero_baseline(self):
+        """Metrics which were zero don't divide by zero."""
+        baseline = build_results(wsgi=(1000, 0, 0))
+        current = build_results(wsgi=(1000, 1, 1))
+        changes = suite.compare_results(baseline, current, 0.1)
+        self.assertEqual(self.regressions(changes), [])
+
+    def test_exit_status(self):
+        """The compare command exits with 1 when there are regressions."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, directory)
+        paths = []
+        for name, results in (
+                ('baseline', build_results(wsgi=(1000, 5, 20))),
+                ('current', build_results(wsgi=(500, 5, 20)))):
+            path = os.path.join(directory, name + '.json')
+            with open(path, 'w') as f:
+                json.dump(results, f)
+            self.addCleanup(os.remove, path)
+            paths.append(path)
+        args = Namespace(baseline=paths[0], current=paths[0], threshold=0.1)
+        with patch('builtins.print'):
+            suite.compare(args)
+            args.current = paths[1]
+            with self.assertRaises(SystemExit) as context:
+                suite.compare(args)
+        self.assertEqual(context.exception.code, 1)
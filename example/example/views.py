@@ -2,8 +2,9 @@ import asyncio
 
 from django.shortcuts import render
 
-import aioamqp
-from aiohttp.web import MsgType, WebSocketResponse
+from aiohttp.web import MsgType
+
+from aiodjango.websockets import connect_websocket
 
 
 def index(request):
@@ -12,42 +13,22 @@ def index(request):
 
 @asyncio.coroutine
 def socket(request):
-    resp = WebSocketResponse()
-    yield from resp.prepare(request)
-
-    if 'amqp' not in request.app:
-        transport, protocol = yield from aioamqp.connect()
-        request.app['amqp'] = protocol
-
-        @asyncio.coroutine
-        def cleanup(app):
-            yield from protocol.close(timeout=1.0)
-            transport.close()
-        request.app.register_on_finish(cleanup)
-
-    amqp = request.app['amqp']
-    channel = yield from amqp.channel()
-    yield from channel.exchange_declare(
-        exchange_name='demo-room', type_name='fanout')
-    result = yield from channel.queue_declare('', exclusive=True)
-    yield from channel.queue_bind(result['queue'], 'demo-room', routing_key='')
-
-    # Consume messages from the queue
-    @asyncio.coroutine
-    def message(channel, body, envelope, properties):
-        if not resp.closed:
-            resp.send_str(body.decode('utf-8'))
-        yield from channel.basic_client_ack(envelope.delivery_tag)
-
-    yield from channel.basic_consume(message, queue_name=result['queue'])
-
-    # Broadcast messages to the queue
-    while True:
-        msg = yield from resp.receive()
-        if msg.tp == MsgType.text:
-            yield from channel.publish(msg.data, exchange_name='demo-room', routing_key='')
-        else:
-            break
-    # Client requested close
-    yield from channel.close()
-    return resp
+    client = yield from connect_websocket(request)
+    hub = request.app['broadcast']
+
+    # Messages for the room are fanned out from a single upstream subscription
+    # and queued for the client so a slow client can't hold up the others
+    yield from hub.subscribe('demo-room', client.send)
+    try:
+        # Broadcast messages to the room
+        while True:
+            msg = yield from client.ws.receive()
+            if msg.tp == MsgType.text:
+                yield from hub.publish('demo-room', msg.data)
+            else:
+                break
+    finally:
+        # Client requested close
+        yield from hub.unsubscribe('demo-room', client.send)
+        client.close()
+    return client.ws
@@ -56,7 +56,7 @@ from django.test.utils import get_runner
 
 def runtests():
     django.setup()
-    apps = sys.argv[1:] or ['aiodjango', ]
+    apps = sys.argv[1:] or ['aiodjango', 'benchmarks', ]
     TestRunner = get_runner(settings)
     test_runner = TestRunner(verbosity=1, interactive=True, failfast=False)
     failures = test_runner.run_tests(apps)
@@ -37,7 +37,7 @@ setup(
     version=_meta['__version__'],
     author='Mark Lavin',
     author_email='markdlavin@gmail.com',
-    packages=find_packages(exclude=['example']),
+    packages=find_packages(exclude=['example', 'benchmarks']),
     include_package_data=True,
     url='https://github.com/mlavin/aiodjango',
     license='BSD',